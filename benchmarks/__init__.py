@@ -0,0 +1,5 @@
+"""
+性能基准脚本
+不依赖Django（被测模块按文件路径直接加载，不经过workflows包），直接在项目根目录下运行，例如：
+    python -m benchmarks.bench_wiring
+"""
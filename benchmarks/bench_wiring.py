@@ -0,0 +1,99 @@
+"""
+节点输入连线的基准测试
+
+对比两种做法在合成的大图上的耗时：
+- 逐节点扫描：对每个节点遍历全部的边，找出指向它的边（原来的O(N·E)做法）
+- 连线索引：先按目标节点给所有边建一次索引（O(E)），再按节点ID取连线表
+
+用法（在项目根目录下）：
+    python -m benchmarks.bench_wiring
+    python -m benchmarks.bench_wiring --nodes 1000 2000 5000 --fan-in 3
+"""
+
+import argparse
+import importlib.util
+import random
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+
+def _load_wiring():
+    """
+    直接按文件路径加载workflows/engine/wiring.py
+
+    wiring.py只用到标准库，但通过workflows.engine导入会执行整个引擎包的__init__，
+    连带导入运行器、组件基类和Django相关的模块，基准测试不需要这些
+    """
+    path = Path(__file__).resolve().parent.parent / 'workflows' / 'engine' / 'wiring.py'
+    spec = importlib.util.spec_from_file_location('bench_wiring_target', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_wiring = _load_wiring()
+build_wiring_index, edge_to_wire = _wiring.build_wiring_index, _wiring.edge_to_wire
+
+
+def make_graph(node_count: int, fan_in: int, seed: int = 0):
+    """生成一个随机的分层DAG：每个节点从编号比它小的节点里随机挑至多fan_in个作为上游"""
+    rng = random.Random(seed)
+    node_ids = [f"node_{i}" for i in range(node_count)]
+    edges = []
+    for i in range(1, node_count):
+        for j in rng.sample(range(i), min(fan_in, i)):
+            edges.append(SimpleNamespace(
+                source_node=node_ids[j],
+                target_node=node_ids[i],
+                source_handle='output',
+                target_handle=f'input_{j}'
+            ))
+    return node_ids, edges
+
+
+def wire_by_scan(node_ids, edges):
+    """原来的做法：每个节点扫描一遍全部的边"""
+    return {
+        node_id: [edge_to_wire(e) for e in edges if e.target_node == node_id]
+        for node_id in node_ids
+    }
+
+
+def wire_by_index(node_ids, edges):
+    """新的做法：建一次索引再按节点取"""
+    index = build_wiring_index(edges)
+    return {node_id: index.get(node_id, []) for node_id in node_ids}
+
+
+def timeit(func, *args, repeat: int = 3) -> float:
+    """取多次运行里最快的一次，单位毫秒"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='节点输入连线基准测试')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[1000, 2000, 5000], help='节点数量')
+    parser.add_argument('--fan-in', type=int, default=3, help='每个节点的上游数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    args = parser.parse_args()
+
+    print(f"{'节点数':>8} {'边数':>8} {'逐节点扫描(ms)':>16} {'连线索引(ms)':>14} {'加速比':>8}")
+    for node_count in args.nodes:
+        node_ids, edges = make_graph(node_count, args.fan_in)
+
+        # 两种做法的结果必须完全一致
+        assert wire_by_scan(node_ids, edges) == wire_by_index(node_ids, edges)
+
+        scan_ms = timeit(wire_by_scan, node_ids, edges, repeat=args.repeat)
+        index_ms = timeit(wire_by_index, node_ids, edges, repeat=args.repeat)
+        print(f"{node_count:>8} {len(edges):>8} {scan_ms:>16.2f} {index_ms:>14.2f} {scan_ms / index_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
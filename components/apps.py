@@ -3,6 +3,36 @@
 
 from django.apps import AppConfig
 
+
+def configure_components(settings) -> None:
+    """
+    按配置设置组件系统里的各个进程内单例
+
+    除了ready()，进程池的子进程也会调用它（见workflows/engine/offload.py）：spawn出来的子进程不执行ready()，
+    不调用的话子进程里的嵌入缓存、客户端池等都是默认配置
+    """
+    from .base.llm_clients import llm_client_pool
+    from .base.admission import backend_admission
+    from .base.embeddings import embedding_registry, embedding_cache
+    from .base.rerankers import rerank_score_cache
+
+    # 按配置设置LLM客户端池的大小
+    llm_client_pool.configure(
+        max_clients=getattr(settings, 'LLM_CLIENT_MAX_CLIENTS', None),
+        max_connections=getattr(settings, 'LLM_CLIENT_MAX_CONNECTIONS', None),
+    )
+    # 按配置设置各类本地模型后端的并发上限和等待队列长度
+    backend_admission.configure(limits=getattr(settings, 'LLM_BACKEND_LIMITS', None))
+    # 按配置设置嵌入模型的内存预算和嵌入缓存
+    embedding_registry.configure(max_memory_mb=getattr(settings, 'EMBEDDING_MAX_MEMORY_MB', None))
+    embedding_cache.configure(
+        path=getattr(settings, 'EMBEDDING_CACHE_PATH', None),
+        batch_size=getattr(settings, 'EMBEDDING_CACHE_BATCH_SIZE', None),
+    )
+    # 按配置设置重排序分数缓存的位置
+    rerank_score_cache.configure(path=getattr(settings, 'RERANK_SCORE_CACHE_PATH', None))
+
+
 class ComponentsConfig(AppConfig):
     """
     主要作用如下：
@@ -20,7 +50,20 @@ class ComponentsConfig(AppConfig):
 
     def ready(self):
         """当应用准备好启动时，自动发现和注册组件"""
+        from django.conf import settings
         from .base.registry import component_registry
+        from .base.embeddings import embedding_registry
+
+        configure_components(settings)
+        # 在后台预先加载常用的嵌入模型
+        embedding_registry.preload(getattr(settings, 'EMBEDDING_PRELOAD_MODELS', None) or [])
+
+        # 按配置设置FAISS只读索引缓存的大小，没有安装faiss时跳过
+        try:
+            from .implementations.vector_stores.faiss_index import faiss_index_cache
+            faiss_index_cache.configure(max_indexes=getattr(settings, 'FAISS_INDEX_CACHE_MAX_INDEXES', None))
+        except ImportError:
+            pass
 
         # 自动发现和注册组件
         component_registry.auto_discover()
@@ -56,6 +99,6 @@ class ComponentsConfig(AppConfig):
                     # component_class.__module__ = "components.implementations.text"
                     # component_class.__name__ = "MyComponent"
                     # 所以拼接后可唯一定位到该类。
-                    'class_path': f"{component_class.__module__}·{component_class.__name__}"  # 组件类的完整路径，便于后续动态加载
+                    'class_path': f"{component_class.__module__}.{component_class.__name__}"  # 组件类的完整路径，便于后续动态加载
                 }                
             )
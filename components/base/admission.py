@@ -0,0 +1,216 @@
+"""
+本地模型后端的准入控制
+
+50个对话同时执行工作流时，每个请求都会直接打到DeepSeekComponent背后唯一的Ollama服务、或者唯一的LlamaCpp模型上，
+后端被挤爆以后吞吐量反而会断崖式下降。这里给每个后端（一个Ollama地址、一个模型文件）加一个准入控制器：
+    - 同时在执行的请求数不超过max_in_flight，让后端保持在吞吐量最好的并发度上
+    - 其余请求排队等待，队列长度不超过max_queue；队列满了立即抛出BackendOverloadedError（接口返回503），而不是无限堆积
+    - 各个工作流的请求分开排队，轮流放行，一个工作流突然提交一大批请求也不会把其他工作流饿死
+    - 完全相同的请求（同一个后端、同样的模型参数和提示词）如果已经有一个在执行，后来的直接等它的结果，只向后端发一次
+
+当前是哪个工作流由执行引擎通过workflow_scope()设置，组件不需要关心。
+
+LlamaCppComponent在线程池里、用线程自己的事件循环执行（见workflows/engine/offload.py），
+所以这里用线程安全的concurrent.futures.Future做排队和结果共享，任意线程、任意事件循环里的调用方都可以await它们。
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_current_workflow: ContextVar[Optional[Any]] = ContextVar('current_workflow', default=None)
+
+
+@contextmanager
+def workflow_scope(workflow_id: Any):
+    """在with块内标记当前正在执行的工作流，由执行引擎在执行工作流时使用"""
+    token = _current_workflow.set(workflow_id)
+    try:
+        yield
+    finally:
+        _current_workflow.reset(token)
+
+
+class BackendOverloadedError(Exception):
+    """后端的等待队列已满，请求被直接拒绝"""
+
+
+def request_key(*parts: Any) -> str:
+    """把模型参数、提示词等拼成合并请求用的键"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+class AdmissionController:
+    """单个后端的准入控制器"""
+
+    def __init__(self, name: str, max_in_flight: int = 1, max_queue: int = 32):
+        """
+        Args:
+            name: 后端名称，用于错误信息
+            max_in_flight: 同时执行的请求数上限
+            max_queue: 等待队列的长度上限，0表示不排队，超出并发上限就直接拒绝
+        """
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queues: "OrderedDict[Any, deque]" = OrderedDict()  # 工作流ID -> 等待者队列，按轮转顺序排列
+        self._coalesced: Dict[str, Future] = {}  # 请求键 -> 正在执行的那个请求的结果
+
+    async def run(self, call: Callable[[], Awaitable[Any]], request_key: Optional[str] = None) -> Any:
+        """
+        在准入控制下执行一次后端调用
+
+        Args:
+            call: 返回协程的函数，真正向后端发请求
+            request_key: 请求的唯一标识，相同标识的并发请求会合并成一次调用；
+                         流式生成等不能共享结果的调用传None
+
+        Raises:
+            BackendOverloadedError: 等待队列已满
+        """
+        if request_key is None:
+            return await self._admitted(call)
+
+        with self._lock:
+            shared = self._coalesced.get(request_key)
+            leader = shared is None
+            if leader:
+                shared = self._coalesced[request_key] = Future()
+
+        if not leader:
+            # shield：这个等待者被取消时不能连带取消共享的结果
+            return await asyncio.shield(asyncio.wrap_future(shared))
+
+        try:
+            result = await self._admitted(call)
+        except BaseException as e:
+            shared.set_exception(e if isinstance(e, Exception) else RuntimeError(f'{self.name}上相同的请求已被取消'))
+            # 没有人等待时避免“Future exception was never retrieved”的警告
+            shared.exception()
+            raise
+        else:
+            shared.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._coalesced.pop(request_key, None)
+
+    async def _admitted(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        await self._acquire()
+        try:
+            return await call()
+        finally:
+            with self._lock:
+                self._release_locked()
+
+    async def _acquire(self) -> None:
+        """获取一个执行名额，需要排队时在当前工作流的队列里等待"""
+        workflow_id = _current_workflow.get()
+        with self._lock:
+            if self._in_flight < self.max_in_flight and self._queued == 0:
+                self._in_flight += 1
+                return
+            if self._queued >= self.max_queue:
+                raise BackendOverloadedError(
+                    f'{self.name}繁忙：{self._in_flight}个请求正在执行，{self._queued}个请求在排队，请稍后重试'
+                )
+            waiter = Future()
+            self._queues.setdefault(workflow_id, deque()).append(waiter)
+            self._queued += 1
+
+        try:
+            await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.cancel():
+                    # 还在排队，从队列里移除
+                    queue = self._queues.get(workflow_id)
+                    if queue is not None and waiter in queue:
+                        queue.remove(waiter)
+                        self._queued -= 1
+                        if not queue:
+                            del self._queues[workflow_id]
+                else:
+                    # 已经分到名额了，还回去
+                    self._release_locked()
+            raise
+
+    def _release_locked(self) -> None:
+        """归还一个名额，并按工作流轮转的顺序放行下一个等待者，调用方需要持有锁"""
+        self._in_flight -= 1
+        while self._queues and self._in_flight < self.max_in_flight:
+            workflow_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(workflow_id)  # 这个工作流放行了一个，排到最后
+            else:
+                del self._queues[workflow_id]
+            if waiter.set_running_or_notify_cancel():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queued': self._queued,
+                'coalescing': len(self._coalesced),
+            }
+
+
+class AdmissionRegistry:
+    """按后端保存准入控制器，并发上限和队列长度按后端类型配置"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        Args:
+            limits: 后端类型（ollama、llamacpp……）到{"max_in_flight": ..., "max_queue": ...}的映射，
+                    没有配置的类型使用default项，也没有default时按并发1、队列32处理
+        """
+        self.limits = limits or {}
+        self._controllers: Dict[Tuple[str, str], AdmissionController] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+        """根据配置设置各类后端的限制，在应用启动时调用（已经创建的控制器不受影响）"""
+        if limits is not None:
+            self.limits = limits
+
+    def get(self, kind: str, backend: str) -> AdmissionController:
+        """
+        获取一个后端的准入控制器
+
+        Args:
+            kind: 后端类型，决定使用哪一组限制
+            backend: 后端的标识，例如Ollama的base_url、LlamaCpp的模型路径
+        """
+        key = (kind, backend)
+        with self._lock:
+            controller = self._controllers.get(key)
+            if controller is None:
+                limits = self.limits.get(kind) or self.limits.get('default') or {}
+                controller = self._controllers[key] = AdmissionController(
+                    name=f'{kind}后端（{backend}）',
+                    max_in_flight=limits.get('max_in_flight', 1),
+                    max_queue=limits.get('max_queue', 32),
+                )
+            return controller
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            controllers = dict(self._controllers)
+        return {f'{kind}:{backend}': c.stats() for (kind, backend), c in controllers.items()}
+
+
+# 全局唯一的准入控制器注册表
+backend_admission = AdmissionRegistry()
@@ -89,6 +89,18 @@ class ParamType(str, Enum):
     ARRAY = 'array'          # 数组类型
     OBJECT = 'object'        # 对象类型
 
+class ExecutionMode(str, Enum):
+    """
+    组件执行方式常量类。
+    execute虽然是异步方法，但很多组件在里面做的是阻塞操作（同步的invoke、模型推理、解析PDF……），
+    直接在事件循环里执行会让同一个进程里所有请求都卡住。组件在元数据里声明execution_mode，
+    工作流引擎据此决定在哪里执行它（见workflows/engine/offload.py）。
+    """
+    ASYNC = 'async'                  # 真正的异步代码（await网络请求等），直接在事件循环里执行，默认值
+    IO = 'io'                        # 阻塞的网络/磁盘IO（同步的HTTP客户端等），放到IO线程池
+    GIL_RELEASING = 'gil_releasing'  # 在C扩展里做计算并会释放GIL（torch、llama.cpp、faiss），放到计算线程池，模型留在本进程
+    CPU = 'cpu'                      # 纯Python的CPU密集计算（解析PDF、分割文本），放到进程池，输入输出需要能pickle
+
 class ComponentParam:
     """
     这个类就是对组件本身参数的类型、结构做统一的定义和规范。不是组件框架
@@ -164,7 +176,9 @@ class ComponentMetadata:
                  outputs: Optional[List[Dict]] = None,
                  params: Optional[List[Dict]] = None,
                  tags: Optional[List[str]] = None,
-                 examples: Optional[List[Dict]] = None):
+                 examples: Optional[List[Dict]] = None,
+                 init_params: Optional[List[str]] = None,
+                 execution_mode: str = ExecutionMode.ASYNC):
         self.name = name
         self.type = type
         self.category = category
@@ -176,6 +190,8 @@ class ComponentMetadata:
         self.params = params or []
         self.tags = tags or []
         self.examples = examples or []
+        self.init_params = init_params or [] # 影响组件初始化的参数名，工作流引擎据此复用组件实例
+        self.execution_mode = execution_mode # 组件的执行方式，工作流引擎据此决定放在事件循环、线程池还是进程池里执行
         
     
     def to_dict(self) -> Dict[str, Any]:
@@ -191,7 +207,9 @@ class ComponentMetadata:
             'outputs': self.outputs,
             'params': self.params,
             'tags': self.tags,
-            'examples': self.examples
+            'examples': self.examples,
+            'init_params': self.init_params,
+            'execution_mode': self.execution_mode
         }
     
     """
@@ -252,7 +270,15 @@ class BaseComponent(ABC):
         - type: 组件类型
         - category: 组件类别
         - description: 组件描述
-        - 可选字段: icon, version, inputs, outputs, params, tags, examples
+        - 可选字段: icon, version, inputs, outputs, params, tags, examples, init_params, execution_mode
+
+        init_params说明：
+            列出会影响组件初始化结果的参数名（例如模型ID、设备）。声明之后，工作流引擎会把组件实例放进实例池，
+            下次执行时这些参数的值完全相同就直接复用，避免重复加载模型；没有声明则每次执行都新建实例。
+
+        execution_mode说明：
+            execute里做的是哪一类工作，取值见ExecutionMode，默认为async（直接在事件循环里执行）。
+            execute里有阻塞调用的组件应该声明为io、gil_releasing或cpu，避免一次长时间的生成卡住其他所有请求。
 
         return：
             Dict: 包括组件名称、类型、类别、描述、输入、输出和参数定义的字典
@@ -297,6 +323,23 @@ class BaseComponent(ABC):
         """
         pass
 
+    async def execute_batch(self, batch_inputs: List[Dict[str, Any]], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        批量执行组件（异步方法，可选重写）
+
+        批量执行工作流（execute_batch接口）时，同一个节点的多组输入会一起交给组件。
+        默认实现就是逐个调用execute；能真正批处理的组件（例如一次前向计算处理多个提示词的本地模型）可以重写这个方法。
+        工作流引擎检测到组件重写了该方法时才会整批调用，否则会自己并发地逐个调用execute。
+
+        Args:
+            batch_inputs: 输入数据列表，每一项和execute的inputs相同
+            params: 参数数据，整批共用
+
+        Returns:
+            List[Dict[str, Any]]: 和batch_inputs一一对应的输出列表
+        """
+        return [await self.execute(inputs, params) for inputs in batch_inputs]
+
     @classmethod
     def validate_params(cls, params: Dict[str, Any]) -> Dict[str, Any]:
         """
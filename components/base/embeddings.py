@@ -0,0 +1,343 @@
+"""
+进程内共享的嵌入模型注册表
+
+原来FAISSVectorStoreComponent和ChromaVectorStoreComponent在_initialize_embeddings里各自创建HuggingFaceEmbeddings，
+组件实例池只能让同一个组件、同一个模型的实例复用，FAISS的入库节点、Chroma的入库节点、查询节点……
+每一个都要把同一个MiniLM模型再加载一份到内存里。
+
+现在所有组件通过embedding_registry.get(model_name)取嵌入模型：
+    - 每个模型在进程内只加载一次，第一次用到时才加载；并发的第一次请求只会触发一次加载，其余的等它加载完
+    - settings.EMBEDDING_PRELOAD_MODELS里列出的模型在应用启动时就在后台线程里加载，第一个请求不用等
+    - 所有模型估算占用的内存超过max_memory_mb时，按最久未使用的顺序从注册表里移除
+      （正在被向量存储引用的模型要等引用释放后才真正回收，下次用到时重新加载）
+
+内存占用优先按模型参数的字节数计算，拿不到参数时按加载前后进程RSS的增长估算。
+
+嵌入缓存（EmbeddingCache）：
+    每天晚上重新入库一遍文档时，绝大部分文本块和昨天一模一样，却每次都要重新算一遍向量。
+    组件通过get_embeddings(model_name)拿到的是带磁盘缓存的CachedEmbeddings：
+    按(模型名称, 文本的sha256)在SQLite里查找向量，只有没命中的文本才交给模型，并且攒成大批次一起计算；
+    全部命中时连模型都不用加载。
+"""
+
+import gc
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:  # 没有安装LangChain时只是不能作为LangChain的嵌入模型使用
+    Embeddings = object
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def _current_rss() -> int:
+    """当前进程的常驻内存大小（字节），无法获取时返回0"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _model_size(embeddings: Any) -> Optional[int]:
+    """按参数的字节数计算模型大小，HuggingFaceEmbeddings的client是SentenceTransformer（torch模块）"""
+    client = getattr(embeddings, 'client', None)
+    if client is None or not hasattr(client, 'parameters'):
+        return None
+    try:
+        return sum(p.numel() * p.element_size() for p in client.parameters())
+    except Exception:
+        return None
+
+
+class _LoadedModel:
+    def __init__(self, embeddings: Any, memory: int):
+        self.embeddings = embeddings
+        self.memory = memory
+        self.last_used = time.monotonic()
+
+
+class EmbeddingRegistry:
+    """按模型名称保存已加载的嵌入模型"""
+
+    def __init__(self, max_memory_mb: int = 2048, cache_folder: Optional[str] = None):
+        """
+        Args:
+            max_memory_mb: 所有嵌入模型的内存预算（MB），0表示不限制
+            cache_folder: 模型文件的下载目录，None表示系统临时目录下的hf_models
+        """
+        self.max_memory_mb = max_memory_mb
+        self.cache_folder = cache_folder or os.path.join(tempfile.gettempdir(), "hf_models")
+        self._models: "OrderedDict[str, _LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}  # 每个模型一把加载锁，同一个模型只加载一次
+        self._lock = threading.Lock()
+
+    def configure(self, max_memory_mb: Optional[int] = None, cache_folder: Optional[str] = None) -> None:
+        """根据配置调整内存预算和下载目录，在应用启动时调用"""
+        if max_memory_mb is not None:
+            self.max_memory_mb = max_memory_mb
+        if cache_folder:
+            self.cache_folder = cache_folder
+
+    def get(self, model_name: Optional[str] = None) -> Any:
+        """获取一个嵌入模型（HuggingFaceEmbeddings），还没加载时先加载，加载会阻塞"""
+        model_name = model_name or DEFAULT_EMBEDDING_MODEL
+        loaded = self._lookup(model_name)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            load_lock = self._loading.setdefault(model_name, threading.Lock())
+        with load_lock:
+            # 等锁的时候可能已经被别的线程加载好了
+            loaded = self._lookup(model_name)
+            if loaded is not None:
+                return loaded
+
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+
+            rss_before = _current_rss()
+            embeddings = HuggingFaceEmbeddings(model_name=model_name, cache_folder=self.cache_folder)
+            memory = _model_size(embeddings)
+            if memory is None:
+                memory = max(0, _current_rss() - rss_before)
+            logger.info(f"已加载嵌入模型{model_name}，约{memory / 1024 / 1024:.0f}MB")
+
+            with self._lock:
+                self._models[model_name] = _LoadedModel(embeddings, memory)
+                evicted = self._evict_over_budget(keep=model_name)
+        if evicted:
+            gc.collect()
+        return embeddings
+
+    def _lookup(self, model_name: str) -> Optional[Any]:
+        with self._lock:
+            loaded = self._models.get(model_name)
+            if loaded is None:
+                return None
+            loaded.last_used = time.monotonic()
+            self._models.move_to_end(model_name)
+            return loaded.embeddings
+
+    def _evict_over_budget(self, keep: str) -> int:
+        """超出内存预算时按最久未使用的顺序移除模型（刚加载的keep除外），返回移除的数量，调用方需要持有锁"""
+        if self.max_memory_mb <= 0:
+            return 0
+        budget = self.max_memory_mb * 1024 * 1024
+        total = sum(m.memory for m in self._models.values())
+        evicted = 0
+        for model_name in list(self._models):
+            if total <= budget:
+                break
+            if model_name == keep:
+                continue
+            total -= self._models.pop(model_name).memory
+            evicted += 1
+            logger.info(f"嵌入模型超出内存预算，已移除：{model_name}")
+        return evicted
+
+    def preload(self, model_names: Iterable[str], background: bool = True) -> None:
+        """
+        预先加载一批模型
+
+        Args:
+            model_names: 模型名称列表
+            background: 是否在后台线程里加载，应用启动时用后台线程，避免拖慢启动
+        """
+        model_names = [name for name in model_names if name]
+        if not model_names:
+            return
+
+        def load_all():
+            for model_name in model_names:
+                try:
+                    self.get(model_name)
+                except Exception as e:
+                    logger.warning(f"预加载嵌入模型{model_name}失败：{str(e)}")
+
+        if background:
+            threading.Thread(target=load_all, name='embedding-preload', daemon=True).start()
+        else:
+            load_all()
+
+    def clear(self) -> None:
+        """移除所有模型"""
+        with self._lock:
+            self._models.clear()
+        gc.collect()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'models': {name: round(m.memory / 1024 / 1024, 1) for name, m in self._models.items()},
+                'memory_mb': round(sum(m.memory for m in self._models.values()) / 1024 / 1024, 1),
+            }
+
+
+class EmbeddingCache:
+    """按(模型名称, 文本的sha256)保存向量的磁盘缓存，数据保存在SQLite文件里"""
+
+    # SQLite一条语句里参数个数有上限，批量查询时分段进行
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 256):
+        """
+        Args:
+            path: SQLite文件路径，None或空字符串表示不使用嵌入缓存
+            batch_size: 没命中的文本每批交给模型计算多少条
+        """
+        self.path = path or None
+        self.batch_size = max(1, batch_size)
+        self._local = threading.local()  # SQLite连接不能跨线程使用，每个线程各自打开一个
+
+    def configure(self, path: Optional[str] = None, batch_size: Optional[int] = None) -> None:
+        """根据配置设置缓存，在应用启动时调用"""
+        if path is not None:
+            self.path = path or None
+        if batch_size is not None:
+            self.batch_size = max(1, batch_size)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == self.path:
+            return conn
+        if conn is not None:
+            conn.close()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))'
+        )
+        self._local.conn, self._local.path = conn, self.path
+        return conn
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查找向量，返回命中的哈希到向量的映射"""
+        conn = self._connect()
+        found = {}
+        for start in range(0, len(hashes), self.LOOKUP_CHUNK):
+            chunk = hashes[start:start + self.LOOKUP_CHUNK]
+            rows = conn.execute(
+                f'SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({",".join("?" * len(chunk))})',
+                [model_name, *chunk]
+            )
+            for text_hash, blob in rows:
+                vector = array('f')
+                vector.frombytes(blob)
+                found[text_hash] = vector.tolist()
+        return found
+
+    def set_many(self, model_name: str, vectors: Dict[str, List[float]]) -> None:
+        """批量保存向量（按float32保存）"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)',
+                [(model_name, text_hash, array('f', vector).tobytes()) for text_hash, vector in vectors.items()]
+            )
+
+    def clear(self, model_name: Optional[str] = None) -> None:
+        """清空缓存，指定模型名称时只清空这个模型的向量"""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        with conn:
+            if model_name is None:
+                conn.execute('DELETE FROM embeddings')
+            else:
+                conn.execute('DELETE FROM embeddings WHERE model = ?', (model_name,))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带磁盘缓存的嵌入模型，可以直接传给FAISS、Chroma等LangChain的向量存储
+
+    模型从embedding_registry获取，只有缓存没命中时才会加载
+    """
+
+    def __init__(self, model_name: str, registry: "EmbeddingRegistry", cache: EmbeddingCache):
+        self.model_name = model_name
+        self.registry = registry
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self.cache.text_hash(text) for text in texts]
+        try:
+            vectors = self.cache.get_many(self.model_name, list(set(hashes)))
+        except sqlite3.Error as e:
+            # 缓存只是加速手段，出问题时照常用模型计算
+            logger.warning(f"读取嵌入缓存失败：{str(e)}")
+            return self.registry.get(self.model_name).embed_documents(texts)
+
+        # 同一批里重复的文本只算一次
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        if missing:
+            model = self.registry.get(self.model_name)
+            missing_hashes = list(missing)
+            computed = {}
+            for start in range(0, len(missing_hashes), self.cache.batch_size):
+                batch = missing_hashes[start:start + self.cache.batch_size]
+                for text_hash, vector in zip(batch, model.embed_documents([missing[h] for h in batch])):
+                    computed[text_hash] = list(vector)
+            try:
+                self.cache.set_many(self.model_name, computed)
+            except sqlite3.Error as e:
+                logger.warning(f"写入嵌入缓存失败：{str(e)}")
+            vectors.update(computed)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # 查询不走缓存：非对称的模型（e5、bge等）对查询和文档的编码方式不同，
+        # 而且查询文本几乎不会重复，写进缓存只会把文档向量挤出去
+        return self.registry.get(self.model_name).embed_query(text)
+
+
+# 全局唯一的嵌入模型注册表和嵌入缓存
+embedding_registry = EmbeddingRegistry()
+embedding_cache = EmbeddingCache()
+
+
+def embed_queries(embeddings: Any, queries: List[str]) -> List[List[float]]:
+    """
+    计算一批查询的向量
+
+    一定要用embed_query而不是embed_documents：非对称的嵌入模型给查询加的前缀和文档不同，
+    而CachedEmbeddings的embed_documents还会把查询向量写进文档的嵌入缓存
+    """
+    return [embeddings.embed_query(query) for query in queries]
+
+
+def get_embeddings(model_name: Optional[str] = None) -> Any:
+    """组件获取嵌入模型的入口：打开了嵌入缓存时返回CachedEmbeddings，否则直接返回注册表里的模型"""
+    model_name = model_name or DEFAULT_EMBEDDING_MODEL
+    if embedding_cache.enabled:
+        return CachedEmbeddings(model_name, embedding_registry, embedding_cache)
+    return embedding_registry.get(model_name)
@@ -0,0 +1,33 @@
+"""
+按需导入组件类
+
+components.implementations下的各个包原来在__init__里直接import全部组件，导入其中任何一个模块
+（例如进程池的子进程反序列化文本分割器的组件类）都会先执行包的__init__，连带导入所有LLM和向量存储，
+把torch、transformers、faiss和LangChain的各个集成全部加载一遍。
+
+现在包里只声明“组件类名 -> 所在模块”，第一次访问某个组件类时才导入它所在的模块（模块级的__getattr__，PEP 562）：
+    from components.implementations.llms import GeminiComponent   # 只导入gemini.py
+"""
+
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def lazy_exports(package: str, exports: Dict[str, str]) -> Tuple[Callable[[str], Any], List[str]]:
+    """
+    生成包的__getattr__和__all__
+
+    Args:
+        package: 包名，传入__name__
+        exports: 公开的名称 -> 它所在的模块（相对于package，例如'.gemini'）
+
+    Returns:
+        Tuple[Callable, List[str]]: (__getattr__, __all__)
+    """
+    def __getattr__(name: str) -> Any:
+        module = exports.get(name)
+        if module is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        return getattr(importlib.import_module(module, package), name)
+
+    return __getattr__, list(exports)
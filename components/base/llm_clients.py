@@ -0,0 +1,132 @@
+"""
+进程内共享的LLM客户端池
+
+原来DeepSeekComponent每次调用都新建一个ChatOllama/OllamaLLM，GeminiComponent每次新建一个ChatGoogleGenerativeAI，
+每个客户端都带着自己的HTTP连接池，用完就丢，所以每次请求都要重新建立TCP连接（Gemini还要TLS握手）。
+压测时连接本地Ollama服务的建连开销在延迟里占了不小的比例。
+
+现在LLM组件通过llm_client_pool.get()取客户端：
+    - 按(客户端类, base_url, 凭证的哈希, 其他构造参数)复用同一个客户端对象，它内部的keep-alive连接也就一起复用了
+    - Ollama客户端底层是httpx，连接池大小由max_connections控制（settings.LLM_CLIENT_MAX_CONNECTIONS）
+    - 异步客户端的连接绑定在创建它的事件循环上，所以客户端按事件循环分开保存，事件循环被回收后对应的客户端也会被回收
+    - 每个事件循环最多保留max_clients个客户端，按最近使用淘汰
+
+凭证只以哈希的形式出现在键里，不会被保存成明文的键。
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import httpx
+except ImportError:  # httpx随ollama客户端一起安装，没有安装时不限制连接池大小
+    httpx = None
+
+
+class LLMClientPool:
+    """按事件循环分开保存的LLM客户端缓存"""
+
+    def __init__(self, max_clients: int = 64, max_connections: int = 20):
+        """
+        Args:
+            max_clients: 每个事件循环最多缓存多少个客户端
+            max_connections: 每个HTTP客户端的最大连接数（同时也是保持keep-alive的连接数）
+        """
+        self.max_clients = max_clients
+        self.max_connections = max_connections
+        self._clients: "weakref.WeakKeyDictionary[Any, OrderedDict]" = weakref.WeakKeyDictionary()
+        self._sync_clients: "OrderedDict[str, Any]" = OrderedDict()  # 不在事件循环里调用时使用
+        self._lock = threading.Lock()
+
+    def configure(self, max_clients: Optional[int] = None, max_connections: Optional[int] = None) -> None:
+        """根据配置调整缓存数量和连接池大小，在应用启动时调用"""
+        if max_clients is not None:
+            self.max_clients = max_clients
+        if max_connections is not None:
+            self.max_connections = max_connections
+
+    def http_client_kwargs(self) -> Dict[str, Any]:
+        """传给httpx.Client/AsyncClient的参数（例如ChatOllama的client_kwargs），用来限制连接池大小"""
+        if httpx is None:
+            return {}
+        return {
+            'limits': httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            )
+        }
+
+    @staticmethod
+    def _key(factory: Callable, base_url: Optional[str], credential: Optional[str], kwargs: Dict[str, Any]) -> str:
+        credential_hash = hashlib.sha256(credential.encode('utf-8')).hexdigest() if credential else None
+        return json.dumps({
+            'factory': f"{factory.__module__}.{factory.__qualname__}",
+            'base_url': base_url,
+            'credential': credential_hash,
+            'kwargs': kwargs,
+        }, sort_keys=True, default=str)
+
+    def get(
+            self,
+            factory: Callable[..., Any],
+            base_url: Optional[str] = None,
+            credential: Optional[str] = None,
+            build: Optional[Callable[[], Any]] = None,
+            **kwargs
+    ) -> Any:
+        """
+        获取（必要时创建）一个客户端
+
+        Args:
+            factory: 客户端类，例如ChatOllama
+            base_url: 服务地址，没有的话传None
+            credential: API密钥等凭证，只用来计算键
+            build: 自定义的创建函数，不传时用factory(base_url=base_url, **kwargs)创建；
+                   需要传入不能作为键的参数（例如SecretStr包装的密钥）时使用
+            **kwargs: 其余构造参数（模型名、温度等），同时参与计算键
+        """
+        key = self._key(factory, base_url, credential, kwargs)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self._lock:
+            if loop is None:
+                clients = self._sync_clients
+            else:
+                clients = self._clients.get(loop)
+                if clients is None:
+                    clients = self._clients[loop] = OrderedDict()
+            client = clients.get(key)
+            if client is not None:
+                clients.move_to_end(key)
+                return client
+
+        # 创建客户端放在锁外面，避免阻塞其他线程
+        if build is not None:
+            client = build()
+        else:
+            client = factory(**kwargs) if base_url is None else factory(base_url=base_url, **kwargs)
+
+        with self._lock:
+            client = clients.setdefault(key, client)
+            clients.move_to_end(key)
+            while len(clients) > self.max_clients:
+                clients.popitem(last=False)
+        return client
+
+    def clear(self) -> None:
+        """清空所有缓存的客户端"""
+        with self._lock:
+            self._clients = weakref.WeakKeyDictionary()
+            self._sync_clients.clear()
+
+
+# 全局唯一的LLM客户端池
+llm_client_pool = LLMClientPool()
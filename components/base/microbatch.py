@@ -0,0 +1,142 @@
+"""
+动态微批处理（micro-batching）
+
+本地模型在CPU上一次只处理一个提示词时，矩阵运算的规模太小，吞吐量很低；把几个提示词填充到同样长度一起做前向计算，
+每秒生成的token数会高很多。但并发的请求是各自独立到达的，谁也不知道别人的存在。
+
+MicroBatcher放在共享的模型前面：
+    - 调用方await submit(item)，请求进入队列
+    - 后台线程取到第一个请求后，最多再等max_wait_ms毫秒、或者凑够batch_size个，然后一次性交给run_batch
+    - 每个结果送回对应的调用方
+
+模型由后台线程在第一次用到时加载（load），同一个进程里相同配置的模型只加载一份，由所有组件实例共享；
+空闲超过idle_ttl秒后后台线程退出并释放模型，下次用到时再重新加载。
+
+调用方可能在任意线程、任意事件循环里（见workflows/engine/offload.py），所以用concurrent.futures.Future传递结果。
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """把并发到达的请求攒成小批次，交给共享的模型一次处理"""
+
+    def __init__(
+            self,
+            name: str,
+            load: Callable[[], Any],
+            run_batch: Callable[[Any, List[Any]], List[Any]],
+            batch_size: int = 4,
+            max_wait_ms: float = 20,
+            idle_ttl: float = 1800
+    ):
+        """
+        Args:
+            name: 名称，用于日志和线程名
+            load: 加载模型的函数，在后台线程里第一次需要时调用
+            run_batch: 批处理函数，参数为(模型, 请求列表)，返回和请求一一对应的结果列表
+            batch_size: 一个批次最多包含多少个请求
+            max_wait_ms: 收到第一个请求后最多再等多少毫秒凑批次，0表示不等待，有多少处理多少
+            idle_ttl: 空闲多少秒后释放模型，0表示永不释放
+        """
+        self.name = name
+        self.load = load
+        self.run_batch = run_batch
+        self.batch_size = max(1, batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.idle_ttl = idle_ttl
+        self._queue: "queue.Queue" = queue.Queue()
+        self._model: Any = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def configure(self, batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None) -> None:
+        """调整批次大小和等待时间，下一个批次开始生效"""
+        if batch_size is not None:
+            self.batch_size = max(1, int(batch_size))
+        if max_wait_ms is not None:
+            self.max_wait_ms = float(max_wait_ms)
+
+    async def submit(self, item: Any) -> Any:
+        """提交一个请求并等待它的结果"""
+        future = Future()
+        self._queue.put((item, future))
+        self._ensure_worker()
+        return await asyncio.wrap_future(future)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name=f'microbatch-{self.name}', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> Optional[List]:
+        """取出下一个批次，空闲超时返回None"""
+        try:
+            first = self._queue.get(timeout=self.idle_ttl or None)
+        except queue.Empty:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self) -> None:
+        """后台线程：不断取批次执行，空闲超时后释放模型并退出"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                with self._lock:
+                    # 超时和新请求到达可能同时发生，队列里还有请求就继续干活
+                    if self._queue.empty():
+                        self._model = None
+                        self._thread = None
+                        logger.info(f"{self.name}空闲超时，已释放模型")
+                        return
+                continue
+
+            # 调用方已经取消的请求不用再算了
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                if self._model is None:
+                    self._model = self.load()
+                results = self.run_batch(self._model, [item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f'{self.name}返回了{len(results)}个结果，但批次里有{len(batch)}个请求')
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+_batchers: Dict[Hashable, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_micro_batcher(key: Hashable, factory: Callable[[], MicroBatcher]) -> MicroBatcher:
+    """获取进程内共享的微批处理器，key相同（例如同一个模型配置）的调用共用一个，不存在时用factory创建"""
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = _batchers[key] = factory()
+        return batcher
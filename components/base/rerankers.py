@@ -0,0 +1,182 @@
+"""
+交叉编码器（cross-encoder）重排序的共享部分
+
+向量存储为了不漏掉答案，top_k往往开得很大，然后全部塞进LLM的提示词里，提示词越长生成越慢。
+重排序组件用交叉编码器给(查询, 文本块)逐对打分：和嵌入模型分别编码查询和文本不同，交叉编码器把两段文本拼在一起看，
+判断相关性准得多，只留下分数最高的top_n个交给LLM，提示词更短、答案也更好。
+
+模型：
+    同样的(模型名称, 设备, 最大长度)在进程内只加载一次（get_cross_encoder），所有重排序节点共用；
+    并发的第一次请求只会触发一次加载，其余的等它加载完。
+
+分数缓存（RerankScoreCache）：
+    同一个问题反复出现、同一个文本块被反复召回时，分数不用重新算。
+    按(模型名称, 查询和文本块的sha256)把分数保存在SQLite里，只有没命中的文本对才交给模型。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RerankScoreCache:
+    """按(模型名称, 文本对的sha256)保存重排序分数的磁盘缓存，数据保存在SQLite文件里"""
+
+    # SQLite一条语句里参数个数有上限，批量查询时分段进行
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite文件路径，None或空字符串表示不使用分数缓存
+        """
+        self.path = path or None
+        self._local = threading.local()  # SQLite连接不能跨线程使用，每个线程各自打开一个
+
+    def configure(self, path: Optional[str] = None) -> None:
+        """根据配置设置缓存，在应用启动时调用"""
+        if path is not None:
+            self.path = path or None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == self.path:
+            return conn
+        if conn is not None:
+            conn.close()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            'model TEXT NOT NULL, hash TEXT NOT NULL, score REAL NOT NULL, PRIMARY KEY (model, hash))'
+        )
+        self._local.conn, self._local.path = conn, self.path
+        return conn
+
+    @staticmethod
+    def pair_hash(query: str, passage: str) -> str:
+        # 用\0分隔，避免查询和文本块拼接以后和另一对文本相同
+        return hashlib.sha256(f'{query}\0{passage}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name: str, hashes: List[str]) -> Dict[str, float]:
+        """批量查找分数，返回命中的哈希到分数的映射"""
+        conn = self._connect()
+        found = {}
+        for start in range(0, len(hashes), self.LOOKUP_CHUNK):
+            chunk = hashes[start:start + self.LOOKUP_CHUNK]
+            rows = conn.execute(
+                f'SELECT hash, score FROM scores WHERE model = ? AND hash IN ({",".join("?" * len(chunk))})',
+                [model_name, *chunk]
+            )
+            found.update(rows)
+        return found
+
+    def set_many(self, model_name: str, scores: Dict[str, float]) -> None:
+        """批量保存分数"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO scores (model, hash, score) VALUES (?, ?, ?)',
+                [(model_name, pair_hash, float(score)) for pair_hash, score in scores.items()]
+            )
+
+    def clear(self, model_name: Optional[str] = None) -> None:
+        """清空缓存，指定模型名称时只清空这个模型的分数"""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        with conn:
+            if model_name is None:
+                conn.execute('DELETE FROM scores')
+            else:
+                conn.execute('DELETE FROM scores WHERE model = ?', (model_name,))
+
+
+_models: Dict[Tuple[str, str, int], Any] = {}
+_loading: Dict[Tuple[str, str, int], threading.Lock] = {}
+_models_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name: str, device: str = 'cpu', max_length: int = 512) -> Any:
+    """获取进程内共享的sentence_transformers.CrossEncoder，第一次用到时加载"""
+    key = (model_name, device, max_length)
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        load_lock = _loading.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _models_lock:
+            model = _models.get(key)
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            model = CrossEncoder(model_name, device=device, max_length=max_length)
+            logger.info(f"已加载交叉编码器{model_name}（{device}）")
+            with _models_lock:
+                _models[key] = model
+    return model
+
+
+def score_pairs(
+        model_name: str,
+        pairs: List[Tuple[str, str]],
+        batch_size: int = 32,
+        device: str = 'cpu',
+        max_length: int = 512,
+        cache: Optional[RerankScoreCache] = None
+) -> List[float]:
+    """
+    给(查询, 文本块)打分，返回和pairs一一对应的分数（会阻塞，在事件循环里需要放到线程里调用）
+
+    重复的文本对只算一次；有缓存时先查缓存，只有没命中的文本对按batch_size分批交给模型，全部命中时连模型都不用加载
+    """
+    cache = cache if cache is not None and cache.enabled else None
+    hashes = [RerankScoreCache.pair_hash(query, passage) for query, passage in pairs]
+
+    scores: Dict[str, float] = {}
+    if cache is not None:
+        try:
+            scores = cache.get_many(model_name, list(set(hashes)))
+        except sqlite3.Error as e:
+            # 缓存只是加速手段，出问题时照常用模型计算
+            logger.warning(f"读取重排序分数缓存失败：{str(e)}")
+            cache = None
+
+    missing = {}
+    for pair, pair_hash in zip(pairs, hashes):
+        if pair_hash not in scores:
+            missing.setdefault(pair_hash, pair)
+
+    if missing:
+        model = get_cross_encoder(model_name, device, max_length)
+        missing_hashes = list(missing)
+        computed = {}
+        for start in range(0, len(missing_hashes), batch_size):
+            batch = missing_hashes[start:start + batch_size]
+            batch_scores = model.predict([missing[h] for h in batch], batch_size=len(batch), show_progress_bar=False)
+            computed.update(zip(batch, (float(score) for score in batch_scores)))
+        scores.update(computed)
+        if cache is not None:
+            try:
+                cache.set_many(model_name, computed)
+            except sqlite3.Error as e:
+                logger.warning(f"写入重排序分数缓存失败：{str(e)}")
+
+    return [scores[pair_hash] for pair_hash in hashes]
+
+
+# 全局唯一的重排序分数缓存
+rerank_score_cache = RerankScoreCache()
@@ -0,0 +1,54 @@
+"""
+LLM输出的token流转发
+
+工作流以流式方式执行时，执行引擎会在调用组件前通过token_stream()登记一个回调，
+支持流式输出的LLM组件检查streaming_enabled()，如果开启了就改用astream逐段生成，并通过emit_token()把每一段文本转发出去。
+
+用contextvars而不是给execute()加参数，是因为：
+    - 不需要改动BaseComponent.execute的签名，不支持流式的组件完全不用关心这件事
+    - 每个节点在自己的asyncio任务里执行，contextvars天然按任务隔离，并发执行的节点不会把token发错地方
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+_token_callback: ContextVar[Optional[Callable[[str], None]]] = ContextVar('token_callback', default=None)
+
+
+def streaming_enabled() -> bool:
+    """当前是否有人在接收token流"""
+    return _token_callback.get() is not None
+
+
+def emit_token(text: str) -> None:
+    """转发一段生成的文本，没有开启流式时什么也不做"""
+    callback = _token_callback.get()
+    if callback is not None and text:
+        callback(text)
+
+
+@contextmanager
+def token_stream(callback: Callable[[str], None]):
+    """在with块内开启token流，由执行引擎在调用组件前使用"""
+    token = _token_callback.set(callback)
+    try:
+        yield
+    finally:
+        _token_callback.reset(token)
+
+
+async def collect_stream(llm: Any, llm_input: Any) -> str:
+    """
+    用LangChain的astream逐段生成，边生成边转发，最后返回完整文本
+
+    对话模型（ChatOllama、ChatGoogleGenerativeAI）每段是消息块，文本在.content里；
+    文本补全模型（OllamaLLM、LlamaCpp）每段直接是字符串。
+    """
+    parts = []
+    async for chunk in llm.astream(llm_input):
+        text = getattr(chunk, 'content', chunk)
+        if isinstance(text, str) and text:
+            emit_token(text)
+            parts.append(text)
+    return ''.join(parts)
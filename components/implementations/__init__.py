@@ -1,11 +1,11 @@
 """
 将implementations下的所有应用集成到主应用
 即更新 components/implementations/__init__.py 文件以包含新组件
+
+组件类按需导入（见components/base/lazy.py）：导入某一个组件时只加载它自己的模块，不会把所有LLM和向量存储的依赖都加载一遍
 """
 
-from .llms import *
-from .memory import *
-from .chains import *
+from components.base.lazy import lazy_exports
 
 # 以下时RAG（检索增强生成）的组件
 """
@@ -16,6 +16,18 @@ from .chains import *
 检索: 基于查询的相似度，从向量存储中检索相关文本
 生成: 将检索到的相关上下文与用户查询一起发送给LLM
 """
-from .vector_stores import *
-from .text_splitters import *
-from .document_loaders import *
+__getattr__, __all__ = lazy_exports(__name__, {
+    "DeepSeekComponent": ".llms",
+    "GeminiComponent": ".llms",
+    "LlamaCppComponent": ".llms",
+    "HuggingFaceComponent": ".llms",
+    "ConversationBufferMemoryComponent": ".memory",
+    "LLMChainComponent": ".chains",
+    "FAISSVectorStoreComponent": ".vector_stores",
+    "ChromaVectorStoreComponent": ".vector_stores",
+    "CharacterTextSplitterComponent": ".text_splitters",
+    "RecursiveTextSplitterComponent": ".text_splitters",
+    "PDFLoaderComponent": ".document_loaders",
+    "WordLoaderComponent": ".document_loaders",
+    "CrossEncoderRerankerComponent": ".rerankers",
+})
@@ -1,5 +1,6 @@
-from .llm_chain import LLMChainComponent
+from components.base.lazy import lazy_exports
 
-__all__ = [
-    "LLMChainComponent"
-]
\ No newline at end of file
+# 组件类在第一次被访问时才导入（见components/base/lazy.py）
+__getattr__, __all__ = lazy_exports(__name__, {
+    "LLMChainComponent": ".llm_chain",
+})
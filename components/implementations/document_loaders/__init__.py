@@ -3,10 +3,10 @@
 此模块包含各种文档格式的加载器组件
 """
 
-from .pdf_loader import PDFLoaderComponent
-from .word_loader import WordLoaderComponent
+from components.base.lazy import lazy_exports
 
-__all__ = [
-    "PDFLoaderComponent",
-    "WordLoaderComponent"
-]
\ No newline at end of file
+# 组件类在第一次被访问时才导入（见components/base/lazy.py）
+__getattr__, __all__ = lazy_exports(__name__, {
+    "PDFLoaderComponent": ".pdf_loader",
+    "WordLoaderComponent": ".word_loader",
+})
@@ -64,7 +64,8 @@ class PDFLoaderComponent(BaseComponent):
                     "required": True,
                     "description": 'PDF文件路径'
                 }
-            ]
+            ],
+            "execution_mode": 'cpu'
         }
 
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
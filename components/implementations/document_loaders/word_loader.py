@@ -36,7 +36,8 @@ class WordLoaderComponent(BaseComponent):
                     "required": True,
                     "description": 'Word文件的路径(.docx格式)'
                 }
-            ]
+            ],
+            "execution_mode": 'cpu'
         }
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -23,24 +23,20 @@ __all__ 在本项目中的作用:
 4. 版本管理:
    当需要增加新的模型支持时,只需:
    - 创建新的组件类文件
-   - 在这里import
-   - 添加到 __all__ 列表中
+   - 在下面的表里登记 类名 -> 模块
    即可使新组件在整个系统中可用
+
+5. 按需导入:
+   这里不直接import各个组件（见components/base/lazy.py），
+   否则导入任何一个LLM组件都要把所有模型库（torch、transformers、ollama……）加载一遍
 """
 
-# 导入现有的LLM组件
-from .deepseekr1 import DeepSeekComponent
-from .gemini import GeminiComponent
-
-# 导入新增的开源模型组件
-from .huggingface import HuggingFaceComponent
-from .llama import LlamaCppComponent
-
-# 导出所有组件类，确保会被注册
-# __all__ 变量定义了此模块公开的API接口
-__all__ = [
-    "DeepSeekComponent",
-    "GeminiComponent", 
-    "LlamaCppComponent",
-    "HuggingFaceComponent"
-]
\ No newline at end of file
+from components.base.lazy import lazy_exports
+
+# __all__ 变量定义了此模块公开的API接口，组件类在第一次被访问时才导入
+__getattr__, __all__ = lazy_exports(__name__, {
+    "DeepSeekComponent": ".deepseekr1",
+    "GeminiComponent": ".gemini",
+    "LlamaCppComponent": ".llama",
+    "HuggingFaceComponent": ".huggingface",
+})
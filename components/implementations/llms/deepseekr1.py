@@ -3,6 +3,9 @@ from typing import Any, Dict
 from langchain_ollama import OllamaLLM, ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage
 from components.base.component import *
+from components.base.streaming import streaming_enabled, collect_stream
+from components.base.llm_clients import llm_client_pool
+from components.base.admission import backend_admission, request_key, BackendOverloadedError
 import os
 
 class DeepSeekComponent(BaseComponent):
@@ -90,7 +93,8 @@ class DeepSeekComponent(BaseComponent):
                     multiline=True,
                     required=False
                 ).to_dict(),
-            ]
+            ],
+            "execution_mode": "async"
         }
     
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
@@ -121,6 +125,18 @@ class DeepSeekComponent(BaseComponent):
                         ChatOllama：接受 BaseMessage 对象列表作为输入（如SystemMessage、HumanMessage等）
                         OllamaLLM：接受单个字符串作为输入
             """
+            # 模型参数相同的客户端在进程内复用，连接Ollama服务的keep-alive连接也就一起复用了
+            model_kwargs = dict(
+                model=model,
+                temperature=temperature,
+                num_predict=max_output_tokens,  # Ollama使用num_predict而不是max_output_tokens
+                top_p=top_p,
+                top_k=top_k
+            )
+
+            # 同一个Ollama服务上的请求经过准入控制：限制并发、排队、合并完全相同的请求
+            admission = backend_admission.get('ollama', ollama_base_url)
+
             # 使用ChatOllama并正确设置系统提示词
             if system_prompt:
                 # 创建消息列表，包含系统消息和用户消息
@@ -129,33 +145,52 @@ class DeepSeekComponent(BaseComponent):
                     HumanMessage(content=prompt)
                 ]
                 
-                llm = ChatOllama(
-                    model=model,
+                llm = llm_client_pool.get(
+                    ChatOllama,
                     base_url=ollama_base_url,
-                    temperature=temperature,
-                    num_predict=max_output_tokens,  # Ollama使用num_predict而不是max_output_tokens
-                    top_p=top_p,
-                    top_k=top_k
+                    build=lambda: ChatOllama(
+                        base_url=ollama_base_url,
+                        client_kwargs=llm_client_pool.http_client_kwargs(),
+                        **model_kwargs
+                    ),
+                    **model_kwargs
                 )
                 
-                # 调用模型
-                result = llm.invoke(messages)
+                # 调用模型，流式执行时边生成边转发token（流式的结果没法共享给别的请求，不合并）
+                if streaming_enabled():
+                    return {"text": await admission.run(lambda: collect_stream(llm, messages))}
+
+                result = await admission.run(
+                    lambda: llm.ainvoke(messages),
+                    request_key=request_key('chat', model_kwargs, system_prompt, prompt)
+                )
                 
                 return {"text": result.content}
             else:
                 # 如果没有系统提示词，可以直接使用OllamaLLM
-                llm = OllamaLLM(
-                    model=model,
+                llm = llm_client_pool.get(
+                    OllamaLLM,
                     base_url=ollama_base_url,
-                    temperature=temperature,
-                    num_predict=max_output_tokens,
-                    top_p=top_p,
-                    top_k=top_k
+                    build=lambda: OllamaLLM(
+                        base_url=ollama_base_url,
+                        client_kwargs=llm_client_pool.http_client_kwargs(),
+                        **model_kwargs
+                    ),
+                    **model_kwargs
                 )
                 
-                # 调用模型
-                result = llm.invoke(prompt)
+                # 调用模型，流式执行时边生成边转发token（流式的结果没法共享给别的请求，不合并）
+                if streaming_enabled():
+                    return {"text": await admission.run(lambda: collect_stream(llm, prompt))}
+
+                result = await admission.run(
+                    lambda: llm.ainvoke(prompt),
+                    request_key=request_key('completion', model_kwargs, prompt)
+                )
                 
                 return {"text": result}
+        except BackendOverloadedError:
+            # 过载要让执行引擎知道（接口返回503），不能当作普通的生成错误吞掉
+            raise
         except Exception as e:
             return {"error": f"Ollama DeepSeek错误: {str(e)}"}
\ No newline at end of file
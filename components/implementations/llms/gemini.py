@@ -3,6 +3,8 @@ import os
 from pydantic import SecretStr
 from langchain_google_genai import ChatGoogleGenerativeAI
 from components.base.component import BaseComponent, ComponentInput, ComponentOutput, ComponentParam,ParamType
+from components.base.streaming import streaming_enabled, collect_stream
+from components.base.llm_clients import llm_client_pool
 
 class GeminiComponent(BaseComponent):
     """Google Gemini模型组件"""
@@ -75,7 +77,8 @@ class GeminiComponent(BaseComponent):
                     advanced = True
                 ).to_dict(),
 
-            ]
+            ],
+            'execution_mode': 'async'
         }
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         """执行组件处理逻辑"""
@@ -100,19 +103,30 @@ class GeminiComponent(BaseComponent):
                 return {'error': '未提供Gemini API密钥,请在参数中指定或设置GEMINI_API_KEY环境变量'}
             
             # 创建Langchain模型
-            
-            
-            llm = ChatGoogleGenerativeAI(
+            # 同一个API密钥、同样模型参数的客户端在进程内复用，避免每次请求都重新建立连接和TLS握手
+            model_kwargs = dict(
                 model=model,
                 temperature=temperature,
                 max_tokens=max_output_tokens,
                 top_p=top_p,
                 top_k=top_k,
-                api_key=SecretStr(api_key),  # 将 api_key 转换为 SecretStr 类型
+            )
+            llm = llm_client_pool.get(
+                ChatGoogleGenerativeAI,
+                credential=api_key,
+                build=lambda: ChatGoogleGenerativeAI(
+                    api_key=SecretStr(api_key),  # 将 api_key 转换为 SecretStr 类型
+                    **model_kwargs
+                ),
+                **model_kwargs
             )
             
+            # 流式执行时边生成边转发token
+            if streaming_enabled():
+                return {'text': await collect_stream(llm, prompt)}
+
             # 调用模型
-            result = llm.invoke(prompt)
+            result = await llm.ainvoke(prompt)
 
             # 提取文本内容
             text_content = result.content
@@ -3,7 +3,10 @@ Hugging Face Transformers模型接口组件
 支持本地或远程的huggingface模型
 """
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+import asyncio
+import functools
+import json
 import torch
 
 """
@@ -61,6 +64,7 @@ from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 from langchain_community.llms import HuggingFacePipeline
 
 from components.base.component import BaseComponent
+from components.base.microbatch import MicroBatcher, get_micro_batcher
 
 class HuggingFaceComponent(BaseComponent):
     """
@@ -143,6 +147,20 @@ class HuggingFaceComponent(BaseComponent):
                     "default": 512,
                     "description": "最大的生成文本长度"
                 },
+                {
+                    "name": 'batch_size',
+                    "type": 'number',
+                    "required": False,
+                    "default": 4,
+                    "description": "微批处理时一个批次最多包含的提示词数量，同时到达的请求会填充后一起做一次前向计算"
+                },
+                {
+                    "name": 'batch_wait_ms',
+                    "type": 'number',
+                    "required": False,
+                    "default": 20,
+                    "description": "收到第一个提示词后最多再等多少毫秒凑批次，0表示不等待"
+                },
                 {
                     "name": 'load_in_8bit',
                     "type": 'boolean',
@@ -150,73 +168,114 @@ class HuggingFaceComponent(BaseComponent):
                     "default": False,
                     "description": "使用8位精度加载模型以节省内存"
                 }
-            ]
+            ],
+            # 模型不放在组件实例里，而是放在进程内共享的微批处理器里（见_get_batcher），组件实例本身很轻，不需要实例池；
+            # execute只是把提示词交给微批处理器并等待结果，生成在后台线程里进行，不会阻塞事件循环
+            "execution_mode": 'async'
         }
-    
-    def __init__(self):
-        """初始化组件实例"""
-        self.llm = None 
-
-    def _initialize_llm(self, params: Dict[str, Any]):
-        """初始化LLM实例"""
-
-        if self.llm is None:
-            # 从参数中获取配置信息
-            model_id = params.get("model_id")
-            device = params.get("device", "cpu")
-            trust_remote_code = params.get("trust_remote_code", True)
-            temperature = float(params.get("tempurature", 0.7))
-            max_new_tokens = int(params.get("max_new_tokens", 512))
-            load_in_8bit = params.get("load_in_8bit", False)
-
-            # 检查CUDA是否支持
-            if device.startswith("cuda") and not torch.cuda.is_available():
-                print(f"⚠注意：请求在'{device}'设备上运行，但不支持CUDA，已切换至CPU")
-                device = 'cpu'
-
-            # 加载分词器
-            tokenizer = AutoTokenizer.from_pretrained(
+
+    # 这些参数在_load_llm里会被固化到pipeline中，值完全相同的节点共用同一个已加载的模型和微批处理器
+    MODEL_PARAMS = ['model_id', 'device', 'trust_remote_code', 'temperature', 'max_new_tokens', 'load_in_8bit']
+
+    def _get_batcher(self, params: Dict[str, Any]) -> MicroBatcher:
+        """获取这组模型参数对应的微批处理器，不存在时创建（模型在第一次生成时才加载）"""
+        model_params = {name: params[name] for name in self.MODEL_PARAMS if name in params}
+        key = ('huggingface', json.dumps(model_params, sort_keys=True, default=str))
+
+        batcher = get_micro_batcher(key, lambda: MicroBatcher(
+            name=f"HuggingFace({model_params.get('model_id')})",
+            load=functools.partial(self._load_llm, model_params),
+            run_batch=self._generate_batch,
+        ))
+        # 批次大小和等待时间不影响模型本身，以最近一次执行的节点参数为准
+        batcher.configure(
+            batch_size=int(params.get("batch_size", 4)),
+            max_wait_ms=float(params.get("batch_wait_ms", 20)),
+        )
+        return batcher
+
+    @staticmethod
+    def _load_llm(params: Dict[str, Any]) -> HuggingFacePipeline:
+        """加载模型，创建LLM实例，由微批处理器的后台线程调用"""
+
+        # 从参数中获取配置信息
+        model_id = params.get("model_id")
+        device = params.get("device", "cpu")
+        trust_remote_code = params.get("trust_remote_code", True)
+        temperature = float(params.get("temperature", 0.7))
+        max_new_tokens = int(params.get("max_new_tokens", 512))
+        load_in_8bit = params.get("load_in_8bit", False)
+
+        # 检查CUDA是否支持
+        if device.startswith("cuda") and not torch.cuda.is_available():
+            print(f"⚠注意：请求在'{device}'设备上运行，但不支持CUDA，已切换至CPU")
+            device = 'cpu'
+
+        # 加载分词器
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_id,
+            trust_remote_code = trust_remote_code,
+        )
+        # 多个提示词一起生成时需要填充到相同长度，很多因果语言模型没有pad_token，用eos_token代替
+        # 生成模型要在左侧填充，否则新生成的token会接在填充符后面
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = 'left'
+
+        # 准备模型加载配置
+        model_kwargs = {
+            "trust_remote_code": trust_remote_code,
+        }
+
+        if load_in_8bit:
+            if torch.cuda.is_available():
+                model_kwargs["load_in_8bit"] = True
+                model_kwargs["device_map"] = "auto"
+            else:
+                print("⚠注意：8位量化需要CUDA，当前CUDA不可用，请使用默认精度")
+        elif device != 'cpu':
+            model_kwargs["device_map"] = device
+
+        try:
+            model = AutoModelForCausalLM.from_pretrained(
                 model_id,
-                trust_remote_code = trust_remote_code,
+                **model_kwargs
+            )
+
+            # 创建文本生成器
+            text_generation_pipeline = pipeline(
+                "text-generation",
+                model = model,
+                tokenizer = tokenizer,
+                max_new_tokens = max_new_tokens,
+                temperature = temperature,
+                return_full_text = False # 仅返回新生成的文本
             )
 
-            # 准备模型加载配置
-            model_kwargs = {
-                "trust_remote_code": trust_remote_code,
-            }
-
-            if load_in_8bit:
-                if torch.cuda.is_available():
-                    model_kwargs["load_in_8bit"] = True
-                    model_kwargs["device_map"] = "auto"
-                else:
-                    print("⚠注意：8位量化需要CUDA，当前CUDA不可用，请使用默认精度")
-            elif device != 'cpu':
-                model_kwargs["device_map"] = device
-
-            try:
-                model = AutoModelForCausalLM.from_pretrained(
-                    model_id,
-                    **model_kwargs
-                )
-
-                # 创建文本生成器
-                text_generation_pipeline = pipeline(
-                    "text-generation",
-                    model = model,
-                    tokenizer = tokenizer,
-                    max_new_tokens = max_new_tokens,
-                    temperature = temperature,
-                    return_full_text = False # 仅返回新生成的文本
-                )
-
-                # 创建langchain的HuggingfacePipeline
-                # HuggingFacePipeline 来自 langchain_community.llms 模块
-                # 它是一个包装器,可以将Hugging Face的pipeline转换为LangChain兼容的LLM
-                self.llm = HuggingFacePipeline(pipeline=text_generation_pipeline)
-            
-            except Exception as e:
-                raise RuntimeError(f"加载模型'{model_id}'失败：{str(e)}")
+            # 创建langchain的HuggingfacePipeline
+            # HuggingFacePipeline 来自 langchain_community.llms 模块
+            # 它是一个包装器,可以将Hugging Face的pipeline转换为LangChain兼容的LLM
+            return HuggingFacePipeline(pipeline=text_generation_pipeline)
+
+        except Exception as e:
+            raise RuntimeError(f"加载模型'{model_id}'失败：{str(e)}")
+
+    @staticmethod
+    def _generate_batch(llm: HuggingFacePipeline, prompts: List[str]) -> List[str]:
+        """
+        一个批次的提示词做一次前向计算，由微批处理器的后台线程调用
+
+        transformers的pipeline默认batch_size=1，传入列表时也是一个一个生成，LangChain的batch_size只决定怎么切分列表。
+        所以直接调用底层的pipeline，并指定batch_size为整批的大小，分词器把它们左侧填充到相同长度后一起计算
+        """
+        outputs = llm.pipeline(prompts, batch_size=len(prompts))
+        texts = []
+        for output in outputs:
+            # 每个提示词的结果是生成序列的列表（num_return_sequences个），取第一个
+            if isinstance(output, list):
+                output = output[0]
+            texts.append(output["generated_text"])
+        return texts
 
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -236,11 +295,31 @@ class HuggingFaceComponent(BaseComponent):
         # 获取输入的提示词文本
         prompt = inputs.get("prompt", "")
 
-        # 确保LLM已经初始化
-        self._initialize_llm(params)
-
-        # 调用模型生成文本
-        response = self.llm(prompt)
+        # 交给共享的微批处理器，和同时到达的其他提示词凑成一个批次生成
+        response = await self._get_batcher(params).submit(prompt)
 
         # 返回处理结果
         return {"text": response}
+
+    async def execute_batch(self, batch_inputs: List[Dict[str, Any]], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        批量生成文本
+
+        整批提示词一起交给微批处理器，按batch_size分成几个批次，每个批次填充后一起送进模型做一次前向计算，
+        在CPU上比逐个生成的吞吐量高很多
+
+        Args:
+            batch_inputs: 输入数据列表，每一项包含提示文本
+            params: 组件参数数据，包含模型配置
+
+        Returns:
+            List[Dict[str, Any]]: 和输入一一对应的生成文本字典
+        """
+        self.validate_params(params)
+        for inputs in batch_inputs:
+            self.validate_inputs(inputs)
+
+        batcher = self._get_batcher(params)
+        responses = await asyncio.gather(*(batcher.submit(inputs.get("prompt", "")) for inputs in batch_inputs))
+
+        return [{"text": response} for response in responses]
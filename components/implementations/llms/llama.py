@@ -6,6 +6,8 @@ Llama系列模型接口组件
 from typing import Dict, Any, List, Optional
 from langchain_community.llms.llamacpp import LlamaCpp
 from components.base.component import BaseComponent
+from components.base.streaming import streaming_enabled, collect_stream
+from components.base.admission import backend_admission, request_key
 
 class LlamaCppComponent(BaseComponent):
     """使用llama-cpp-python库访问本地部署的Llama模型"""
@@ -67,7 +69,10 @@ class LlamaCppComponent(BaseComponent):
                     "default": 1024,
                     "description": '生成文本的最大长度'
                 }
-            ]
+            ],
+            # 这些参数在initialize里会被固化到LlamaCpp实例中，值相同时工作流引擎会复用已加载模型的实例
+            "init_params": ['model_path', 'n_ctx', 'temperature', 'n_gpu_layers', 'max_tokens'],
+            "execution_mode": 'gil_releasing'
         }
     
     def __init__(self):
@@ -114,10 +119,22 @@ class LlamaCppComponent(BaseComponent):
         prompt = inputs.get("prompt", "")
 
         # 确保LLM已经初始化
-        self._initialize_llm(params)
+        self.initialize(params)
+
+        # 同一个模型文件上的生成经过准入控制：限制并发、排队、合并完全相同的请求
+        model_path = params.get("model_path")
+        admission = backend_admission.get('llamacpp', model_path)
+
+        # 流式执行时边生成边转发token（LlamaCpp的astream会在线程池里逐个生成token）
+        if streaming_enabled():
+            return {"text": await admission.run(lambda: collect_stream(self.llm, prompt))}
+
+        async def generate():
+            # 调用模型生成文本（组件本身在线程池里执行，这里阻塞的是该线程自己的事件循环）
+            return self.llm(prompt)
 
-        # 调用模型生成文本
-        response = self.llm(prompt)
+        init_values = {name: params.get(name) for name in self.get_metadata()["init_params"]}
+        response = await admission.run(generate, request_key=request_key(init_values, prompt))
 
         # 返回处理结果
         return {"text": response}
\ No newline at end of file
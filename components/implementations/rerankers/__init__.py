@@ -0,0 +1,11 @@
+"""
+重排序组件集合
+此模块包含对检索结果重新打分、排序的组件
+"""
+
+from components.base.lazy import lazy_exports
+
+# 组件类在第一次被访问时才导入（见components/base/lazy.py）
+__getattr__, __all__ = lazy_exports(__name__, {
+    "CrossEncoderRerankerComponent": ".cross_encoder",
+})
@@ -0,0 +1,131 @@
+"""
+交叉编码器重排序组件
+用本地的交叉编码器给向量存储的检索结果重新打分，只保留最相关的top_n个
+
+典型用法：
+    向量存储（top_k开大一些，例如20，保证召回） -> 重排序（top_n=3，保证精度） -> LLM
+交给LLM的上下文从20段变成3段，提示词的token数和生成时间都随之下降。
+
+上游组件：FAISSVectorStore、chromavectorstore的results输出，每一项包含page_content、metadata（和score）
+下游组件：把results拼进提示词的链或LLM
+"""
+
+from typing import Any, Dict, List
+
+from components.base.component import BaseComponent
+from components.base.rerankers import rerank_score_cache, score_pairs
+
+
+class CrossEncoderRerankerComponent(BaseComponent):
+    """交叉编码器重排序组件，按(查询, 文本块)的相关性分数重新排序检索结果"""
+
+    @classmethod
+    def get_metadata(cls) -> Dict:
+        return {
+            "name": "CrossEncoderReranker",
+            "type": "reranker",
+            "category": "Rerankers",
+            "description": "用本地交叉编码器给检索结果重新打分，只保留最相关的几个，缩短交给LLM的上下文",
+            "inputs": [
+                {
+                    "name": "query",
+                    "type": "string",
+                    "required": True,
+                    "description": "查询文本"
+                },
+                {
+                    "name": "results",
+                    "type": "list",
+                    "required": True,
+                    "description": "向量存储的检索结果，每一项包含page_content和metadata"
+                }
+            ],
+            "outputs": [
+                {
+                    "name": "results",
+                    "type": "list",
+                    "description": "按相关性分数从高到低排列的前top_n个结果，score为交叉编码器的分数，原来的检索得分保存在retrieval_score里"
+                }
+            ],
+            "params": [
+                {
+                    "name": "model_name",
+                    "type": "string",
+                    "required": False,
+                    "default": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                    "description": "交叉编码器模型名称或本地路径"
+                },
+                {
+                    "name": "top_n",
+                    "type": "number",
+                    "required": False,
+                    "default": 3,
+                    "description": "重排序后保留的结果数量"
+                },
+                {
+                    "name": "batch_size",
+                    "type": "number",
+                    "required": False,
+                    "default": 32,
+                    "description": "每批交给模型打分的文本对数量"
+                },
+                {
+                    "name": "max_length",
+                    "type": "number",
+                    "required": False,
+                    "default": 512,
+                    "description": "查询和文本块拼接后的最大token数，超出的部分被截断"
+                },
+                {
+                    "name": "device",
+                    "type": "string",
+                    "required": False,
+                    "default": "cpu",
+                    "description": "运行设备，例如cpu、cuda"
+                }
+            ],
+            # 模型由components/base/rerankers.py在进程内共享，组件实例本身不需要池化；
+            # 打分是PyTorch的矩阵运算，会释放GIL，放到计算线程池里执行，不阻塞事件循环
+            "execution_mode": 'gil_releasing'
+        }
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行组件的核心处理逻辑
+
+        Args:
+            inputs: 输入数据，包含查询文本和检索结果
+            params: 参数数据，包含模型配置
+
+        Returns:
+            Dict[str, Any]: 包含重排序后的结果列表的字典
+        """
+        # 验证输入和参数
+        self.validate_inputs(inputs)
+        self.validate_params(params)
+
+        query = inputs.get("query", "")
+        top_n = int(params.get("top_n", 3))
+
+        # 只处理带page_content的结果，其他格式的项直接忽略
+        results = [item for item in inputs.get("results") or [] if isinstance(item, dict) and "page_content" in item]
+        if not results or top_n <= 0:
+            return {"results": []}
+
+        scores = score_pairs(
+            params.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            [(query, item["page_content"]) for item in results],
+            batch_size=max(1, int(params.get("batch_size", 32))),
+            device=params.get("device", "cpu"),
+            max_length=int(params.get("max_length", 512)),
+            cache=rerank_score_cache,
+        )
+
+        reranked: List[Dict[str, Any]] = []
+        for item, score in sorted(zip(results, scores), key=lambda pair: pair[1], reverse=True)[:top_n]:
+            reranked_item = {**item, "score": score}
+            if "score" in item:
+                reranked_item["retrieval_score"] = item["score"]
+            reranked.append(reranked_item)
+
+        return {"results": reranked}
@@ -3,11 +3,10 @@
 此模块包含各种文本分割策略的组件
 """
 
-from .character_splitter import CharacterTextSplitterComponent
-from .recursive_splitter import RecursiveTextSplitterComponent
-
-__all__ = [
-    "CharacterTextSplitterComponent",
-    "RecursiveTextSplitterComponent"
-]
+from components.base.lazy import lazy_exports
 
+# 组件类在第一次被访问时才导入（见components/base/lazy.py）
+__getattr__, __all__ = lazy_exports(__name__, {
+    "CharacterTextSplitterComponent": ".character_splitter",
+    "RecursiveTextSplitterComponent": ".recursive_splitter",
+})
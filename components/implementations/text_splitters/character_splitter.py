@@ -57,7 +57,8 @@ class CharacterTextSplitterComponent(BaseComponent):
                     "default": '\n',
                     "description": '分隔文本时使用的分割符'
                 }
-            ]
+            ],
+            "execution_mode": 'cpu'
         }
 
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
@@ -50,7 +50,8 @@ class RecursiveTextSplitterComponent(BaseComponent):
                     "default": 200,
                     "description": '相邻文本块之间的重叠字符数'
                 }
-            ]
+            ],
+            "execution_mode": 'cpu'
         }
 
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
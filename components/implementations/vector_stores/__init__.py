@@ -3,10 +3,10 @@
 此模块包含各种向量存储的实现组件
 """
 
-from .faiss_store import FAISSVectorStoreComponent
-from .chroma_store import ChromaVectorStoreComponent
+from components.base.lazy import lazy_exports
 
-__all__ = [
-    "FAISSVectorStoreComponent",
-    "ChromaVectorStoreComponent"
-]
\ No newline at end of file
+# 组件类在第一次被访问时才导入（见components/base/lazy.py）
+__getattr__, __all__ = lazy_exports(__name__, {
+    "FAISSVectorStoreComponent": ".faiss_store",
+    "ChromaVectorStoreComponent": ".chroma_store",
+})
@@ -0,0 +1,261 @@
+"""
+BM25倒排索引和倒数排名融合（RRF）
+
+向量检索擅长“意思相近”，但对零件号、错误码这种字面上必须一模一样的查询很不灵：
+“E-4012”和“E-4021”在嵌入空间里几乎是同一个点，只能把top_k开得很大，再让LLM从一大段上下文里找。
+混合检索（search_mode为hybrid）在向量索引旁边再放一个BM25倒排索引，两路各取fetch_k个候选，
+用倒数排名融合合并：每个文档的得分是它在各路结果里 1 / (rrf_k + 名次) 的和，两路都靠前的文档排在最前面。
+RRF只看名次，不用把L2距离和BM25分数这两种量纲完全不同的分数归一化到一起。
+
+倒排表用数组保存（CSR格式），而不是“词 -> 字典”的Python对象：
+    vocabulary   词 -> 词编号
+    indptr       第t个词的倒排表是postings[indptr[t]:indptr[t+1]]
+    postings     文档序号（doc_ids里的位置），int32
+    frequencies  词在这个文档里出现的次数，int32
+    doc_lengths  每个文档的词数
+一百万个文档块的倒排表只是几个连续的numpy数组，查询时每个查询词一次向量化的计算，保存成一个npz文件，加载时不用反序列化Python对象。
+
+分词：英文和数字按连续的字母数字切分，“E-4012”“v2.1.0”这样用-_./:连起来的整体保留一个词，同时也拆成各个部分；
+中文没有空格，连续的汉字按单字和相邻两个字各算一个词。
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'[0-9a-z]+(?:[-_./:][0-9a-z]+)*|[\u4e00-\u9fff]+')
+_SEPARATOR = re.compile(r'[-_./:]')
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切成BM25用的词"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if '\u4e00' <= token[0] <= '\u9fff':
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            if _SEPARATOR.search(token):
+                tokens.extend(_SEPARATOR.split(token))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合
+
+    Args:
+        rankings: 各路检索结果的文档ID列表，每一路按相关性从高到低排列
+        k: 平滑常数，越大名次之间的差距越小，60是RRF论文里的取值
+
+    Returns:
+        List[Tuple[str, float]]: 按融合得分从高到低排列的(文档ID, 得分)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """用数组保存倒排表的BM25索引，文档用字符串ID标识"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: 词频饱和参数，越大词频的影响越大
+            b: 文档长度归一化的程度，0表示不考虑文档长度
+        """
+        self.k1 = k1
+        self.b = b
+        # 建索引时数据源（例如Chroma集合）的指纹，由调用方设置，用来发现索引和数据源不一致
+        self.fingerprint = ''
+        self.vocabulary: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int32)
+        self.frequencies = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions
+
+    def _term_ids(self) -> np.ndarray:
+        """每条倒排记录所属的词编号，和postings一一对应"""
+        return np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+
+    def _set_postings(self, terms: np.ndarray, postings: np.ndarray, frequencies: np.ndarray) -> None:
+        """按词编号重新排好倒排记录，生成indptr"""
+        order = np.argsort(terms, kind='stable')
+        counts = np.bincount(terms, minlength=len(self.vocabulary))
+        self.indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.postings = postings[order].astype(np.int32)
+        self.frequencies = frequencies[order].astype(np.int32)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """加入文档，ID已经存在的文档会被替换，同一批里ID重复的只保留最后一个"""
+        latest = dict(zip(ids, texts))
+        ids, texts = list(latest), list(latest.values())
+        replaced = [doc_id for doc_id in ids if doc_id in self._positions]
+        if replaced:
+            self.remove(replaced)
+
+        terms, postings, frequencies, lengths = [], [], [], []
+        start = len(self.doc_ids)
+        for offset, (doc_id, text) in enumerate(zip(ids, texts)):
+            counts = Counter(tokenize(text))
+            for token, count in counts.items():
+                terms.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                postings.append(start + offset)
+                frequencies.append(count)
+            lengths.append(sum(counts.values()))
+            self._positions[doc_id] = start + offset
+            self.doc_ids.append(doc_id)
+        if not lengths:
+            return
+
+        self.doc_lengths = np.concatenate((self.doc_lengths, np.asarray(lengths, dtype=np.int32)))
+        self._set_postings(
+            np.concatenate((self._term_ids(), np.asarray(terms, dtype=np.int32))),
+            np.concatenate((self.postings, np.asarray(postings, dtype=np.int32))),
+            np.concatenate((self.frequencies, np.asarray(frequencies, dtype=np.int32))),
+        )
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """删除文档，不存在的ID会被忽略，返回实际删除的数量"""
+        positions = [self._positions[doc_id] for doc_id in set(ids) if doc_id in self._positions]
+        if not positions:
+            return 0
+
+        keep = np.ones(len(self.doc_ids), dtype=bool)
+        keep[positions] = False
+        # 剩下的文档依次前移，new_positions[旧序号] = 新序号
+        new_positions = np.cumsum(keep, dtype=np.int64) - 1
+        kept_postings = keep[self.postings]
+        terms = self._term_ids()[kept_postings]
+        self._set_postings(
+            terms, new_positions[self.postings[kept_postings]], self.frequencies[kept_postings]
+        )
+
+        self.doc_ids = [doc_id for doc_id, kept in zip(self.doc_ids, keep) if kept]
+        self._positions = {doc_id: position for position, doc_id in enumerate(self.doc_ids)}
+        self.doc_lengths = self.doc_lengths[keep]
+        return len(positions)
+
+    def search(self, query: str, k: int, doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        返回BM25得分最高的k个(文档ID, 得分)，没有任何查询词出现的文档不返回
+
+        Args:
+            doc_ids: 只在这些文档里检索（元数据过滤的结果），None表示不限制
+        """
+        n_docs = len(self.doc_ids)
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not n_docs or not term_ids or k <= 0:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        # 长度归一化的部分对每个查询词都一样，只算一次
+        norms = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(float(self.doc_lengths.mean()), 1.0))
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            df = end - start
+            if not df:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            # 一个词在一个文档里只有一条倒排记录，docs里没有重复，可以直接按下标累加
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norms[docs])
+
+        if doc_ids is not None:
+            allowed = np.zeros(n_docs, dtype=bool)
+            allowed[[self._positions[doc_id] for doc_id in doc_ids if doc_id in self._positions]] = True
+            scores[~allowed] = 0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.doc_ids[position], float(scores[position])) for position in candidates]
+
+    def save(self, path: str) -> None:
+        """原子地保存到npz文件：先写临时文件，写完再替换"""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                k1=np.float64(self.k1),
+                b=np.float64(self.b),
+                fingerprint=np.asarray(self.fingerprint),
+                vocabulary=np.asarray(list(self.vocabulary), dtype=str),
+                doc_ids=np.asarray(self.doc_ids, dtype=str),
+                doc_lengths=self.doc_lengths,
+                indptr=self.indptr,
+                postings=self.postings,
+                frequencies=self.frequencies,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(k1=float(data['k1']), b=float(data['b']))
+            if 'fingerprint' in data.files:  # 旧版本保存的索引没有指纹
+                index.fingerprint = str(data['fingerprint'])
+            index.vocabulary = {token: term_id for term_id, token in enumerate(data['vocabulary'].tolist())}
+            index.doc_ids = data['doc_ids'].tolist()
+            index.doc_lengths = data['doc_lengths']
+            index.indptr = data['indptr']
+            index.postings = data['postings']
+            index.frequencies = data['frequencies']
+        index._positions = {doc_id: position for position, doc_id in enumerate(index.doc_ids)}
+        return index
+
+
+_loaded: "OrderedDict[str, Tuple[Tuple[int, int], BM25Index]]" = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def load_cached(path: str, max_indexes: int = 8) -> Optional[BM25Index]:
+    """
+    只读查询用：按(路径, 修改时间, 大小)缓存加载过的索引，文件被替换以后自然失效；文件不存在时返回None
+
+    返回的索引是共享的，不能调用add、remove，需要修改时用BM25Index.load加载一份自己的
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == key:
+            _loaded.move_to_end(path)
+            return cached[1]
+
+    index = BM25Index.load(path)
+    with _loaded_lock:
+        _loaded[path] = (key, index)
+        _loaded.move_to_end(path)
+        while len(_loaded) > max_indexes:
+            _loaded.popitem(last=False)
+    return index
@@ -2,17 +2,93 @@
 Chroma向量存储组件
 基于Chroma数据库的向量存储实现
 Chroma设计为持久化优先的数据库,默认就会写入磁盘,适合长期存储和增量更新的场景
+
+混合检索用的BM25倒排索引（见bm25.py）保存在persist_directory下的<collection_name>.bm25.npz，
+用文本块的确定性ID（见下面的增量入库）标识文档，每次入库时和集合一起更新：
+    - 写集合和更新BM25索引在同一把文件锁（<collection_name>.bm25.npz.lock）里进行，
+      多个进程同时入库同一个集合时不会互相覆盖对方加进BM25索引的文档
+    - BM25索引里记录了集合的指纹：每个文本块sha256(ID, content_hash)的异或，和文档顺序无关，增量更新时可以直接算出新的指纹。
+      入库时不扫描整个集合：写入前集合的文档数和BM25索引对不上、这一批涉及的ID在集合和BM25索引里的有无对不上、
+      或者索引里没有指纹（上一次入库中途退出、有人绕过这个组件改了集合、旧版本建的索引），才用集合重建BM25索引
+    - 查询时文档数和集合对不上也会重建
+
+元数据过滤（filter输入）翻译成Chroma的where条件，由Chroma自己的元数据索引在检索时过滤；
+混合检索时BM25也只在满足条件的文档里检索，满足条件的ID集合按(BM25索引文件的版本, where)缓存，集合每次变化BM25索引文件都会重写，缓存随之失效
+
+增量入库：
+    原来每次有documents都调用Chroma.from_documents，文档拿到的是随机的uuid，重新跑一遍入库工作流，
+    同样的文本块就在集合里再多一份，集合越来越大、查询越来越慢。
+    现在每个文本块有确定性的ID：元数据里有id_key时用它，否则用(来源, 页码, 文本块偏移)的sha256；
+    内容（文本和元数据）的sha256保存在元数据的content_hash里。入库时按ID upsert：
+        - ID不存在：新增
+        - ID存在、content_hash相同：跳过，不用重新计算向量
+        - ID存在、content_hash不同：替换
+    delete_sources里的来源下、这一批里没有出现的文本块会被删除，重新入库一个改过的文件时把它一起传进去，已经不存在的旧文本块就会被清掉
+    （这个功能之前用随机uuid入库的集合，同样用delete_sources清理一次）。
+    新增、更新、跳过、删除的数量在stats输出里。
 """
 
 
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import reduce
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+import hashlib
+import json
 import os
-import tempfile
-from unittest import result
+import threading
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，只能在进程内加锁
+    fcntl = None
 
 from components.base.component import BaseComponent
+from components.base.embeddings import embed_queries, get_embeddings
+from components.implementations.vector_stores.bm25 import BM25Index, load_cached, reciprocal_rank_fusion
+from components.implementations.vector_stores.metadata_index import to_chroma_where
+
+# 保存文本块内容哈希的元数据字段
+CONTENT_HASH_KEY = "content_hash"
+
+# 没有fcntl时退回的进程内锁
+_local_lock = threading.Lock()
+
+# 满足过滤条件的文档ID：(BM25索引路径, 索引文件的修改时间和大小, where) -> ID集合
+_allowed_cache: "OrderedDict[Tuple[str, Tuple[int, int], str], FrozenSet[str]]" = OrderedDict()
+_allowed_cache_lock = threading.Lock()
+ALLOWED_CACHE_SIZE = 32
+
+
+@contextmanager
+def collection_lock(bm25_path: str):
+    """同一个集合的写入和BM25索引的更新在这把锁里进行，跨进程有效"""
+    if fcntl is None:
+        with _local_lock:
+            yield
+        return
+    with open(f"{bm25_path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _entry_hash(doc_id: str, content_hash: Optional[str]) -> int:
+    return int.from_bytes(hashlib.sha256(f"{doc_id}\n{content_hash or ''}".encode("utf-8")).digest(), "big")
+
+
+def collection_fingerprint(entries: Iterable[Tuple[str, Optional[str]]], base: str = "") -> str:
+    """
+    集合的指纹：各个(ID, content_hash)哈希的异或
+
+    异或和顺序无关，同一个值异或两次会抵消，所以在base上异或被删除的和新加入的文本块，就得到更新后集合的指纹
+    """
+    value = reduce(lambda acc, entry: acc ^ _entry_hash(*entry), entries, int(base or "0", 16))
+    return f"{value:064x}"
+
 
 class ChromaVectorStoreComponent(BaseComponent):
     """Chroma向量存储组件，用于创始和查询持久化向量数据库"""
@@ -32,11 +108,29 @@ class ChromaVectorStoreComponent(BaseComponent):
                     "required": False,
                     "description": "要索引的文档列表，每个文档包含page_content和metadata"
                 },
+                {
+                    "name": "delete_sources",
+                    "type": "list",
+                    "required": False,
+                    "description": "要删除的来源列表，元数据source在列表里、且不在这次documents里的文本块都会被删除"
+                },
                 {
                     "name": "query",
                     "type": "string",
                     "required": False,
                     "description": "查询文本（如果要执行搜索）"
+                },
+                {
+                    "name": "queries",
+                    "type": "list",
+                    "required": False,
+                    "description": "批量查询的文本列表（查询扩展、多跳检索时用），所有查询一次嵌入、一次检索"
+                },
+                {
+                    "name": "filter",
+                    "type": "object",
+                    "required": False,
+                    "description": "按元数据过滤查询结果，例如{\"source\": \"a.pdf\", \"page\": {\"$gte\": 3, \"$lte\": 10}}，支持等于、$in和范围（$gt/$gte/$lt/$lte）"
                 }
             ],
             "outputs": [
@@ -45,10 +139,20 @@ class ChromaVectorStoreComponent(BaseComponent):
                     "type": "object",
                     "description": "创建的向量存储对像（供后续组件使用）"
                 },
+                {
+                    "name": "stats",
+                    "type": "object",
+                    "description": "入库时新增、更新、跳过、删除的文本块数"
+                },
                 {
                     "name": "results",
                     "type": "list",
-                    "description": "查询结果文档列表（如果提供了查询）"
+                    "description": "查询结果文档列表（如果提供了查询），每个结果带score：向量检索为距离，混合检索为融合得分"
+                },
+                {
+                    "name": "batch_results",
+                    "type": "list",
+                    "description": "批量查询的结果，和queries一一对应，每一项为{\"query\": 查询文本, \"results\": 结果列表}"
                 }
             ],
             "params": [
@@ -72,14 +176,48 @@ class ChromaVectorStoreComponent(BaseComponent):
                     "default": "langchain_chroma",
                     "description": "Chroma集合名称"
                 },
+                {
+                    "name": "id_key",
+                    "type": "string",
+                    "required": False,
+                    "default": "id",
+                    "description": "元数据里作为文本块稳定ID的字段，没有这个字段时用来源、页码和文本块偏移的哈希"
+                },
                 {
                     "name": "top_k",
                     "type": "number",
                     "required": False,
                     "default": 5,
                     "description": "查询时返回的最相似的文档数量"
+                },
+                {
+                    "name": "search_mode",
+                    "type": "select",
+                    "required": False,
+                    "default": "vector",
+                    "options": [
+                        {"label": "向量检索", "value": "vector"},
+                        {"label": "混合检索（向量+BM25）", "value": "hybrid"}
+                    ],
+                    "description": "hybrid：向量检索和BM25关键词检索各取fetch_k个候选，用倒数排名融合合并，零件号、错误码这类要求字面匹配的查询用它"
+                },
+                {
+                    "name": "fetch_k",
+                    "type": "number",
+                    "required": False,
+                    "default": 20,
+                    "description": "混合检索时每一路取的候选数，不小于top_k"
+                },
+                {
+                    "name": "rrf_k",
+                    "type": "number",
+                    "required": False,
+                    "default": 60,
+                    "description": "倒数排名融合的平滑常数，越大两路结果的名次差距影响越小"
                 }
-            ]
+            ],
+            # 嵌入模型由embedding_registry在进程内共享（见components/base/embeddings.py），组件实例本身不需要池化
+            "execution_mode": 'gil_releasing'
         }
 
     def __init__(self):
@@ -96,13 +234,247 @@ class ChromaVectorStoreComponent(BaseComponent):
         self.vector_store = None
 
     def _initialize_embeddings(self, model_name):
-        """初始化嵌入模型"""
-        if self.embeddings is None:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name = model_name,
-                cache_folder = os.path.join(tempfile.gettempdir(), "hf_models")
+        """
+        获取嵌入模型：模型本身在所有节点之间只加载一次，
+        算过的文本向量保存在磁盘缓存里，重新入库时只有变化的文本块需要计算
+        """
+        self.embeddings = get_embeddings(model_name)
+
+    def _build_bm25(self) -> BM25Index:
+        """用集合里已有的全部文档建BM25索引，并记录集合的指纹（第一次入库、集合和索引不一致，或者这个功能之前建的集合）"""
+        data = self.vector_store.get(include=["documents", "metadatas"])
+        bm25 = BM25Index()
+        bm25.add(data["ids"], data["documents"])
+        bm25.fingerprint = collection_fingerprint(
+            (doc_id, (metadata or {}).get(CONTENT_HASH_KEY)) for doc_id, metadata in zip(data["ids"], data["metadatas"])
+        )
+        return bm25
+
+    def _update_bm25(
+            self,
+            bm25_path: str,
+            count_before: int,
+            known: Dict[str, bool],
+            written: Dict[str, Any],
+            removed: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        """
+        把集合里刚写入、删除的文档同步到BM25索引并保存，调用方需要持有collection_lock
+
+        Args:
+            count_before: 写入之前集合里的文档数
+            known: 这次查过的ID在写入之前是否在集合里，ID -> bool
+            written: 写入的文档，ID -> Document
+            removed: 被删除或者被替换掉的文本块，[(ID, 原来的content_hash), ...]
+        """
+        bm25 = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else None
+        # 只用已经查到的信息核对，不为此扫描整个集合
+        in_sync = (
+            bm25 is not None and bm25.fingerprint and len(bm25) == count_before
+            and all((doc_id in bm25) == present for doc_id, present in known.items())
+        )
+        if in_sync:
+            bm25.remove([doc_id for doc_id, _ in removed])
+            bm25.add(list(written), [doc.page_content for doc in written.values()])
+            bm25.fingerprint = collection_fingerprint(
+                removed + [(doc_id, doc.metadata[CONTENT_HASH_KEY]) for doc_id, doc in written.items()], bm25.fingerprint
             )
-    
+        else:
+            # 没有索引，或者索引和写入前的集合已经对不上了：集合里已经是更新后的文档，整个重建
+            bm25 = self._build_bm25()
+        bm25.save(bm25_path)
+
+    def _load_bm25(self, bm25_path: str) -> BM25Index:
+        """查询用的BM25索引，没有、或者文档数和集合对不上时在锁里重建"""
+        bm25 = load_cached(bm25_path)
+        if bm25 is not None and len(bm25) == self.vector_store._collection.count():
+            return bm25
+        with collection_lock(bm25_path):
+            # 等锁的时候可能已经有人重建好了
+            bm25 = load_cached(bm25_path)
+            if bm25 is None or len(bm25) != self.vector_store._collection.count():
+                bm25 = self._build_bm25()
+                bm25.save(bm25_path)
+        return bm25
+
+    def _allowed_ids(self, bm25_path: str, where: Dict[str, Any]) -> FrozenSet[str]:
+        """满足过滤条件的文档ID，由Chroma的元数据索引查出来，按BM25索引文件的版本缓存"""
+        stat = os.stat(bm25_path)
+        key = (os.path.abspath(bm25_path), (stat.st_mtime_ns, stat.st_size), json.dumps(where, sort_keys=True, default=str))
+        with _allowed_cache_lock:
+            allowed = _allowed_cache.get(key)
+            if allowed is not None:
+                _allowed_cache.move_to_end(key)
+                return allowed
+
+        allowed = frozenset(self.vector_store.get(where=where, include=[])["ids"])
+        with _allowed_cache_lock:
+            _allowed_cache[key] = allowed
+            while len(_allowed_cache) > ALLOWED_CACHE_SIZE:
+                _allowed_cache.popitem(last=False)
+        return allowed
+
+    @staticmethod
+    def _document_ids(docs: List[Any], id_key: str) -> List[str]:
+        """
+        文本块的确定性ID：元数据里有id_key时用它，否则用(来源, 页码, 文本块偏移)的sha256
+
+        文本块偏移优先用文本分割器的start_index，没有时用这个文本块在同一来源、同一页里的序号
+        """
+        ordinals: Dict[Tuple[Any, Any], int] = {}
+        ids = []
+        for doc in docs:
+            metadata = doc.metadata
+            if metadata.get(id_key) not in (None, ''):
+                ids.append(str(metadata[id_key]))
+                continue
+            location = (metadata.get("source", ""), metadata.get("page", ""))
+            ordinal = ordinals.get(location, 0)
+            ordinals[location] = ordinal + 1
+            offset = metadata.get("start_index", f"#{ordinal}")
+            ids.append(hashlib.sha256(f"{location[0]}\n{location[1]}\n{offset}".encode("utf-8")).hexdigest())
+        return ids
+
+    @staticmethod
+    def _content_hash(doc: Any) -> str:
+        """文本和元数据（不含content_hash本身）的sha256，判断文本块有没有变"""
+        metadata = {key: value for key, value in doc.metadata.items() if key != CONTENT_HASH_KEY}
+        content = json.dumps([doc.page_content, metadata], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _upsert(self, docs: List[Any], inputs: Dict[str, Any], params: Dict[str, Any], bm25_path: str) -> Dict[str, int]:
+        """
+        按确定性ID把文档写入集合：没变的跳过，变了的替换，delete_sources里的旧文本块删除
+
+        整个过程持有集合的文件锁，集合和BM25索引一起更新
+
+        Returns:
+            Dict[str, int]: 新增、更新、跳过、删除的文本块数
+        """
+        id_key = params.get("id_key") or "id"
+
+        # 同一批里ID相同的文档只保留最后一个
+        incoming = {}
+        for doc_id, doc in zip(self._document_ids(docs, id_key), docs):
+            doc.metadata = {**doc.metadata, CONTENT_HASH_KEY: self._content_hash(doc)}
+            incoming[doc_id] = doc
+
+        with collection_lock(bm25_path):
+            return self._upsert_locked(incoming, inputs, bm25_path)
+
+    def _upsert_locked(self, incoming: Dict[str, Any], inputs: Dict[str, Any], bm25_path: str) -> Dict[str, int]:
+        stats = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+        count_before = self.vector_store._collection.count()
+
+        # 集合里已有的文本块的内容哈希，分段查询，避免一次传太多ID
+        existing = {}
+        incoming_ids = list(incoming)
+        for start in range(0, len(incoming_ids), 500):
+            data = self.vector_store.get(ids=incoming_ids[start:start + 500], include=["metadatas"])
+            for doc_id, metadata in zip(data["ids"], data["metadatas"]):
+                existing[doc_id] = (metadata or {}).get(CONTENT_HASH_KEY)
+
+        to_write = {}
+        for doc_id, doc in incoming.items():
+            if doc_id not in existing:
+                stats["added"] += 1
+            elif existing[doc_id] == doc.metadata[CONTENT_HASH_KEY]:
+                stats["skipped"] += 1
+                continue
+            else:
+                stats["updated"] += 1
+            to_write[doc_id] = doc
+
+        # 被删除和被替换的文本块原来的content_hash，用来算更新后的指纹
+        removed = [(doc_id, existing[doc_id]) for doc_id in to_write if doc_id in existing]
+        known = {doc_id: doc_id in existing for doc_id in incoming}
+        delete_sources = list(inputs.get("delete_sources") or [])
+        if delete_sources:
+            data = self.vector_store.get(where={"source": {"$in": delete_sources}}, include=["metadatas"])
+            deleted = [
+                (doc_id, (metadata or {}).get(CONTENT_HASH_KEY))
+                for doc_id, metadata in zip(data["ids"], data["metadatas"]) if doc_id not in incoming
+            ]
+            if deleted:
+                self.vector_store.delete(ids=[doc_id for doc_id, _ in deleted])
+                stats["deleted"] = len(deleted)
+                removed += deleted
+                known.update((doc_id, True) for doc_id, _ in deleted)
+
+        # 只有新的和变了的文本块需要计算向量，Chroma按ID upsert
+        if to_write:
+            self.vector_store.add_documents(list(to_write.values()), ids=list(to_write))
+        if to_write or stats["deleted"]:
+            self._update_bm25(bm25_path, count_before, known, to_write, removed)
+        return stats
+
+    @staticmethod
+    def _hit(content: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """检索结果里的一个文档，content_hash是增量入库内部用的，不返回给下游"""
+        metadata = {key: value for key, value in (metadata or {}).items() if key != CONTENT_HASH_KEY}
+        return {"page_content": content, "metadata": metadata}
+
+    def _search_batch(
+            self,
+            queries: List[str],
+            bm25_path: str,
+            params: Dict[str, Any],
+            where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        一次检索多个查询，返回每个查询的结果列表，每个结果带score
+
+        查询向量用embed_query计算（不进文档的嵌入缓存），再用一次collection.query检索整个查询矩阵。
+        向量检索的得分是Chroma返回的距离（越小越相似）；混合检索时向量检索和BM25检索各取fetch_k个候选，
+        用倒数排名融合合并，得分是融合得分（越大越相关）。where为元数据过滤条件
+        """
+        top_k = int(params.get("top_k", 5))
+        hybrid = params.get("search_mode") == "hybrid"
+        fetch_k = max(int(params.get("fetch_k") or 20), top_k) if hybrid else top_k
+
+        # similarity_search一次只能查一个，返回的Document也不带ID，直接查底层的集合
+        vector_results = self.vector_store._collection.query(
+            query_embeddings=embed_queries(self.embeddings, queries),
+            n_results=fetch_k,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        found = {}
+        for ids, contents, metadatas in zip(
+                vector_results["ids"], vector_results["documents"], vector_results["metadatas"]
+        ):
+            for doc_id, content, metadata in zip(ids, contents, metadatas):
+                found[doc_id] = self._hit(content, metadata)
+
+        if not hybrid:
+            return [
+                [dict(found[doc_id], score=distance) for doc_id, distance in zip(ids, distances)]
+                for ids, distances in zip(vector_results["ids"], vector_results["distances"])
+            ]
+
+        bm25 = self._load_bm25(bm25_path)
+        # BM25只在满足过滤条件的文档里检索
+        allowed = self._allowed_ids(bm25_path, where) if where else None
+
+        fused_per_query = []
+        for query, vector_ids in zip(queries, vector_results["ids"]):
+            keyword_ids = [doc_id for doc_id, _ in bm25.search(query, fetch_k, allowed)]
+            fused_per_query.append(
+                reciprocal_rank_fusion([vector_ids, keyword_ids], int(params.get("rrf_k") or 60))[:top_k]
+            )
+
+        # 只由BM25找到的文档还没有内容，一次取回
+        missing = list({doc_id for fused in fused_per_query for doc_id, _ in fused if doc_id not in found})
+        if missing:
+            data = self.vector_store.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, content, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+                found[doc_id] = self._hit(content, metadata)
+
+        return [
+            [dict(found[doc_id], score=score) for doc_id, score in fused if doc_id in found]
+            for fused in fused_per_query
+        ]
+
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         """
         执行组件的核心处理逻辑
@@ -143,41 +515,37 @@ class ChromaVectorStoreComponent(BaseComponent):
                 ))
 
         # 创建或加载向量存储
-        if docs:
-            # 有新文档，创建或更新
-            self.vector_store = Chroma.from_documents(
-                documents = docs,
-                embedding = self.embeddings,
-                persist_directory = persist_directory,
-                collection_name = collection_name
-            )
-        else:
-            # 没有新文档，加载现有的
-            self.vector_store = Chroma(
-                persist_directory = persist_directory,
-                embedding_function = self.embeddings,
-                collection_name = collection_name
-            )
+        self.vector_store = Chroma(
+            persist_directory = persist_directory,
+            embedding_function = self.embeddings,
+            collection_name = collection_name
+        )
+        bm25_path = os.path.join(persist_directory, f"{collection_name}.bm25.npz")
+        stats = None
+        if docs or inputs.get("delete_sources"):
+            # 有新文档或者要删除的来源，按确定性ID增量更新集合，BM25索引同步更新
+            stats = self._upsert(docs, inputs, params, bm25_path)
 
         # 持久化存储
         self.vector_store.persist()
 
         result = {"vector_store": self.vector_store}
+        if stats is not None:
+            result["stats"] = stats
 
         # 执行查询(如果提供了查询文本)
         query = inputs.get("query")
-        if query and self.vector_store:
-            top_k = int(params.get("top_k", 5))
-            search_results = self.vector_store.similarity_search(query, k = top_k)
-
-            # 格式化查询结果
-            formatted_results = []
-            for doc in search_results:
-                formatted_results.append({
-                    "page_content": doc.page_content,
-                    "metadata": doc.metadata
-                })
-
-            result["results"] = formatted_results
+        queries = list(inputs.get("queries") or [])
+        if (query or queries) and self.vector_store:
+            where = to_chroma_where(inputs.get("filter"))
+            # 单个查询和批量查询放在一起，一次嵌入、一次检索
+            hits = self._search_batch(([query] if query else []) + queries, bm25_path, params, where)
+
+            if query:
+                result["results"] = hits.pop(0)
+            if queries:
+                result["batch_results"] = [
+                    {"query": text, "results": query_hits} for text, query_hits in zip(queries, hits)
+                ]
     
         return result
\ No newline at end of file
@@ -0,0 +1,461 @@
+"""
+FAISS索引的构建和检索参数
+
+FAISS.from_documents建的是IndexFlatL2：精确检索，每次查询都要和所有向量算一遍距离，
+每个向量按float32完整保存。文档块到了百万级以后，查询慢、内存也放不下。这里按index_type选择索引：
+
+    flat      精确检索，适合几十万以内的语料
+    ivf_flat  倒排索引：先用k-means把向量分到nlist个桶里，查询时只搜最近的nprobe个桶；向量仍然完整保存
+    ivf_pq    倒排索引+乘积量化：每个向量压缩成pq_m个子向量的编码（每个pq_nbits位），
+              384维的MiniLM向量从1536字节压到几十字节，代价是距离是近似的
+    hnsw      分层小世界图：不需要训练，召回率高、查询快，但要额外保存图结构（每个向量约hnsw_m*8字节）
+
+倒排索引要先在一部分向量上训练（k-means聚类），训练样本最多取train_sample_size个；
+语料太少、不够训练时退回flat，小语料本来也不需要近似检索。
+
+nprobe、ef_search这些只影响查询的参数不用重建索引，每次执行时按参数设置。
+
+增量更新：
+    文档用稳定的ID作为docstore里的键（元数据里的id字段，没有时用来源和内容的哈希），
+    增量入库时已经存在的文档直接跳过，只有新文档需要计算向量、加进索引。
+    各种索引删除向量的方式不一样：
+        - flat：remove_ids后后面的向量整体前移，编号需要重新对应
+        - 倒排索引：向量带着自己的编号保存，删除不影响其他向量，新向量用add_with_ids接着最大的编号往后编
+        - hnsw：图结构不支持删除节点，只能用剩下的向量重建（新增仍然是增量的）
+
+原子保存：
+    保存时先写一组新版本的文件（index-<版本>.faiss / .pkl），写完以后再用os.replace替换CURRENT文件指向新版本，
+    其他进程读到的要么是完整的旧版本、要么是完整的新版本，不会读到写了一半的文件。
+    旧版本保留一个，给正在加载它的进程留出时间，更早的版本会被删除。
+
+只读查询的索引缓存（FaissIndexCache）：
+    只查询的执行（有load_path、没有documents）原来每次都要FAISS.load_local，把整个索引和docstore重新反序列化一遍。
+    现在按(路径, 当前版本, 文件修改时间)缓存在进程里，索引被重新保存以后自然失效。
+    索引文件用内存映射（mmap）的方式打开，多个worker进程打开同一个索引时共享操作系统的页缓存，不用每个进程各读一份；
+    倒排索引映射的是倒排表，flat和hnsw映射的是向量数据。docstore是pickle，仍然需要在每个进程里加载。
+    缓存的索引是所有执行共享的、只读的，nprobe、ef_search通过每次查询的SearchParameters传入，不修改索引本身。
+
+附属索引：混合检索用的BM25倒排索引（见bm25.py）、元数据过滤用的元数据索引（见metadata_index.py）
+和向量索引是同一个版本的一部分，保存为index-<版本>.<名称>.npz，和.faiss、.pkl一起原子地切换、一起清理，也一起缓存。
+
+元数据过滤：满足条件的编号做成位图（IDSelectorBitmap），随SearchParameters传给FAISS，
+flat、倒排索引、HNSW都在搜索过程中跳过不满足条件的向量，而不是查完再过滤。
+倒排索引仍然只搜nprobe个桶，过滤条件很严格、满足条件的向量很少落在这几个桶里时，返回的结果会少于top_k，这时需要调大nprobe。
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from components.implementations.vector_stores.bm25 import BM25Index
+from components.implementations.vector_stores.metadata_index import MetadataIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+# 和向量索引同一个版本保存的附属索引：名称 -> 类（需要有save(path)和类方法load(path)），文件名为index-<版本>.<名称>.npz
+SIDECARS = {'bm25': BM25Index, 'metadata': MetadataIndex}
+
+
+def _largest_divisor(dim: int, limit: int) -> int:
+    """不超过limit的、能整除dim的最大的数，乘积量化要求子向量个数能整除维度"""
+    for m in range(min(limit, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_factory_string(dim: int, n_vectors: int, params: Dict[str, Any]) -> str:
+    """
+    按参数和语料大小生成faiss.index_factory的描述字符串
+
+    Args:
+        dim: 向量维度
+        n_vectors: 要建索引的向量个数（决定nlist的默认值，以及够不够训练）
+        params: 组件参数，用到index_type、nlist、pq_m、pq_nbits、hnsw_m
+    """
+    index_type = params.get('index_type') or 'flat'
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的index_type：{index_type}，可选值为{', '.join(INDEX_TYPES)}")
+
+    if index_type == 'hnsw':
+        return f"HNSW{int(params.get('hnsw_m') or 32)},Flat"
+
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        # nlist默认取4*sqrt(n)，这是FAISS文档推荐的量级；桶数不能超过向量数
+        nlist = int(params.get('nlist') or 0) or int(4 * math.sqrt(n_vectors))
+        nlist = max(1, min(nlist, n_vectors))
+        if index_type == 'ivf_flat':
+            return f"IVF{nlist},Flat"
+
+        pq_nbits = int(params.get('pq_nbits') or 8)
+        # 每个子量化器要训练2^nbits个聚类中心，向量太少时训练不出来
+        if n_vectors >= 2 ** pq_nbits:
+            pq_m = _largest_divisor(dim, int(params.get('pq_m') or 16))
+            return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+        logger.warning(f"只有{n_vectors}个向量，不够训练{pq_nbits}位的乘积量化，改用flat索引")
+
+    return "Flat"
+
+
+def build_index(vectors: np.ndarray, params: Dict[str, Any]) -> Any:
+    """
+    创建并训练一个空索引（向量由调用方添加）
+
+    Args:
+        vectors: 所有要入库的向量，形状为(n, dim)的float32数组，需要训练时从中抽样
+        params: 组件参数，除了index_factory_string用到的，还有train_sample_size、ef_construction
+    """
+    n_vectors, dim = vectors.shape
+    description = index_factory_string(dim, n_vectors, params)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+
+    if description.startswith('HNSW'):
+        index.hnsw.efConstruction = int(params.get('ef_construction') or 64)
+
+    if not index.is_trained:
+        ivf = faiss.extract_index_ivf(index)
+        # 默认每个桶取256个样本，足够k-means收敛，再多只是拖慢训练
+        sample_size = int(params.get('train_sample_size') or 0) or 256 * ivf.nlist
+        if sample_size < n_vectors:
+            sample = vectors[np.random.default_rng(0).choice(n_vectors, sample_size, replace=False)]
+        else:
+            sample = vectors
+        index.train(np.ascontiguousarray(sample))
+
+    logger.info(f"已创建FAISS索引：{description}，{n_vectors}个向量")
+    return index
+
+
+def apply_search_params(index: Any, params: Dict[str, Any]) -> None:
+    """设置只影响查询的参数：倒排索引的nprobe，HNSW的efSearch"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:  # 不是倒排索引
+        ivf = None
+    if ivf is not None:
+        ivf.nprobe = max(1, min(int(params.get('nprobe') or 8), ivf.nlist))
+        return
+
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, 'hnsw'):
+        hnsw_index.hnsw.efSearch = int(params.get('ef_search') or 64)
+
+
+def search_parameters(index: Any, params: Dict[str, Any], selector: Optional[Any] = None) -> Optional[Any]:
+    """按参数生成一次查询的SearchParameters，不修改索引本身，共享的索引也可以用；selector限定可以返回的编号"""
+    if is_ivf(index):
+        return faiss.SearchParametersIVF(nprobe=max(1, int(params.get('nprobe') or 8)), sel=selector)
+    if hasattr(faiss.downcast_index(index), 'hnsw'):
+        return faiss.SearchParametersHNSW(efSearch=int(params.get('ef_search') or 64), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def search(
+        vector_store: Any,
+        vectors: np.ndarray,
+        k: int,
+        params: Dict[str, Any],
+        labels: Optional[np.ndarray] = None
+) -> List[List[Tuple[str, Any, float]]]:
+    """
+    用查询向量检索，返回每个查询的[(文档ID, 文档, L2距离), ...]
+
+    Args:
+        vector_store: LangChain的FAISS向量存储
+        vectors: 查询向量，形状为(查询数, dim)
+        k: 每个查询返回的文档数
+        params: 组件参数，用到nprobe、ef_search
+        labels: 只在这些编号里检索（元数据过滤的结果，见MetadataIndex.select），None表示不限制
+    """
+    index = vector_store.index
+    if index.ntotal == 0 or (labels is not None and not len(labels)):
+        return [[] for _ in range(len(vectors))]
+
+    selector = None
+    if labels is not None:
+        # 位图里第i位表示编号i是否可以返回，FAISS检查一个编号只要一次位运算
+        mask = np.zeros(int(labels.max()) + 1, dtype=bool)
+        mask[labels] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        # 第一个参数是位图的字节数（不是位数），超出位图的编号一律不返回，FAISS不会读到位图以外的内存
+        # selector只保存了位图的指针，bitmap要一直引用到搜索结束
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+    distances, labels = index.search(
+        np.ascontiguousarray(vectors, dtype=np.float32), k, params=search_parameters(index, params, selector)
+    )
+    results = []
+    for row_distances, row_labels in zip(distances, labels):
+        hits = []
+        for distance, label in zip(row_distances, row_labels):
+            doc_id = vector_store.index_to_docstore_id.get(int(label))
+            if doc_id is None:  # -1表示结果不够k个
+                continue
+            hits.append((doc_id, vector_store.docstore.search(doc_id), float(distance)))
+        results.append(hits)
+    return results
+
+
+def is_ivf(index: Any) -> bool:
+    try:
+        return faiss.extract_index_ivf(index) is not None
+    except RuntimeError:  # 不是倒排索引
+        return False
+
+
+def document_id(page_content: str, metadata: Dict[str, Any], id_key: str = 'id') -> str:
+    """文档的稳定ID：元数据里有id_key时用它，否则用来源和内容的sha256"""
+    if metadata.get(id_key) not in (None, ''):
+        return str(metadata[id_key])
+    source = metadata.get('source', '')
+    return hashlib.sha256(f"{source}\n{page_content}".encode('utf-8')).hexdigest()
+
+
+def add_documents(vector_store: Any, documents: List[Any], vectors: np.ndarray, ids: List[str]) -> None:
+    """
+    把文档和对应的向量加进LangChain的FAISS向量存储
+
+    不用FAISS.add_embeddings：它按index_to_docstore_id的长度给新向量编号，倒排索引删除过向量以后编号会冲突
+    """
+    if not documents:
+        return
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = vector_store.index
+    if is_ivf(index):
+        start = max(vector_store.index_to_docstore_id, default=-1) + 1
+        labels = np.arange(start, start + len(documents), dtype=np.int64)
+        index.add_with_ids(vectors, labels)
+    else:
+        # flat和hnsw的编号就是向量在索引里的位置
+        start = index.ntotal
+        labels = np.arange(start, start + len(documents), dtype=np.int64)
+        index.add(vectors)
+
+    vector_store.docstore.add(dict(zip(ids, documents)))
+    vector_store.index_to_docstore_id.update(zip(labels.tolist(), ids))
+
+
+def delete_documents(vector_store: Any, ids: Iterable[str]) -> int:
+    """从向量存储里删除文档，不存在的ID会被忽略，返回实际删除的数量"""
+    ids = set(ids)
+    mapping = vector_store.index_to_docstore_id
+    labels = {label for label, doc_id in mapping.items() if doc_id in ids}
+    if not labels:
+        return 0
+    removed = [mapping[label] for label in labels]
+
+    index = vector_store.index
+    if is_ivf(index):
+        index.remove_ids(np.fromiter(labels, dtype=np.int64))
+        for label in labels:
+            del mapping[label]
+    else:
+        keep = [label for label in sorted(mapping) if label not in labels]
+        hnsw_index = faiss.downcast_index(index)
+        if hasattr(hnsw_index, 'hnsw'):
+            # HNSW不支持删除，用剩下的向量按原来的参数重建
+            vectors = index.reconstruct_n(0, index.ntotal)[keep]
+            rebuilt = faiss.index_factory(index.d, f"HNSW{hnsw_index.hnsw.nb_neighbors(1)},Flat", faiss.METRIC_L2)
+            rebuilt.hnsw.efConstruction = hnsw_index.hnsw.efConstruction
+            rebuilt.hnsw.efSearch = hnsw_index.hnsw.efSearch
+            rebuilt.add(np.ascontiguousarray(vectors))
+            vector_store.index = rebuilt
+        else:
+            index.remove_ids(np.fromiter(labels, dtype=np.int64))
+        # 删除后剩下的向量依次前移
+        vector_store.index_to_docstore_id = {position: mapping[label] for position, label in enumerate(keep)}
+
+    vector_store.docstore.delete(removed)
+    return len(removed)
+
+
+def current_version(path: str) -> Optional[str]:
+    """目录里当前版本的索引名，没有CURRENT文件时兼容直接用save_local保存的index"""
+    try:
+        with open(os.path.join(path, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        if os.path.exists(os.path.join(path, 'index.faiss')):
+            return 'index'
+        return None
+
+
+def build_bm25(vector_store: Any) -> BM25Index:
+    """用docstore里的文档建BM25索引，兼容还没有.bm25.npz文件的旧索引"""
+    ids = list(vector_store.index_to_docstore_id.values())
+    bm25 = BM25Index()
+    bm25.add(ids, [vector_store.docstore.search(doc_id).page_content for doc_id in ids])
+    return bm25
+
+
+def _sidecar_file(path: str, version: str, name: str) -> str:
+    return os.path.join(path, f'{version}.{name}.npz')
+
+
+def save_store(vector_store: Any, path: str, sidecars: Optional[Dict[str, Any]] = None) -> str:
+    """原子地保存向量存储和它的附属索引（名称 -> 索引，见SIDECARS），返回新版本的索引名"""
+    os.makedirs(path, exist_ok=True)
+    previous = current_version(path)
+    version = f"index-{time.time_ns()}"
+    vector_store.save_local(path, index_name=version)
+    for name, sidecar in (sidecars or {}).items():
+        if sidecar is not None:
+            sidecar.save(_sidecar_file(path, version, name))
+
+    pointer = os.path.join(path, f'CURRENT.{version}.tmp')
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(path, 'CURRENT'))
+
+    # 保留上一个版本，删除更早的版本（同一版本的所有文件都以“版本名.”开头）
+    keep = {version, previous}
+    for name in os.listdir(path):
+        name_version = name.split('.', 1)[0]
+        if name_version.startswith('index-') and name_version not in keep and not name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+    return version
+
+
+def _load_sidecars(path: str, version: str) -> Dict[str, Any]:
+    sidecars = {}
+    for name, sidecar_class in SIDECARS.items():
+        sidecar_file = _sidecar_file(path, version, name)
+        if os.path.exists(sidecar_file):
+            sidecars[name] = sidecar_class.load(sidecar_file)
+    return sidecars
+
+
+def load_store(path: str, embeddings: Any) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    """
+    加载当前版本的向量存储，可以修改后再用save_store保存
+
+    Returns:
+        (向量存储, 附属索引)，附属索引是名称到索引的字典，旧版本没有保存的附属索引不在里面；目录里没有索引时返回None
+    """
+    from langchain_community.vectorstores import FAISS
+
+    version = current_version(path)
+    if version is None:
+        return None
+    # 索引文件是我们自己保存的，可以放心反序列化里面的pickle
+    vector_store = FAISS.load_local(path, embeddings, index_name=version, allow_dangerous_deserialization=True)
+    return vector_store, _load_sidecars(path, version)
+
+
+def _mmap_flags(index_file: str) -> int:
+    """按索引文件开头的类型标记选择内存映射方式：倒排索引（Iw开头）映射倒排表，其余映射向量数据"""
+    with open(index_file, 'rb') as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b'Iw'):
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)  # 较早的FAISS版本不支持映射flat的向量数据
+    return flags | faiss.IO_FLAG_READ_ONLY
+
+
+class FaissIndexCache:
+    """进程内的只读索引缓存，索引以内存映射的方式打开"""
+
+    def __init__(self, max_indexes: int = 8):
+        """
+        Args:
+            max_indexes: 最多缓存多少个索引，按最近使用淘汰
+        """
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[str, Tuple[Tuple, Any, Any, Dict[int, str], Dict[str, Any]]]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_indexes: Optional[int] = None) -> None:
+        """根据配置调整缓存数量，在应用启动时调用"""
+        if max_indexes is not None:
+            self.max_indexes = max_indexes
+
+    @staticmethod
+    def _version_key(path: str) -> Optional[Tuple]:
+        version = current_version(path)
+        if version is None:
+            return None
+        try:
+            stat = os.stat(os.path.join(path, f'{version}.faiss'))
+        except FileNotFoundError:  # 刚好被新版本替换掉了
+            return None
+        return (version, stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path: str, embeddings: Any) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """
+        获取path下当前版本的向量存储和附属索引（都是只读的），返回值同load_store，目录里没有索引时返回None
+
+        返回的FAISS对象每次都是新建的，只是共享了索引、docstore和编号表，所以可以用调用方自己的嵌入模型
+        """
+        from langchain_community.vectorstores import FAISS
+
+        path = os.path.abspath(path)
+        key = self._version_key(path)
+        if key is None:
+            return None
+
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is None or cached[0] != key:
+                load_lock = self._loading.setdefault(path, threading.Lock())
+                cached = None
+            else:
+                self._indexes.move_to_end(path)
+
+        if cached is None:
+            with load_lock:
+                with self._lock:
+                    cached = self._indexes.get(path)
+                if cached is None or cached[0] != key:
+                    cached = self._load(path, key)
+                    with self._lock:
+                        self._indexes[path] = cached
+                        self._indexes.move_to_end(path)
+                        while len(self._indexes) > self.max_indexes:
+                            self._indexes.popitem(last=False)
+
+        _, index, docstore, index_to_docstore_id, sidecars = cached
+        return FAISS(embeddings, index, docstore, index_to_docstore_id), sidecars
+
+    @staticmethod
+    def _load(path: str, key: Tuple) -> Tuple[Tuple, Any, Any, Dict[int, str], Dict[str, Any]]:
+        import pickle
+
+        version = key[0]
+        index_file = os.path.join(path, f'{version}.faiss')
+        index = faiss.read_index(index_file, _mmap_flags(index_file))
+        # 索引文件是我们自己保存的，可以放心反序列化里面的pickle
+        with open(os.path.join(path, f'{version}.pkl'), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        logger.info(f"已加载FAISS索引（内存映射）：{path}，{index.ntotal}个向量")
+        return key, index, docstore, index_to_docstore_id, _load_sidecars(path, version)
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """让指定路径的缓存失效，不传路径则清空全部"""
+        with self._lock:
+            if path is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(os.path.abspath(path), None)
+
+
+# 全局唯一的只读索引缓存
+faiss_index_cache = FaissIndexCache()
@@ -59,25 +59,33 @@ FAISS向量存储的处理流程:
    [
      {
        "page_content": "匹配的文本片段",
-       "metadata": {"相关元数据"}
+       "metadata": {"相关元数据"},
+       "score": 0.42
      }
    ]
 
 这种组件化设计让FAISS可以灵活地集成到不同的应用场景中。
 """
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import os
-import tempfile
 # 这里可以直接导入FAISS是因为langchain_community已经将faiss作为依赖项打包在内
 # 当我们安装langchain_community时,它会自动安装faiss-cpu作为依赖
 # 但如果要直接使用faiss库的底层功能,则需要单独安装:
 # pip install faiss-cpu  # CPU版本
 # pip install faiss-gpu  # GPU版本(需要CUDA支持)
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+import numpy as np
 
 from components.base.component import BaseComponent
+from components.base.embeddings import embed_queries, get_embeddings
+from components.implementations.vector_stores.bm25 import BM25Index, reciprocal_rank_fusion
+from components.implementations.vector_stores.faiss_index import (
+    add_documents, apply_search_params, build_bm25, build_index, delete_documents, document_id, faiss_index_cache,
+    load_store, save_store, search
+)
+from components.implementations.vector_stores.metadata_index import MetadataIndex, normalize_filter
 
 class FAISSVectorStoreComponent(BaseComponent):
     """FAISS向量存储组件，用于创建和查询向量数据库"""
@@ -93,14 +101,38 @@ class FAISSVectorStoreComponent(BaseComponent):
                 {
                     "name": "documents",
                     "type": "list",
-                    "required": True,
+                    "required": False,
                     "description": "要索引的文档列表，每个文档包含page_content和metadata"
                 },
+                {
+                    "name": "delete_ids",
+                    "type": "list",
+                    "required": False,
+                    "description": "增量更新时要删除的文档ID列表"
+                },
+                {
+                    "name": "delete_sources",
+                    "type": "list",
+                    "required": False,
+                    "description": "增量更新时要删除的来源列表，元数据source在列表里的文档都会被删除"
+                },
                 {
                     "name": "query",
                     "type": "str",
                     "required": False,
                     "description": "查询文本(可选，是否要执行搜索)"
+                },
+                {
+                    "name": "queries",
+                    "type": "list",
+                    "required": False,
+                    "description": "批量查询的文本列表(查询扩展、多跳检索时用)，所有查询一次嵌入、一次检索"
+                },
+                {
+                    "name": "filter",
+                    "type": "object",
+                    "required": False,
+                    "description": "按元数据过滤查询结果，例如{\"source\": \"a.pdf\", \"page\": {\"$gte\": 3, \"$lte\": 10}}，支持等于、$in和范围（$gt/$gte/$lt/$lte）"
                 }
             ],
             "outputs": [
@@ -112,7 +144,17 @@ class FAISSVectorStoreComponent(BaseComponent):
                 {
                     "name": "results",
                     "type": "list",
-                    "description": "查询结果文档列表(如果提供了查询)"
+                    "description": "查询结果文档列表(如果提供了查询)，每个结果带score：向量检索为L2距离，混合检索为融合得分"
+                },
+                {
+                    "name": "batch_results",
+                    "type": "list",
+                    "description": "批量查询的结果，和queries一一对应，每一项为{\"query\": 查询文本, \"results\": 结果列表}"
+                },
+                {
+                    "name": "stats",
+                    "type": "object",
+                    "description": "增量更新时新增、更新、跳过、删除的文档数"
                 }
             ],
             "params": [
@@ -141,22 +183,325 @@ class FAISSVectorStoreComponent(BaseComponent):
                     "required": False,
                     "default": 5,
                     "description": "查询时返回的最相似的文档数量"
+                },
+                {
+                    "name": "search_mode",
+                    "type": "select",
+                    "required": False,
+                    "default": "vector",
+                    "options": [
+                        {"label": "向量检索", "value": "vector"},
+                        {"label": "混合检索（向量+BM25）", "value": "hybrid"}
+                    ],
+                    "description": "hybrid：向量检索和BM25关键词检索各取fetch_k个候选，用倒数排名融合合并，零件号、错误码这类要求字面匹配的查询用它"
+                },
+                {
+                    "name": "fetch_k",
+                    "type": "number",
+                    "required": False,
+                    "default": 20,
+                    "description": "混合检索时每一路取的候选数，不小于top_k"
+                },
+                {
+                    "name": "rrf_k",
+                    "type": "number",
+                    "required": False,
+                    "default": 60,
+                    "description": "倒数排名融合的平滑常数，越大两路结果的名次差距影响越小"
+                },
+                {
+                    "name": "mode",
+                    "type": "select",
+                    "required": False,
+                    "default": "build",
+                    "options": [
+                        {"label": "新建/加载", "value": "build"},
+                        {"label": "增量更新", "value": "upsert"}
+                    ],
+                    "description": "build：有load_path时加载，否则用documents新建；upsert：在save_path的索引上增加、删除文档并保存"
+                },
+                {
+                    "name": "id_key",
+                    "type": "string",
+                    "required": False,
+                    "default": "id",
+                    "description": "元数据里作为文档稳定ID的字段，文档没有这个字段时用来源和内容的哈希"
+                },
+                {
+                    "name": "index_type",
+                    "type": "select",
+                    "required": False,
+                    "default": "flat",
+                    "options": [
+                        {"label": "Flat（精确检索）", "value": "flat"},
+                        {"label": "IVF-Flat（倒排索引）", "value": "ivf_flat"},
+                        {"label": "IVF-PQ（倒排索引+乘积量化）", "value": "ivf_pq"},
+                        {"label": "HNSW（图索引）", "value": "hnsw"}
+                    ],
+                    "description": "新建索引时使用的索引类型，语料到了百万级时用ivf_pq或hnsw（加载已有索引时以保存的类型为准）"
+                },
+                {
+                    "name": "nlist",
+                    "type": "number",
+                    "required": False,
+                    "default": 0,
+                    "description": "倒排索引的桶数，0表示按语料大小自动选择（约4*sqrt(n)）"
+                },
+                {
+                    "name": "nprobe",
+                    "type": "number",
+                    "required": False,
+                    "default": 8,
+                    "description": "倒排索引查询时搜索的桶数，越大召回率越高、查询越慢"
+                },
+                {
+                    "name": "pq_m",
+                    "type": "number",
+                    "required": False,
+                    "default": 16,
+                    "description": "乘积量化的子向量个数（每个向量压缩后的编码长度），需要能整除向量维度，不能整除时自动取较小的约数"
+                },
+                {
+                    "name": "pq_nbits",
+                    "type": "number",
+                    "required": False,
+                    "default": 8,
+                    "description": "乘积量化每个子向量编码的位数"
+                },
+                {
+                    "name": "hnsw_m",
+                    "type": "number",
+                    "required": False,
+                    "default": 32,
+                    "description": "HNSW图里每个节点的邻居数，越大召回率越高、内存占用越大"
+                },
+                {
+                    "name": "ef_construction",
+                    "type": "number",
+                    "required": False,
+                    "default": 64,
+                    "description": "HNSW建图时的搜索宽度"
+                },
+                {
+                    "name": "ef_search",
+                    "type": "number",
+                    "required": False,
+                    "default": 64,
+                    "description": "HNSW查询时的搜索宽度，越大召回率越高、查询越慢"
+                },
+                {
+                    "name": "train_sample_size",
+                    "type": "number",
+                    "required": False,
+                    "default": 0,
+                    "description": "训练倒排索引时最多使用的向量个数，0表示每个桶256个"
                 }
-            ]
+            ],
+            # 嵌入模型由embedding_registry在进程内共享（见components/base/embeddings.py），组件实例本身不需要池化
+            "execution_mode": 'gil_releasing'
         }
 
     def __init__(self):
         """初始化组件实例"""
         self.embeddings = None
         self.vector_store = None
+        self.bm25 = None
+        self.metadata_index = None
     
     def _initialize_embeddings(self, model_name):
-        """初始化嵌入模型"""
-        if self.embeddings is None:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name = model_name,
-                cache_folder = os.path.join(tempfile.gettempdir(), "hf_models")
-            )
+        """
+        获取嵌入模型：模型本身在所有节点之间只加载一次，
+        算过的文本向量保存在磁盘缓存里，重新入库时只有变化的文本块需要计算
+        """
+        self.embeddings = get_embeddings(model_name)
+
+    def _build_vector_store(self, docs: List[Any], params: Dict[str, Any], ids: Optional[List[str]] = None) -> FAISS:
+        """
+        按index_type新建向量存储
+
+        FAISS.from_documents只能建精确检索的IndexFlatL2，这里先算出所有向量，
+        用它们训练（需要时）按参数选出的索引，再把向量和文档一起加进去。
+        文档以稳定的ID保存（见faiss_index.document_id），之后可以在这个索引上增量更新。
+        同时建好混合检索用的BM25索引和元数据过滤用的元数据索引，放在self.bm25、self.metadata_index里
+        """
+        if ids is None:
+            id_key = params.get("id_key") or "id"
+            unique = {document_id(doc.page_content, doc.metadata, id_key): doc for doc in docs}
+            ids, docs = list(unique), list(unique.values())
+        texts = [doc.page_content for doc in docs]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+        vector_store = FAISS(
+            embedding_function = self.embeddings,
+            index = build_index(vectors, params),
+            docstore = InMemoryDocstore(),
+            index_to_docstore_id = {}
+        )
+        add_documents(vector_store, docs, vectors, ids)
+
+        self.bm25 = BM25Index()
+        self.bm25.add(ids, texts)
+        self.metadata_index = MetadataIndex.from_store(vector_store)
+        return vector_store
+
+    def _sidecars(self) -> Dict[str, Any]:
+        """和向量索引一起保存的附属索引"""
+        return {"bm25": self.bm25, "metadata": self.metadata_index}
+
+    @staticmethod
+    def _to_documents(documents: List[Any]) -> List[Any]:
+        """把上游传来的字典转换为LangChain的Document"""
+        from langchain_core.documents import Document
+        docs = []
+        for doc in documents:
+            if isinstance(doc, dict) and "page_content" in doc:
+                docs.append(Document(
+                    page_content = doc["page_content"],
+                    metadata = doc.get("metadata", {})
+                ))
+        return docs
+
+    def _upsert(self, docs: List[Any], inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, int]:
+        """
+        增量更新save_path（没有时用load_path）下的索引
+
+        - delete_ids里的文档、以及元数据source在delete_sources里的文档被删除
+        - 新文档加进索引；ID已经存在的文档，内容和元数据都没变就跳过，变了就替换
+        - 索引还不存在时按index_type新建
+
+        Returns:
+            Dict[str, int]: 新增、更新、跳过、删除的文档数
+        """
+        path = params.get("save_path") or params.get("load_path")
+        if not path:
+            raise ValueError("增量更新（mode为upsert）需要提供save_path或load_path")
+        id_key = params.get("id_key") or "id"
+        stats = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0}
+
+        # 同一批里ID相同的文档只保留最后一个
+        incoming = {document_id(doc.page_content, doc.metadata, id_key): doc for doc in docs}
+
+        loaded = load_store(path, self.embeddings) if os.path.exists(path) else None
+        if loaded is None:
+            if not incoming:
+                return stats
+            self.vector_store = self._build_vector_store(list(incoming.values()), params, list(incoming))
+            stats["added"] = len(incoming)
+            save_store(self.vector_store, path, self._sidecars())
+            faiss_index_cache.invalidate(path)
+            return stats
+        self.vector_store, sidecars = loaded
+        self.bm25 = sidecars.get("bm25")
+        if self.bm25 is None:
+            # 这个功能之前保存的索引没有BM25索引，趁这次更新补上
+            self.bm25 = build_bm25(self.vector_store)
+
+        existing = set(self.vector_store.index_to_docstore_id.values())
+
+        # 要删除的文档
+        to_delete = set(inputs.get("delete_ids") or []) & existing
+        delete_sources = set(inputs.get("delete_sources") or [])
+        if delete_sources:
+            for doc_id in existing:
+                doc = self.vector_store.docstore.search(doc_id)
+                if getattr(doc, "metadata", {}).get("source") in delete_sources:
+                    to_delete.add(doc_id)
+
+        # 已经存在的文档：没变的跳过，变了的先删掉再重新加
+        to_add = {}
+        for doc_id, doc in incoming.items():
+            if doc_id in existing and doc_id not in to_delete:
+                old = self.vector_store.docstore.search(doc_id)
+                if old.page_content == doc.page_content and old.metadata == doc.metadata:
+                    stats["skipped"] += 1
+                    continue
+                to_delete.add(doc_id)
+                stats["updated"] += 1
+            else:
+                stats["added"] += 1
+            to_add[doc_id] = doc
+
+        stats["deleted"] = delete_documents(self.vector_store, to_delete) - stats["updated"]
+        self.bm25.remove(to_delete)
+
+        # 只有新的和变了的文档需要计算向量
+        if to_add:
+            texts = [doc.page_content for doc in to_add.values()]
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            add_documents(self.vector_store, list(to_add.values()), vectors, list(to_add))
+            self.bm25.add(list(to_add), texts)
+
+        if to_add or to_delete:
+            # flat和hnsw删除文档后编号会变，元数据索引按更新后的编号重建
+            self.metadata_index = MetadataIndex.from_store(self.vector_store)
+            save_store(self.vector_store, path, self._sidecars())
+            faiss_index_cache.invalidate(path)
+        return stats
+
+    def _filter_labels(self, filter: Any) -> Optional[np.ndarray]:
+        """满足元数据过滤条件的FAISS编号，没有过滤条件时返回None"""
+        conditions = normalize_filter(filter)
+        if not conditions:
+            return None
+        if self.metadata_index is None:
+            # 没有保存元数据索引的旧索引：临时用docstore建一个，重新保存一次索引以后就不用每次都建了
+            self.metadata_index = MetadataIndex.from_store(self.vector_store)
+        return self.metadata_index.select(conditions)
+
+    def _search_batch(
+            self,
+            queries: List[str],
+            params: Dict[str, Any],
+            labels: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[Any, float]]]:
+        """
+        一次检索多个查询，返回每个查询的[(文档, 得分), ...]
+
+        查询向量用embed_query计算（不进文档的嵌入缓存），再用一次FAISS search检索整个查询矩阵，
+        比逐个查询调用similarity_search快得多。向量检索的得分是L2距离（越小越相似，和LangChain的FAISS一致）；
+        混合检索时向量检索和BM25检索各取fetch_k个候选，用倒数排名融合合并，得分是融合得分（越大越相关）。
+
+        Args:
+            queries: 查询文本列表
+            params: 组件参数，用到top_k、search_mode、fetch_k、rrf_k，以及nprobe、ef_search
+            labels: 只在这些编号里检索（元数据过滤的结果），None表示不限制
+        """
+        top_k = int(params.get("top_k", 5))
+        hybrid = params.get("search_mode") == "hybrid"
+        fetch_k = max(int(params.get("fetch_k") or 20), top_k) if hybrid else top_k
+
+        # 查询参数（nprobe、ef_search）随这次查询传入，不修改可能被共享的索引
+        vectors = np.asarray(embed_queries(self.embeddings, queries), dtype=np.float32)
+        vector_hits = search(self.vector_store, vectors, fetch_k, params, labels)
+        if not hybrid:
+            return [[(doc, distance) for _, doc, distance in hits] for hits in vector_hits]
+
+        if self.bm25 is None:
+            # 没有保存BM25索引的旧索引：临时用docstore建一个，重新保存一次索引以后就不用每次都建了
+            self.bm25 = build_bm25(self.vector_store)
+        allowed = None
+        if labels is not None:
+            allowed = [self.vector_store.index_to_docstore_id[label] for label in labels.tolist()]
+
+        results = []
+        for query, hits in zip(queries, vector_hits):
+            vector_ids = [doc_id for doc_id, _, _ in hits]
+            keyword_ids = [doc_id for doc_id, _ in self.bm25.search(query, fetch_k, allowed)]
+            fused = reciprocal_rank_fusion([vector_ids, keyword_ids], int(params.get("rrf_k") or 60))[:top_k]
+            results.append([(self.vector_store.docstore.search(doc_id), score) for doc_id, score in fused])
+        return results
+
+    @staticmethod
+    def _format_results(hits: List[Tuple[Any, float]]) -> List[Dict[str, Any]]:
+        """把检索结果转换成下游组件用的字典"""
+        return [
+            {
+                "page_content": doc.page_content,
+                "metadata": doc.metadata,
+                "score": score
+            }
+            for doc, score in hits
+        ]
 
     async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -178,52 +523,59 @@ class FAISSVectorStoreComponent(BaseComponent):
         embedding_model = params.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
 
         # 初始化嵌入模型
-        self._initiallize_embeddings(embedding_model)
+        self._initialize_embeddings(embedding_model)
+
+        # 实例可能被工作流引擎复用，不能沿用上一次执行留下的向量存储
+        self.vector_store = None
+        self.bm25 = None
+        self.metadata_index = None
+        result = {}
 
-        # 检查是否需要加载现有向量存储
-        load_path = params.get("load_path")
-        if load_path and os.path.exists(load_path):
-            self.vector_store = FAISS.load_local(load_path, self.embeddings)
+        # 转换文档格式为langchain的Document对象
+        docs = self._to_documents(inputs.get('documents') or [])
+
+        if params.get("mode", "build") == "upsert":
+            # 增量更新：在已有的索引上增加、删除文档，然后原子地保存回去
+            result["stats"] = self._upsert(docs, inputs, params)
         else:
-            # 获取输入文档
-            documents = inputs.get('documents', [])
-
-            # 转换文档格式为langchain的Document对象
-            from langchain_core.documents import Document
-            docs = []
-            for doc in documents:
-                if isinstance(doc,dict) and "page_content" in doc:
-                    docs.append(Document(
-                        page_content = doc["page_content"],
-                        metadata = doc.get("metadata", {})
-                    ))
-            
-            # 创建向量存储
-            if docs:
-                self.vector_store = FAISS.from_documents(docs, self.embeddings)
-
-                # 保存向量存储（如果指定了保存路径）
-                save_path = params.get("seve_path")
+            # 检查是否需要加载现有向量存储
+            load_path = params.get("load_path")
+            if load_path and os.path.exists(load_path):
+                # 只读查询：从进程内的索引缓存取，索引文件以内存映射的方式打开，多个进程共享页缓存
+                loaded = faiss_index_cache.get(load_path, self.embeddings)
+                if loaded is not None:
+                    self.vector_store, sidecars = loaded
+                    self.bm25 = sidecars.get("bm25")
+                    self.metadata_index = sidecars.get("metadata")
+            elif docs:
+                # 创建向量存储
+                self.vector_store = self._build_vector_store(docs, params)
+
+                # 保存向量存储（如果指定了保存路径），索引类型和训练结果一起保存，加载时不用重新训练
+                save_path = params.get("save_path")
                 if save_path:
-                    os.makedirs(os.path.dirname(save_path), exist_ok = True)
-                    self.vector_store.save_local(save_path)
+                    save_store(self.vector_store, save_path, self._sidecars())
+                    faiss_index_cache.invalidate(save_path)
+                # 新建的索引是这次执行自己的，把nprobe、ef_search设置到索引上，下游组件直接调用similarity_search时也生效
+                apply_search_params(self.vector_store.index, params)
         
-        result = {"vector_store": self.vector_store}
+        result["vector_store"] = self.vector_store
 
         # 执行查询(如果提供了查询文本)
         query = inputs.get('query')
-        if query and self.vector_store:
-            top_k = int(params.get("top_k", 5))
-            search_results = self.vector_store.similarity_search(query, k = top_k)
-
-            # 格式化查询结果
-            formatted_results = []
-            for doc in search_results:
-                formatted_results.append({
-                    "page_content": doc.page_content,
-                    "metadata": doc.metadata
-                })
-
-            result["results"] = formatted_results
+        queries = list(inputs.get('queries') or [])
+        if (query or queries) and self.vector_store:
+            # 元数据过滤在FAISS搜索的过程中进行，返回的top_k个结果都满足条件
+            labels = self._filter_labels(inputs.get("filter"))
+            # 单个查询和批量查询放在一起，一次嵌入、一次检索
+            hits = self._search_batch(([query] if query else []) + queries, params, labels)
+
+            if query:
+                result["results"] = self._format_results(hits.pop(0))
+            if queries:
+                result["batch_results"] = [
+                    {"query": text, "results": self._format_results(query_hits)}
+                    for text, query_hits in zip(queries, hits)
+                ]
 
         return result
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+元数据过滤
+
+向量存储组件的filter输入按元数据限定检索范围，只在某个文件、某个页码范围里找：
+
+    {"source": "manual.pdf"}                               等于
+    {"source": {"$in": ["a.pdf", "b.pdf"]}}                在列表里（直接写列表也可以：{"source": ["a.pdf", "b.pdf"]}）
+    {"page": {"$gte": 10, "$lt": 20}}                      范围，$gt、$gte、$lt、$lte可以组合
+    {"source": "manual.pdf", "page": {"$lte": 5}}          多个条件同时满足
+
+原来只能把top_k开大、查完以后在Python里过滤，过滤条件越严格丢掉的结果越多，最后退化成暴力扫描。
+现在在入库时建一个元数据索引（MetadataIndex）：每个字段的每个取值对应一组FAISS编号（按CSR格式保存在数组里），
+查询时先算出满足条件的编号集合，做成位图交给FAISS，在ANN搜索的过程中就跳过不满足条件的向量，返回的top_k个都满足条件。
+范围条件用按取值排好序的数组二分查找。
+取值按(类型, 值)区分：True和1在Python里相等、哈希也相同，但{"flag": true}不应该匹配到flag为1的文档；
+整数和小数都算数字，1和1.0是同一个取值。条件里的值只能是字符串、数字、布尔值（$in是它们的列表）。
+
+Chroma自己就有元数据索引，filter翻译成Chroma的where条件（to_chroma_where）传给它。
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+OPERATORS = ('$eq', '$in', '$gt', '$gte', '$lt', '$lte')
+_RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte')
+# 只有这些类型的取值会被索引，列表、字典这类取值的字段不能用来过滤
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+def _slot_key(value: Any) -> Tuple[str, Any]:
+    """取值在索引里的键，True和1要分开，1和1.0是同一个"""
+    if isinstance(value, bool):
+        return 'bool', value
+    if isinstance(value, (int, float)):
+        return 'number', value
+    return 'str', value
+
+
+def normalize_filter(filter: Any) -> List[Tuple[str, str, Any]]:
+    """
+    把filter解析成(字段, 运算符, 值)的列表，filter可以是字典或者JSON字符串，空值表示不过滤
+
+    Raises:
+        ValueError: filter的格式不对、用了不支持的运算符，或者条件里的值不是字符串、数字、布尔值
+    """
+    if not filter:
+        return []
+    if isinstance(filter, str):
+        try:
+            filter = json.loads(filter)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"filter不是合法的JSON：{str(e)}")
+    if not isinstance(filter, dict):
+        raise ValueError("filter必须是字段到条件的字典")
+
+    conditions = []
+    for field, condition in filter.items():
+        if isinstance(condition, dict):
+            for op, value in condition.items():
+                if op not in OPERATORS:
+                    raise ValueError(f"filter里不支持的运算符：{op}，可选值为{', '.join(OPERATORS)}")
+                if op == '$in' and not isinstance(value, (list, tuple)):
+                    raise ValueError(f"{field}的$in条件需要一个列表")
+                if op in _RANGE_OPERATORS and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    raise ValueError(f"{field}的{op}条件需要一个数字")
+                conditions.append((field, op, list(value) if op == '$in' else value))
+        elif isinstance(condition, (list, tuple)):
+            conditions.append((field, '$in', list(condition)))
+        else:
+            conditions.append((field, '$eq', condition))
+
+    for field, op, value in conditions:
+        values = value if op == '$in' else [value]
+        if not all(isinstance(v, _SCALAR_TYPES) for v in values):
+            raise ValueError(f"{field}的条件只能是字符串、数字或布尔值")
+    return conditions
+
+
+def to_chroma_where(filter: Any) -> Optional[Dict[str, Any]]:
+    """把filter翻译成Chroma的where条件，不过滤时返回None"""
+    clauses = [{field: {op: value}} for field, op, value in normalize_filter(filter)]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataIndex:
+    """元数据字段取值到FAISS编号的索引"""
+
+    def __init__(self):
+        # 字段 -> ((类型, 取值) -> 槽位, indptr, labels)，第i个取值的编号是labels[indptr[i]:indptr[i+1]]，按编号排好序
+        self.fields: Dict[str, Tuple[Dict[Any, int], np.ndarray, np.ndarray]] = {}
+        # 字段 -> (排好序的数值, 对应的编号)，第一次按这个字段做范围查询时生成
+        self._numeric: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[int, Dict[str, Any]]]) -> 'MetadataIndex':
+        """
+        Args:
+            items: (FAISS编号, 元数据)
+        """
+        grouped: Dict[str, Dict[Any, List[int]]] = {}
+        for label, metadata in items:
+            for field, value in (metadata or {}).items():
+                if isinstance(value, _SCALAR_TYPES):
+                    grouped.setdefault(field, {}).setdefault(_slot_key(value), []).append(label)
+
+        index = cls()
+        for field, values in grouped.items():
+            slots = {key: slot for slot, key in enumerate(values)}
+            counts = [len(labels) for labels in values.values()]
+            labels = [np.sort(np.asarray(labels, dtype=np.int64)) for labels in values.values()]
+            index.fields[field] = (
+                slots,
+                np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+                np.concatenate(labels),
+            )
+        return index
+
+    @classmethod
+    def from_store(cls, vector_store: Any) -> 'MetadataIndex':
+        """用LangChain的FAISS向量存储里的文档建索引"""
+        docstore = vector_store.docstore
+        return cls.build(
+            (label, docstore.search(doc_id).metadata) for label, doc_id in vector_store.index_to_docstore_id.items()
+        )
+
+    def _labels(self, field: str, value: Any) -> np.ndarray:
+        slots, indptr, labels = self.fields[field]
+        slot = slots.get(_slot_key(value))
+        if slot is None:
+            return np.zeros(0, dtype=np.int64)
+        return labels[indptr[slot]:indptr[slot + 1]]
+
+    def _numeric_values(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        numeric = self._numeric.get(field)
+        if numeric is None:
+            slots, indptr, labels = self.fields[field]
+            values, parts = [], []
+            for (kind, value), slot in slots.items():
+                if kind == 'number':
+                    part = labels[indptr[slot]:indptr[slot + 1]]
+                    values.append(np.full(len(part), value, dtype=np.float64))
+                    parts.append(part)
+            if values:
+                values, parts = np.concatenate(values), np.concatenate(parts)
+                order = np.argsort(values, kind='stable')
+                numeric = (values[order], parts[order])
+            else:
+                numeric = (np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64))
+            self._numeric[field] = numeric
+        return numeric
+
+    def select(self, conditions: List[Tuple[str, str, Any]]) -> np.ndarray:
+        """返回满足全部条件的FAISS编号（排好序、没有重复）"""
+        selected: Optional[np.ndarray] = None
+        for field, op, value in conditions:
+            if field not in self.fields:
+                return np.zeros(0, dtype=np.int64)
+            if op == '$eq':
+                labels = self._labels(field, value)
+            elif op == '$in':
+                parts = [self._labels(field, v) for v in value]
+                labels = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            else:
+                values, numeric_labels = self._numeric_values(field)
+                if op in ('$gt', '$gte'):
+                    start = np.searchsorted(values, value, side='right' if op == '$gt' else 'left')
+                    labels = np.sort(numeric_labels[start:])
+                else:
+                    end = np.searchsorted(values, value, side='left' if op == '$lt' else 'right')
+                    labels = np.sort(numeric_labels[:end])
+            selected = labels if selected is None else np.intersect1d(selected, labels, assume_unique=True)
+            if not len(selected):
+                break
+        return selected if selected is not None else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: str) -> None:
+        """原子地保存到npz文件：先写临时文件，写完再替换"""
+        arrays = {}
+        # 取值可能是字符串、数字、布尔值，按JSON编码保存，加载时还原成原来的类型
+        arrays['fields'] = np.asarray(list(self.fields), dtype=str)
+        for i, (slots, indptr, labels) in enumerate(self.fields.values()):
+            arrays[f'values_{i}'] = np.asarray([json.dumps(value, ensure_ascii=False) for _, value in slots], dtype=str)
+            arrays[f'indptr_{i}'] = indptr
+            arrays[f'labels_{i}'] = labels
+
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'MetadataIndex':
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            for i, field in enumerate(data['fields'].tolist()):
+                values = [json.loads(value) for value in data[f'values_{i}'].tolist()]
+                index.fields[field] = (
+                    {_slot_key(value): slot for slot, value in enumerate(values)}, data[f'indptr_{i}'], data[f'labels_{i}']
+                )
+        return index
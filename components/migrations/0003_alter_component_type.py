@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('components', '0002_node_cache_results'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='component',
+            name='type',
+            field=models.CharField(choices=[('llm', '语言模型'), ('chat_model', '对话模型'), ('embedding', '嵌入'), ('vector_store', '向量存储'), ('prompt', '提示词'), ('memory', '记忆'), ('chain', '链'), ('agent', '代理'), ('tool', '工具'), ('output_parser', '输出解析器'), ('document_loader', '文档加载器'), ('text_splitter', '文本分割器'), ('retriever', '检索器'), ('reranker', '重排序'), ('utility', '工具')], max_length=50, verbose_name='类型'),
+        ),
+    ]
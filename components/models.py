@@ -98,6 +98,7 @@ class ComponentType(models.TextChoices):
     DOCUMENT_LOADER = "document_loader", '文档加载器'  # 文档加载器
     TEXT_SPLITTER = "text_splitter", '文本分割器'  # 文本分割器
     RETRIEVER = "retriever", '检索器'  # 检索器
+    RERANKER = "reranker", '重排序'  # 重排序
     UTILITY = "utility", '工具'  # 工具
 
 class Component(models.Model):
@@ -253,6 +254,7 @@ class Node(models.Model):
     node_id = models.CharField(max_length = 255) # 节点id
     component_type = models.CharField(max_length = 255) # 组件类型
     data = models.JSONField(default = dict) # 节点配置参数
+    cache_results = models.BooleanField(default = False) # 参数和输入都没变时复用上次的结果，适合加载器、文本分割器这类确定性的节点
     # 误报，在Django中，FloatField(default=0)是完全有效的，但类型检查器期望的是Django内部类型。
     position_x = models.FloatField(default = 0) # 节点在画布里的x坐标
     position_y = models.FloatField(default = 0) # 节点在画布里的y坐标
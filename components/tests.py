@@ -1,4 +1,583 @@
-from django.test import TestCase
+"""
+组件基础设施的测试
 
-# Create your tests here.
+准入控制、微批处理这些逻辑不依赖具体的模型后端，用简单的协程和函数代替真正的模型调用就能覆盖；
+向量存储的测试用LangChain的DeterministicFakeEmbedding代替嵌入模型，不需要下载模型。
+"""
 
+import asyncio
+import importlib.util
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from components.base.admission import AdmissionController, BackendOverloadedError, workflow_scope
+from components.base.embeddings import CachedEmbeddings, EmbeddingCache, embed_queries
+from components.base.microbatch import MicroBatcher
+from components.base.rerankers import RerankScoreCache, score_pairs
+# BM25索引和元数据索引只依赖numpy，不受下面的可选依赖影响
+from components.implementations.vector_stores.bm25 import BM25Index
+from components.implementations.vector_stores.metadata_index import MetadataIndex, normalize_filter
+# 重排序组件的模型在第一次打分时才加载，导入模块本身不需要sentence_transformers
+from components.implementations.rerankers.cross_encoder import CrossEncoderRerankerComponent
+
+try:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from components.implementations.vector_stores.chroma_store import ChromaVectorStoreComponent
+    from components.implementations.vector_stores.faiss_index import load_store, search
+    from components.implementations.vector_stores.faiss_store import FAISSVectorStoreComponent
+except ImportError:  # 向量存储依赖的faiss、LangChain集成没有安装时跳过相关的测试
+    FAISSVectorStoreComponent = None
+
+try:
+    from components.implementations.llms.huggingface import HuggingFaceComponent
+except ImportError:  # 没有安装torch、transformers时跳过HuggingFace组件的测试
+    HuggingFaceComponent = None
+
+requires_vector_stores = unittest.skipIf(FAISSVectorStoreComponent is None, '没有安装向量存储组件的依赖')
+requires_chroma = unittest.skipIf(
+    FAISSVectorStoreComponent is None or importlib.util.find_spec('chromadb') is None, '没有安装chromadb'
+)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    """并发上限、队列上限、相同请求合并和按工作流轮转放行"""
+
+    def test_in_flight_is_capped(self):
+        controller = AdmissionController('test', max_in_flight=2, max_queue=10)
+        active, peaks = [], []
+
+        async def call():
+            active.append(1)
+            peaks.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+            return 'ok'
+
+        async def main():
+            return await asyncio.gather(*(controller.run(call) for _ in range(6)))
+
+        self.assertEqual(asyncio.run(main()), ['ok'] * 6)
+        self.assertEqual(max(peaks), 2)
+        self.assertEqual(controller.stats(), {'in_flight': 0, 'queued': 0, 'coalescing': 0})
+
+    def test_full_queue_rejects(self):
+        controller = AdmissionController('test', max_in_flight=1, max_queue=1)
+
+        async def call():
+            await asyncio.sleep(0.02)
+            return 'ok'
+
+        async def main():
+            return await asyncio.gather(*(controller.run(call) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertEqual(results[:2], ['ok', 'ok'])
+        self.assertIsInstance(results[2], BackendOverloadedError)
+
+    def test_identical_requests_are_coalesced(self):
+        controller = AdmissionController('test', max_in_flight=4)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'answer'
+
+        async def main():
+            return await asyncio.gather(*(controller.run(call, request_key='same') for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ['answer'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_workflows_are_released_round_robin(self):
+        controller = AdmissionController('test', max_in_flight=1, max_queue=10)
+        order = []
+
+        def make_call(label):
+            async def call():
+                order.append(label)
+                await asyncio.sleep(0.01)
+            return call
+
+        async def submit(workflow_id, label):
+            with workflow_scope(workflow_id):
+                await controller.run(make_call(label))
+
+        async def main():
+            blocker = asyncio.ensure_future(submit('a', 'a0'))
+            await asyncio.sleep(0)  # a0拿到名额，后面的请求都要排队
+            # 工作流a先一口气提交3个，b再提交1个，b不应该排在a的3个后面
+            await asyncio.gather(
+                blocker,
+                *(submit('a', f'a{i}') for i in range(1, 4)),
+                submit('b', 'b1'),
+            )
+
+        asyncio.run(main())
+        self.assertEqual(order, ['a0', 'a1', 'b1', 'a2', 'a3'])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """并发的请求被攒成批次，结果送回各自的调用方"""
+
+    def setUp(self):
+        self.loads = 0
+        self.batches = []
+
+    def _load(self):
+        self.loads += 1
+        return 'model'
+
+    def _run_batch(self, model, items):
+        self.batches.append(list(items))
+        return [f'{model}:{item}' for item in items]
+
+    def _submit_all(self, batcher, items):
+        async def main():
+            return await asyncio.gather(*(batcher.submit(item) for item in items))
+        return asyncio.run(main())
+
+    def test_concurrent_requests_share_batches(self):
+        batcher = MicroBatcher('test', self._load, self._run_batch, batch_size=3, max_wait_ms=50)
+        results = self._submit_all(batcher, range(6))
+
+        self.assertEqual(results, [f'model:{i}' for i in range(6)])
+        self.assertEqual(self.loads, 1)
+        self.assertTrue(all(len(batch) <= 3 for batch in self.batches))
+        self.assertLess(len(self.batches), 6)
+
+    def test_batch_failure_reaches_every_caller(self):
+        def failing(model, items):
+            raise ValueError('boom')
+
+        batcher = MicroBatcher('test', self._load, failing, batch_size=4, max_wait_ms=50)
+
+        async def main():
+            return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_idle_worker_releases_model(self):
+        batcher = MicroBatcher('test', self._load, self._run_batch, max_wait_ms=0, idle_ttl=0.05)
+        self._submit_all(batcher, ['a'])
+
+        deadline = time.monotonic() + 2
+        while batcher._thread is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(batcher._thread)
+        self.assertIsNone(batcher._model)
+
+        self.assertEqual(self._submit_all(batcher, ['b']), ['model:b'])
+        self.assertEqual(self.loads, 2)
+
+
+class FakeGenerationPipeline:
+    """代替transformers的text-generation pipeline，记录每次调用收到的提示词和batch_size"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, prompts, batch_size=1):
+        self.calls.append((list(prompts), batch_size))
+        return [[{"generated_text": f"{prompt}!"}] for prompt in prompts]
+
+
+@unittest.skipIf(HuggingFaceComponent is None, '没有安装torch、transformers')
+class HuggingFaceBatchingTests(SimpleTestCase):
+    """同时到达的提示词凑成批次后，整批只调用一次pipeline"""
+
+    def test_one_pipeline_call_per_batch(self):
+        pipeline = FakeGenerationPipeline()
+        params = {"model_id": "fake/batching-test", "batch_size": 4, "batch_wait_ms": 200}
+        prompts = [f"p{i}" for i in range(8)]
+
+        async def main():
+            component = HuggingFaceComponent()
+            return await asyncio.gather(*(component.execute({"prompt": prompt}, params) for prompt in prompts))
+
+        with mock.patch.object(HuggingFaceComponent, '_load_llm', return_value=mock.Mock(pipeline=pipeline)):
+            results = asyncio.run(main())
+
+        self.assertEqual(results, [{"text": f"{prompt}!"} for prompt in prompts])
+        self.assertEqual(len(pipeline.calls), 2)
+        for batch, batch_size in pipeline.calls:
+            self.assertEqual(batch_size, len(batch))
+            self.assertEqual(len(batch), 4)
+
+
+class LazyImportTests(SimpleTestCase):
+    """导入一个组件模块只加载它自己，不会连带导入其他组件（和torch、faiss这些依赖）"""
+
+    def test_importing_one_module_loads_only_that_module(self):
+        code = (
+            "import json, sys; import components.implementations.vector_stores.bm25; "
+            "print(json.dumps(sorted(m for m in sys.modules if m.startswith('components.implementations'))))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout
+        self.assertEqual(json.loads(output), [
+            "components.implementations",
+            "components.implementations.vector_stores",
+            "components.implementations.vector_stores.bm25",
+        ])
+
+
+class AsymmetricEmbeddings:
+    """查询和文档编码方式不同的假模型，记录每种调用的次数"""
+
+    def __init__(self):
+        self.calls = {'documents': 0, 'query': 0}
+
+    def embed_documents(self, texts):
+        self.calls['documents'] += 1
+        return [[1.0, float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.calls['query'] += 1
+        return [0.0, float(len(text))]
+
+
+class CachedEmbeddingsTests(SimpleTestCase):
+    """文档向量走磁盘缓存，查询向量用模型的embed_query计算，不写进缓存"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.model = AsymmetricEmbeddings()
+        registry = mock.Mock()
+        registry.get.return_value = self.model
+        self.cache = EmbeddingCache(path=f'{tmp.name}/embeddings.sqlite3')
+        self.embeddings = CachedEmbeddings('fake', registry, self.cache)
+
+    def test_documents_are_cached(self):
+        self.assertEqual(self.embeddings.embed_documents(['ab', 'abc']), [[1.0, 2.0], [1.0, 3.0]])
+        self.assertEqual(self.embeddings.embed_documents(['abc']), [[1.0, 3.0]])
+        self.assertEqual(self.model.calls['documents'], 1)
+
+    def test_queries_use_embed_query_and_skip_cache(self):
+        self.assertEqual(embed_queries(self.embeddings, ['ab', 'abc']), [[0.0, 2.0], [0.0, 3.0]])
+        self.assertEqual(self.model.calls, {'documents': 0, 'query': 2})
+        self.assertEqual(self.cache.get_many('fake', [self.cache.text_hash('ab')]), {})
+
+        # 同样的文本作为文档入库时拿到的是文档向量，不是之前的查询向量
+        self.assertEqual(self.embeddings.embed_documents(['ab']), [[1.0, 2.0]])
+
+
+class FakeCrossEncoder:
+    """代替sentence_transformers.CrossEncoder，分数是文本块的长度，记录每次predict收到的文本对"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(pairs))
+        return np.array([float(len(passage)) for _, passage in pairs])
+
+
+class RerankerTests(SimpleTestCase):
+    """重复的文本对只打一次分，命中缓存的不再交给模型，没命中的按batch_size分批；组件按分数保留前top_n个"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = RerankScoreCache(path=f'{tmp.name}/rerank.sqlite3')
+        self.model = FakeCrossEncoder()
+        patcher = mock.patch('components.base.rerankers.get_cross_encoder', return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_score_pairs_dedups_and_splits_batches(self):
+        pairs = [('q', 'a'), ('q', 'bb'), ('q', 'a'), ('q', 'ccc'), ('q', 'dddd'), ('q', 'bb')]
+        self.assertEqual(score_pairs('fake', pairs, batch_size=3, cache=self.cache), [1.0, 2.0, 1.0, 3.0, 4.0, 2.0])
+        self.assertEqual(self.model.calls, [[('q', 'a'), ('q', 'bb'), ('q', 'ccc')], [('q', 'dddd')]])
+
+    def test_cache_hits_skip_the_model(self):
+        score_pairs('fake', [('q', 'a'), ('q', 'bb')], cache=self.cache)
+        self.model.calls.clear()
+
+        self.assertEqual(score_pairs('fake', [('q', 'bb'), ('q', 'a')], cache=self.cache), [2.0, 1.0])
+        self.assertEqual(self.model.calls, [])
+
+        self.assertEqual(score_pairs('fake', [('q', 'a'), ('q', 'eeeee')], cache=self.cache), [1.0, 5.0])
+        self.assertEqual(self.model.calls, [[('q', 'eeeee')]])
+
+    def test_execute_keeps_top_n_by_score(self):
+        results = [
+            {'page_content': 'bb', 'metadata': {'id': 1}, 'score': 0.9},
+            {'page_content': 'dddd', 'metadata': {'id': 2}, 'score': 0.1},
+            {'page_content': 'a', 'metadata': {'id': 3}},
+            {'page_content': 'ccc', 'metadata': {'id': 4}, 'score': 0.5},
+        ]
+        with mock.patch('components.implementations.rerankers.cross_encoder.rerank_score_cache', self.cache):
+            output = asyncio.run(CrossEncoderRerankerComponent().execute(
+                {'query': 'q', 'results': results}, {'model_name': 'fake', 'top_n': 2}
+            ))
+
+        self.assertEqual(output['results'], [
+            {'page_content': 'dddd', 'metadata': {'id': 2}, 'score': 4.0, 'retrieval_score': 0.1},
+            {'page_content': 'ccc', 'metadata': {'id': 4}, 'score': 3.0, 'retrieval_score': 0.5},
+        ])
+
+
+@requires_vector_stores
+class FaissUpsertTests(SimpleTestCase):
+    """增量入库：没变的跳过，变了的替换，删除后各种索引的编号和文档仍然一一对应"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _component(self):
+        component = FAISSVectorStoreComponent()
+        component.embeddings = DeterministicFakeEmbedding(size=16)
+        return component
+
+    @staticmethod
+    def _docs(texts):
+        return [Document(page_content=text, metadata={"id": f"doc{i}", "source": "a.txt"}) for i, text in texts]
+
+    def _check_upsert(self, index_type):
+        path = f"{self.tmp.name}/{index_type}"
+        params = {"save_path": path, "index_type": index_type, "nlist": 4, "nprobe": 4}
+        texts = [(i, f"text number {i}") for i in range(40)]
+
+        stats = self._component()._upsert(self._docs(texts), {}, params)
+        self.assertEqual(stats, {"added": 40, "updated": 0, "skipped": 0, "deleted": 0})
+
+        # doc0不变，doc1改了内容，doc40是新的，doc2、doc3被删除
+        changed = [(0, "text number 0"), (1, "changed text"), (40, "brand new")]
+        stats = self._component()._upsert(self._docs(changed), {"delete_ids": ["doc2", "doc3"]}, params)
+        self.assertEqual(stats, {"added": 1, "updated": 1, "skipped": 1, "deleted": 2})
+
+        component = self._component()
+        vector_store, sidecars = load_store(path, component.embeddings)
+        contents = {
+            doc_id: vector_store.docstore.search(doc_id).page_content
+            for doc_id in vector_store.index_to_docstore_id.values()
+        }
+        self.assertEqual(len(contents), 39)
+        self.assertNotIn("doc2", contents)
+        self.assertEqual(contents["doc1"], "changed text")
+        self.assertEqual(len(sidecars["bm25"]), 39)
+
+        # 每个文档用自己的向量检索，排第一的必须是它自己
+        ids = list(contents)
+        vectors = np.asarray(component.embeddings.embed_documents([contents[i] for i in ids]), dtype=np.float32)
+        hits = search(vector_store, vectors, 1, params)
+        self.assertEqual([row[0][0] for row in hits], ids)
+
+    def test_flat(self):
+        self._check_upsert("flat")
+
+    def test_ivf_flat(self):
+        self._check_upsert("ivf_flat")
+
+    def test_hnsw(self):
+        self._check_upsert("hnsw")
+
+
+class BM25IndexTests(SimpleTestCase):
+    """增删文档、按ID范围检索、保存和加载"""
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(["a", "b", "c"], ["pump error E-4012", "valve error E-4021", "motor sensor"])
+
+    def test_search_matches_exact_terms(self):
+        self.assertEqual(self.index.search("E-4012", 3)[0][0], "a")
+        self.assertEqual({doc_id for doc_id, _ in self.index.search("error", 3)}, {"a", "b"})
+        self.assertEqual(self.index.search("nothing here", 3), [])
+
+    def test_add_replaces_and_remove_drops(self):
+        self.index.add(["a"], ["motor"])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search("pump", 3), [])
+        self.assertEqual(self.index.remove(["b", "missing"]), 1)
+        self.assertNotIn("b", self.index)
+        self.assertEqual({doc_id for doc_id, _ in self.index.search("motor", 3)}, {"a", "c"})
+
+    def test_duplicate_ids_in_one_batch_keep_the_last(self):
+        self.index.add(["d", "d"], ["pump", "sensor"])
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(sorted(doc_id for doc_id, _ in self.index.search("sensor", 5)), ["c", "d"])
+        self.assertNotIn("d", [doc_id for doc_id, _ in self.index.search("pump", 5)])
+
+    def test_search_within_allowed_ids(self):
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("error", 3, ["b"])], ["b"])
+
+    def test_save_and_load(self):
+        self.index.fingerprint = "abc"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/index.bm25.npz"
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+        self.assertEqual(loaded.fingerprint, "abc")
+        self.assertEqual(loaded.doc_ids, self.index.doc_ids)
+        self.assertEqual(loaded.search("error", 3), self.index.search("error", 3))
+
+
+@requires_chroma
+class ChromaHybridTests(SimpleTestCase):
+    """BM25索引和集合保持一致，过滤条件满足的ID集合被缓存"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        patcher = mock.patch(
+            'components.implementations.vector_stores.chroma_store.get_embeddings', return_value=self.embeddings
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.params = {"persist_directory": self.tmp.name, "collection_name": "tests", "search_mode": "hybrid"}
+        self.bm25_path = f"{self.tmp.name}/tests.bm25.npz"
+
+    def _run(self, inputs):
+        component = ChromaVectorStoreComponent()
+        return component, asyncio.run(component.execute(inputs, self.params))
+
+    @staticmethod
+    def _documents(items):
+        return [
+            {"page_content": text, "metadata": {"id": doc_id, "source": source}}
+            for doc_id, text, source in items
+        ]
+
+    def test_fingerprint_tracks_collection(self):
+        self._run({"documents": self._documents([
+            ("a", "pump error E-4012", "a.txt"), ("b", "valve error", "a.txt"), ("c", "motor", "b.txt"),
+        ])})
+        component, _ = self._run({
+            "documents": self._documents([("a", "pump error E-4012 fixed", "a.txt"), ("d", "sensor", "c.txt")]),
+            "delete_sources": ["b.txt"],
+        })
+        bm25 = BM25Index.load(self.bm25_path)
+        self.assertEqual(set(bm25.doc_ids), {"a", "b", "d"})
+        # 增量算出来的指纹和重新扫描集合算出来的一样
+        self.assertEqual(bm25.fingerprint, component._build_bm25().fingerprint)
+
+    def test_drift_triggers_rebuild(self):
+        component, _ = self._run({"documents": self._documents([("a", "pump error", "a.txt")])})
+        # 绕过组件直接写集合，BM25索引里没有这个文档
+        from langchain_core.documents import Document
+        component.vector_store.add_documents([Document(page_content="valve E-4021", metadata={"source": "x"})], ids=["x"])
+
+        self._run({"documents": self._documents([("b", "motor", "b.txt")])})
+        self.assertEqual(set(BM25Index.load(self.bm25_path).doc_ids), {"a", "b", "x"})
+
+    def test_upsert_does_not_scan_the_collection(self):
+        self._run({"documents": self._documents([
+            ("a", "pump error", "a.txt"), ("b", "valve error", "a.txt"),
+        ])})
+        from langchain_community.vectorstores import Chroma
+
+        component = ChromaVectorStoreComponent()
+        with mock.patch.object(Chroma, "get", autospec=True, side_effect=Chroma.get) as get:
+            asyncio.run(component.execute({"documents": self._documents([("c", "motor", "b.txt")])}, self.params))
+        full_scans = [call for call in get.call_args_list if not call.kwargs.get("ids") and not call.kwargs.get("where")]
+        self.assertEqual(full_scans, [])
+        self.assertEqual(set(BM25Index.load(self.bm25_path).doc_ids), {"a", "b", "c"})
+
+    def test_drift_with_unchanged_count_triggers_rebuild(self):
+        component, _ = self._run({"documents": self._documents([("a", "pump error", "a.txt")])})
+        # 绕过组件删掉a、写入c，文档数不变，但BM25索引里没有c
+        component.vector_store.delete(ids=["a"])
+        component.vector_store.add_documents([Document(page_content="sensor", metadata={"source": "c.txt"})], ids=["c"])
+
+        self._run({"documents": self._documents([("c", "sensor fixed", "c.txt")])})
+        self.assertEqual(set(BM25Index.load(self.bm25_path).doc_ids), {"c"})
+
+    def test_allowed_ids_are_cached_per_filter(self):
+        component, _ = self._run({"documents": self._documents([
+            ("a", "pump error", "a.txt"), ("b", "valve error", "b.txt"),
+        ])})
+        where = {"source": {"$eq": "b.txt"}}
+        with mock.patch.object(component.vector_store, "get", wraps=component.vector_store.get) as get:
+            for _ in range(2):
+                hits = component._search_batch(["error"], self.bm25_path, self.params, where)
+                self.assertEqual([hit["metadata"]["source"] for hit in hits[0]], ["b.txt"])
+                self.assertNotIn("content_hash", hits[0][0]["metadata"])
+        filtered = [call for call in get.call_args_list if call.kwargs.get("where") == where]
+        self.assertEqual(len(filtered), 1)
+
+    def test_results_hide_content_hash(self):
+        component, _ = self._run({"documents": self._documents([("a", "pump error", "a.txt")])})
+        for mode in ("vector", "hybrid"):
+            hits = component._search_batch(["pump"], self.bm25_path, dict(self.params, search_mode=mode))
+            self.assertEqual(hits[0][0]["metadata"], {"id": "a", "source": "a.txt"})
+
+
+class MetadataIndexTests(SimpleTestCase):
+    """等于、列表、范围条件的组合，取值按类型区分，非法的条件被拒绝"""
+
+    def setUp(self):
+        self.index = MetadataIndex.build([
+            (0, {"source": "a.pdf", "page": 1, "draft": True}),
+            (1, {"source": "a.pdf", "page": 5, "draft": 1}),
+            (2, {"source": "b.pdf", "page": 9.5, "draft": False}),
+            (3, {"source": "c.pdf", "page": "appendix", "tags": ["x"]}),
+        ])
+
+    def _select(self, filter):
+        return self.index.select(normalize_filter(filter)).tolist()
+
+    def test_select(self):
+        self.assertEqual(self._select({"source": "a.pdf"}), [0, 1])
+        self.assertEqual(self._select({"source": ["b.pdf", "c.pdf"]}), [2, 3])
+        self.assertEqual(self._select({"page": {"$gte": 5}}), [1, 2])
+        self.assertEqual(self._select({"source": "a.pdf", "page": {"$lt": 5}}), [0])
+        self.assertEqual(self._select({"page": 1.0}), [0])
+        self.assertEqual(self._select({"missing": 1}), [])
+
+    def test_bool_and_number_are_distinct(self):
+        self.assertEqual(self._select({"draft": True}), [0])
+        self.assertEqual(self._select({"draft": 1}), [1])
+        self.assertEqual(self._select({"draft": {"$in": [False, 1]}}), [1, 2])
+
+    def test_save_and_load_keep_types(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(f"{tmp}/meta.npz")
+            self.index = MetadataIndex.load(f"{tmp}/meta.npz")
+        self.test_select()
+        self.test_bool_and_number_are_distinct()
+
+    def test_rejects_non_scalar_values(self):
+        for filter in ({"tags": ["x", ["y"]]}, {"source": {"$eq": {"a": 1}}}, {"source": {"$in": [None]}}, '{"page": {"$gt": "1"}}'):
+            with self.assertRaises(ValueError):
+                normalize_filter(filter)
+
+
+@requires_vector_stores
+class FaissFilteredSearchTests(SimpleTestCase):
+    """元数据过滤的位图只放行满足条件的编号"""
+
+    def test_only_selected_labels_are_returned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            component = FAISSVectorStoreComponent()
+            component.embeddings = DeterministicFakeEmbedding(size=16)
+            params = {"save_path": tmp, "index_type": "ivf_flat", "nlist": 2, "nprobe": 2, "top_k": 50}
+            docs = [
+                Document(page_content=f"text {i}", metadata={"id": f"doc{i}", "page": i})
+                for i in range(30)
+            ]
+            component._upsert(docs, {}, params)
+            component._upsert([], {"delete_ids": ["doc0", "doc1"]}, params)
+            component.vector_store, sidecars = load_store(tmp, component.embeddings)
+            component.metadata_index = sidecars["metadata"]
+
+            labels = component._filter_labels({"page": {"$lt": 5}})
+            hits = component._search_batch(["text 3"], params, labels)[0]
+        self.assertEqual(sorted(doc.metadata["page"] for doc, _ in hits), [2, 3, 4])
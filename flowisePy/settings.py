@@ -180,4 +180,54 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': True, # 使用会话认证
     'LOGIN_URL': 'admin:login', # 管理员登录URL
     'LOGOUT_URL': 'admin:logout', # 管理员登出URL
-}
\ No newline at end of file
+}
+
+# 工作流执行引擎配置
+# 组件实例池：声明了init_params的组件（本地大模型、嵌入模型等）在多次执行之间复用已加载的实例
+COMPONENT_POOL_MAX_MEMORY_MB = int(os.getenv('COMPONENT_POOL_MAX_MEMORY_MB', 8192))  # 池化实例的内存预算，0表示不限制
+COMPONENT_POOL_IDLE_TTL = int(os.getenv('COMPONENT_POOL_IDLE_TTL', 1800))  # 空闲实例保留的秒数，0表示永不过期
+COMPONENT_POOL_MAX_INSTANCES_PER_KEY = int(os.getenv('COMPONENT_POOL_MAX_INSTANCES_PER_KEY', 1))  # 同样初始化参数的实例最多同时存在几个，都被借出时后来的执行等待，0表示不限制
+# 批量执行（execute_batch接口）时同时执行的组件调用数上限，0表示不限制
+WORKFLOW_BATCH_MAX_CONCURRENCY = int(os.getenv('WORKFLOW_BATCH_MAX_CONCURRENCY', 8))
+# 后台worker的心跳：执行中的任务定期刷新heartbeat_at，超时没刷新的任务被其他worker重新放回队列
+WORKFLOW_RUN_HEARTBEAT_INTERVAL = float(os.getenv('WORKFLOW_RUN_HEARTBEAT_INTERVAL', 15))  # 心跳间隔（秒）
+WORKFLOW_RUN_STALE_AFTER = float(os.getenv('WORKFLOW_RUN_STALE_AFTER', 120))  # 多久没有心跳就认为worker已经挂了（秒），应该明显大于心跳间隔
+WORKFLOW_RUN_MAX_ATTEMPTS = int(os.getenv('WORKFLOW_RUN_MAX_ATTEMPTS', 3))  # 一个任务最多被领取几次，超过后直接标记为失败，避免反复拖垮worker
+# 节点结果缓存：打开了cache_results的节点，参数和输入都没变时复用上次的结果
+NODE_RESULT_CACHE_MAX_MEMORY_MB = int(os.getenv('NODE_RESULT_CACHE_MAX_MEMORY_MB', 256))  # 内存缓存的大小上限，0表示不使用内存缓存
+NODE_RESULT_CACHE_DIR = os.getenv('NODE_RESULT_CACHE_DIR', str(BASE_DIR / '.cache' / 'node_results'))  # 磁盘缓存目录，设为空字符串表示不使用磁盘缓存
+NODE_RESULT_CACHE_MAX_DISK_MB = int(os.getenv('NODE_RESULT_CACHE_MAX_DISK_MB', 2048))  # 磁盘缓存的大小上限，0表示不限制
+# 节点结果快照：保存每个工作流最近一次执行的各节点结果，供“从某个节点重新执行”（rerun_from接口）复用
+WORKFLOW_SNAPSHOT_MAX_WORKFLOWS = int(os.getenv('WORKFLOW_SNAPSHOT_MAX_WORKFLOWS', 32))  # 内存里最多保留多少个工作流的快照
+WORKFLOW_SNAPSHOT_DIR = os.getenv('WORKFLOW_SNAPSHOT_DIR', str(BASE_DIR / '.cache' / 'run_snapshots'))  # 磁盘快照目录，设为空字符串表示只保存在内存里
+# 阻塞型组件的执行池：按组件声明的execution_mode放到线程池或进程池，避免阻塞事件循环
+COMPONENT_IO_THREADS = int(os.getenv('COMPONENT_IO_THREADS', 32))  # io模式（同步的网络/磁盘调用）的线程数
+COMPONENT_COMPUTE_THREADS = int(os.getenv('COMPONENT_COMPUTE_THREADS', 0))  # gil_releasing模式（模型推理等）的线程数，0表示CPU核数
+COMPONENT_CPU_PROCESSES = int(os.getenv('COMPONENT_CPU_PROCESSES', 0))  # cpu模式（解析PDF、分割文本等）的进程数，0表示CPU核数
+# LLM客户端池：同样配置的ChatOllama、ChatGoogleGenerativeAI等客户端在进程内复用，保持keep-alive连接
+LLM_CLIENT_MAX_CLIENTS = int(os.getenv('LLM_CLIENT_MAX_CLIENTS', 64))  # 每个事件循环最多缓存的客户端数
+LLM_CLIENT_MAX_CONNECTIONS = int(os.getenv('LLM_CLIENT_MAX_CONNECTIONS', 20))  # 每个HTTP客户端的连接池大小
+# 本地模型后端的准入控制：每个后端（一个Ollama地址、一个模型文件）同时执行的请求数和等待队列长度，队列满了返回503
+LLM_BACKEND_LIMITS = {
+    'ollama': {'max_in_flight': int(os.getenv('OLLAMA_MAX_IN_FLIGHT', 4)), 'max_queue': int(os.getenv('OLLAMA_MAX_QUEUE', 64))},
+    'llamacpp': {'max_in_flight': 1, 'max_queue': 32},  # llama.cpp单个模型实例同一时间只能做一次生成
+    'default': {'max_in_flight': 1, 'max_queue': 32},
+}
+# LLM响应缓存：所有llm类型的组件，模型参数和（规范化的）提示词都相同时直接返回缓存的响应
+LLM_RESPONSE_CACHE_PATH = os.getenv('LLM_RESPONSE_CACHE_PATH', str(BASE_DIR / '.cache' / 'llm_responses.sqlite3'))  # SQLite文件路径，设为空字符串表示不使用响应缓存
+LLM_RESPONSE_CACHE_TTL = int(os.getenv('LLM_RESPONSE_CACHE_TTL', 86400))  # 响应的有效期（秒），0表示永不过期
+LLM_RESPONSE_CACHE_MAX_MB = int(os.getenv('LLM_RESPONSE_CACHE_MAX_MB', 256))  # 缓存的大小上限，0表示不限制
+LLM_RESPONSE_CACHE_SEMANTIC_MODEL = os.getenv('LLM_RESPONSE_CACHE_SEMANTIC_MODEL', '')  # 语义匹配使用的嵌入模型，例如sentence-transformers/all-MiniLM-L6-v2，空字符串表示只做精确匹配
+LLM_RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.getenv('LLM_RESPONSE_CACHE_SEMANTIC_THRESHOLD', 0.95))  # 语义匹配的余弦相似度阈值
+LLM_RESPONSE_CACHE_SEMANTIC_CANDIDATES = int(os.getenv('LLM_RESPONSE_CACHE_SEMANTIC_CANDIDATES', 1000))  # 语义匹配最多和多少条最近使用过的响应比较
+LLM_RESPONSE_CACHE_SAMPLED = os.getenv('LLM_RESPONSE_CACHE_SAMPLED', 'False').lower() == 'true'  # 温度大于0的调用是否也缓存，默认只缓存确定性的生成
+# 嵌入模型注册表：向量存储组件和语义缓存共用，同一个嵌入模型在进程内只加载一次
+EMBEDDING_MAX_MEMORY_MB = int(os.getenv('EMBEDDING_MAX_MEMORY_MB', 2048))  # 所有嵌入模型的内存预算，0表示不限制
+EMBEDDING_PRELOAD_MODELS = [name.strip() for name in os.getenv('EMBEDDING_PRELOAD_MODELS', '').split(',') if name.strip()]  # 启动时在后台预先加载的模型，环境变量里用逗号分隔
+# 嵌入缓存：按(模型, 文本的sha256)保存算过的向量，重新入库时只有变化的文本块需要计算
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', str(BASE_DIR / '.cache' / 'embeddings.sqlite3'))  # SQLite文件路径，设为空字符串表示不使用嵌入缓存
+EMBEDDING_CACHE_BATCH_SIZE = int(os.getenv('EMBEDDING_CACHE_BATCH_SIZE', 256))  # 没命中的文本每批交给模型计算多少条
+# FAISS只读索引缓存：只查询的执行按(路径, 版本, 修改时间)复用已加载（内存映射）的索引
+FAISS_INDEX_CACHE_MAX_INDEXES = int(os.getenv('FAISS_INDEX_CACHE_MAX_INDEXES', 8))  # 每个进程最多缓存的索引数
+# 重排序分数缓存：按(交叉编码器模型, 查询和文本块的sha256)保存算过的相关性分数
+RERANK_SCORE_CACHE_PATH = os.getenv('RERANK_SCORE_CACHE_PATH', str(BASE_DIR / '.cache' / 'rerank_scores.sqlite3'))  # SQLite文件路径，设为空字符串表示不使用分数缓存
@@ -0,0 +1,24 @@
+"""
+工作流API使用的渲染器
+"""
+from rest_framework.renderers import BaseRenderer
+
+from workflows.engine import format_sse
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    SSE（text/event-stream）渲染器
+
+    流式接口成功时直接返回StreamingHttpResponse，不经过渲染器；
+    声明它一是让DRF的内容协商接受 Accept: text/event-stream 的请求（否则会返回406），
+    二是推流开始前就出错时（例如工作流有环），把错误信息按SSE的error事件格式返回
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_sse('error', data).encode(self.charset)
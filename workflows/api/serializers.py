@@ -1,5 +1,5 @@
 from rest_framework import serializers  # 导入Django REST framework的序列化器模块
-from workflows.models import Workflow, Edge  # 导入工作流相关的模型
+from workflows.models import Workflow, Edge, WorkflowRun  # 导入工作流相关的模型
 from components.models import Node # 导入节点模型
 
 # 边的序列化器，用于将Edge模型对象转换为JSON等格式，或反序列化
@@ -24,7 +24,14 @@ class WorkflowSerializer(serializers.ModelSerializer):
     class Meta:  # 内部类Meta用于配置序列化器
         model = Workflow  # 指定序列化的模型为Workflow
         # 指定需要序列化的字段，包括基本信息和关联的nodes、edges
-        fields = ['id', 'name', 'description', 'created_at', 'updated_at', 'nodes', 'edges']
+        fields = ['id', 'name', 'description', 'max_concurrency', 'created_at', 'updated_at', 'nodes', 'edges']
+
+# 工作流运行记录的序列化器，运行由后台worker执行，所有字段对客户端都是只读的
+class WorkflowRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WorkflowRun
+        fields = ['id', 'workflow', 'status', 'inputs', 'outputs', 'error', 'trace', 'worker', 'attempts', 'created_at', 'started_at', 'heartbeat_at', 'finished_at']
+        read_only_fields = fields
 
 # 解释说明：
 # 1. 这些序列化器的作用是将Django模型对象（如Workflow、Node、Edge）转换为前端或API可以识别的格式（如JSON），
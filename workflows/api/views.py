@@ -11,21 +11,67 @@
 from rest_framework import viewsets, status  # 导入DRF的viewsets，用于快速实现CRUD接口
 from rest_framework.decorators import action, schema
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.conf import settings
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from workflows.models import Workflow, Edge  # 导入工作流、边的模型
+from workflows.models import Workflow, Edge, WorkflowRun, RunStatus  # 导入工作流、边、运行记录的模型
 from components.models import Node # 导入节点模型
-from .serializers import WorkflowSerializer, NodeSerializer, EdgeSerializer  # 导入对应的序列化器
+from .serializers import WorkflowSerializer, NodeSerializer, EdgeSerializer, WorkflowRunSerializer  # 导入对应的序列化器
+from .renderers import EventStreamRenderer
 
-# 工作流执行引擎实现所需的库
-import networkx as nx
-from components.models import Component
-from core.models import Credential
-import json
+# 工作流执行引擎
+from workflows.engine import plan_cache, WorkflowRunner, BatchRunner, WorkflowExecutionError, stream_workflow_events, format_sse, to_jsonable, engine_loop
+from asgiref.sync import sync_to_async
 import asyncio
 
 
+# execute、execute_stream接口的快照参数
+SNAPSHOT_REQUEST_PROPERTY = openapi.Schema(
+    type=openapi.TYPE_BOOLEAN,
+    description='是否保存这次执行的节点结果，之后改了某个节点可以用rerun_from只重算它和它的下游'
+)
+
+# execute、rerun_from接口共用的追踪参数
+TRACE_REQUEST_PROPERTIES = {
+    'trace': openapi.Schema(
+        type=openapi.TYPE_BOOLEAN,
+        description='是否在响应里返回每个节点的耗时、CPU时间、内存变化、数据量和缓存命中情况'
+    ),
+    'profile': openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(type=openapi.TYPE_STRING),
+        description='要做性能剖析的节点ID列表（也可以传单个节点ID，或者传true剖析全部节点），剖析报告放在trace里对应节点的profile字段'
+    ),
+}
+
+
+def _sse_response(request, events):
+    """
+    把异步的SSE事件生成器包装成流式响应
+
+    ASGI下直接交给服务器的事件循环；WSGI下Django会先把异步生成器整个收集完才发送，
+    所以改为在引擎的共享事件循环里迭代（见engine/loop.py），产生一个事件就发送一个
+    """
+    if not isinstance(request._request, ASGIRequest):
+        events = engine_loop.iterate(events)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 关闭nginx的响应缓冲，否则事件会被攒起来一起发
+    return response
+
+
+def _with_trace(request, runner, data):
+    """请求了trace或profile时，把运行器的追踪记录加到响应数据里"""
+    if request.data.get('trace') or request.data.get('profile'):
+        data['trace'] = to_jsonable(runner.trace.to_dict())
+    return data
+
+
 class WorkflowViewSet(viewsets.ModelViewSet):
     """
     工作流管理API
@@ -42,7 +88,9 @@ class WorkflowViewSet(viewsets.ModelViewSet):
                 'inputs': openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     description='工作流输入参数'
-                )
+                ),
+                'snapshot': SNAPSHOT_REQUEST_PROPERTY,
+                **TRACE_REQUEST_PROPERTIES
             }
         ),
         responses={
@@ -52,7 +100,8 @@ class WorkflowViewSet(viewsets.ModelViewSet):
                     type=openapi.TYPE_OBJECT,
                     properties={
                         'status': openapi.Schema(type=openapi.TYPE_STRING),
-                        'output': openapi.Schema(type=openapi.TYPE_OBJECT)
+                        'output': openapi.Schema(type=openapi.TYPE_OBJECT),
+                        'trace': openapi.Schema(type=openapi.TYPE_OBJECT, description='请求了trace或profile时才有')
                     }
                 )
             ),
@@ -61,149 +110,290 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         }
     )
     @action(detail=True, methods=['post'])
-    async def execute(self, request, pk=None):
+    def execute(self, request, pk=None):
         """
         执行工作流的API端点
         全项目的核心中的核心
 
         流程：
-        1、加载工作流及其节点、边
-        2、构建有向图并进行拓扑排序
-        3、按顺序执行每个节点
-        4、追踪中间结果并且返回最终的输出
+        1、获取工作流的执行计划（节点、边、拓扑排序和组件类都已预先编译并缓存）
+        2、按依赖关系调度节点，没有依赖关系的分支并发执行
+        3、追踪中间结果并且返回最终的输出
+
+        DRF不会await协程形式的action，这里和execute_batch一样把调度器交给引擎共享的事件循环（engine/loop.py）执行并等待结果，
+        所有请求共用一个事件循环，LLM客户端池里的客户端和keep-alive连接才能在请求之间复用
         """
         workflow = self.get_object()
         # 获取输入参数
         input_data = request.data.get('inputs', [])
-        
-        # 加载工作流的节点和边
-        nodes = workflow.nodes.all()
-        edges = workflow.edges.all()
-
-        # 构建工作流执行图
-        G = nx.DiGraph()
-
-        # 添加所有节点
-        node_map = {} # 节点ID到对象的映射
-        for node in nodes:
-            G.add_node(node.node_id)
-            node_map[node.node_id] = node
-        
-        # 添加所有边
-        for edge in edges:
-            G.add_edge(edge.source_node, edge.target_node)
-
-        #TODO 确保图是无环的(如果有if或者while组件怎么办)
-        if not nx.is_directed_acyclic_graph(G):
-            return Response(
-                {"error": '工作流有死循环，无法执行'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
 
-        # 获取拓扑排序（执行顺序）
+        profile = request.data.get('profile')
+
         try:
-            execution_order = list(nx.topological_sort(G))
-        except nx.NetworkXUnfeasible:
-            return Response(
-                {"error": '工作流结构无效，无法确定执行顺序'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            # 同一个工作流反复执行时直接复用缓存的执行计划，节点或边变化后会自动重新编译
+            plan = plan_cache.get(workflow)
+            runner = WorkflowRunner(plan, profile=profile, snapshot=bool(request.data.get('snapshot')))
+            outputs = engine_loop.run(runner.run(input_data))
+        except WorkflowExecutionError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-        # 存储每个节点的执行结果
-        results = {}
-
-        # 添加工作流的输入到结果里面
-        if 'start' in input_data:
-            results['start'] = input_data['start']
-
-        # 按顺序执行每个节点
-        for node_id in execution_order:
-            node = node_map.get(node_id)
-            if not node:
-                continue
-
-            # 获取组件类型和参数
-            component_type = node.componennt_type
-            component_id = node.component_id
-            node_params = json.loads(node.data) if node.data else {}
-
-            try:
-                # 查找组件定义
-                component = Component.objects.get(name=component_id)
-
-                # 准备输入数据
-                node_inputs = {}
-
-                # 查找所有指向当前节点的边
-                incoming_edges = [e for e in edges if e.target_node == node_id]
-
-                for edge in incoming_edges:
-                    source_node = edge.source_node
-                    source_output = edge.source_output or 'output' # 默认输出键，而不是值
-                    target_input = edge.target_input or 'input' # 默认输入键，而不是值
-
-                    if source_node in results:
-                        # 将上一节点的输出连接到当前节点的输入
-                        source_data = results[source_node]
-                        if source_output in source_data:
-                            node_inputs[target_input] = source_data[source_output]
-
-                # 处理凭证需求
-                if 'credential' in node_params:
-                    credential_id = node_params.pop('credentialId')
-                    try:
-                        credential = Credential.objects.get(id=credential_id)
-                        # 添加凭证值到参数
-                        node_params['credential'] = json.loads(credential.value)
-                    except Credential.DoesNotExist:
-                        return Response(
-                            {"error": f'节点 {node_id} 需要的凭证ID{credential_id} 不存在'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+        # # 模拟执行结果
+        # result = {'status': 'success', 'output': {"result": "工作流执行结果示例"}}
+        return Response(_with_trace(request, runner, {
+            "status": 'success',
+            "output": to_jsonable(outputs)
+        }))
 
-                # 导入并且初始化组件类
-                component_module = __import__(
-                    f"components.implementations.{component.module_path}",
-                    fromlist = [component.class_name]
+    @swagger_auto_schema(
+        operation_description='从指定节点重新执行工作流：只重算该节点及其所有下游节点，其余节点复用之前带snapshot执行时保存的结果',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['node_id'],
+            properties={
+                'node_id': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='从哪个节点开始重新执行（通常是刚在画布里修改过的节点）'
+                ),
+                'inputs': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    description='工作流输入参数'
+                ),
+                **TRACE_REQUEST_PROPERTIES
+            }
+        ),
+        responses={
+            200: openapi.Response(
+                description='工作流执行成功',
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'status': openapi.Schema(type=openapi.TYPE_STRING),
+                        'output': openapi.Schema(type=openapi.TYPE_OBJECT),
+                        'trace': openapi.Schema(type=openapi.TYPE_OBJECT, description='请求了trace或profile时才有')
+                    }
                 )
+            ),
+            400: "无效的工作流、节点或输入参数",
+            500: "工作流执行错误"
+        }
+    )
+    @action(detail=True, methods=['post'])
+    def rerun_from(self, request, pk=None):
+        """
+        从指定节点重新执行工作流的API端点
+
+        在设计器里改了一个节点之后用它代替execute，上游那些耗时的嵌入、建索引节点不用重算
+        """
+        workflow = self.get_object()
+        node_id = request.data.get('node_id')
+        if not node_id:
+            return Response({'error': '缺少node_id'}, status=status.HTTP_400_BAD_REQUEST)
+        input_data = request.data.get('inputs', {})
+        profile = request.data.get('profile')
 
-                component_class = getattr(component_module, component.class_name)
-                component_instance = component_class()
+        try:
+            plan = plan_cache.get(workflow)
+            runner = WorkflowRunner(plan, profile=profile)
+            outputs = engine_loop.run(runner.run(input_data, rerun_from=node_id))
+        except WorkflowExecutionError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-                # 执行组件
-                result = await component_instance.execute(node_inputs, node_params)
+        return Response(_with_trace(request, runner, {
+            "status": 'success',
+            "output": to_jsonable(outputs)
+        }))
 
-                # 存储结果
-                results[node_id] = result
-            
-            except Component.DoesNotExist:
-                return Response(
-                    {"error": f'找不到组件：{component_id}'},
-                    status=status.HTTP_400_BAD_REQUEST
+    @swagger_auto_schema(
+        operation_description='用同一个工作流批量执行多组输入，共用一份执行计划和一批已加载的组件实例',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'inputs': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                    description='输入参数列表，每一项和execute接口的inputs相同'
+                ),
+                'max_concurrency': openapi.Schema(
+                    type=openapi.TYPE_INTEGER,
+                    description='同时执行的组件调用数上限，默认为WORKFLOW_BATCH_MAX_CONCURRENCY'
                 )
-            
-            except Exception as e:
-                return Response(
-                    {'error': f"节点 {node_id} 执行失败：{str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            }
+        ),
+        responses={
+            200: openapi.Response(
+                description='批量执行完成，results和inputs一一对应，每一项单独标记成功或失败',
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'status': openapi.Schema(type=openapi.TYPE_STRING),
+                        'results': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(type=openapi.TYPE_OBJECT)
+                        )
+                    }
                 )
+            ),
+            400: "无效的工作流或输入参数",
+            500: "工作流执行错误"
+        }
+    )
+    @action(detail=True, methods=['post'])
+    def execute_batch(self, request, pk=None):
+        """
+        批量执行工作流的API端点
 
-        # 找到没有出边的节点作为输出
-        output_nodes = [n for n in G.nodes() if G.out_degree(n) == 0]
+        和循环调用execute相比，执行计划只获取一次，整个DAG只走一遍，
+        支持批处理的组件（如HuggingFaceComponent）会一次拿到整批输入
 
-        # 收集所有输出节点的结果
-        outputs = {}
-        for node_id in output_nodes:
-            if node_id in results:
-                outputs[node_id] = results[node_id]
+        DRF的视图是同步的，这里把整个批次交给引擎共享的事件循环执行并等待结果
+        """
+        workflow = self.get_object()
+        batch_inputs = request.data.get('inputs')
+        if not isinstance(batch_inputs, list) or not all(isinstance(item, dict) for item in batch_inputs):
+            return Response({'error': 'inputs必须是输入参数对象的列表'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            max_concurrency = int(request.data.get('max_concurrency', settings.WORKFLOW_BATCH_MAX_CONCURRENCY))
+        except (TypeError, ValueError):
+            return Response({'error': 'max_concurrency必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            plan = plan_cache.get(workflow)
+            results = engine_loop.run(BatchRunner(plan, max_concurrency=max_concurrency).run_batch(batch_inputs))
+        except WorkflowExecutionError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-        # # 模拟执行结果
-        # result = {'status': 'success', 'output': {"result": "工作流执行结果示例"}}
         return Response({
             "status": 'success',
-            "output": outputs
+            "results": to_jsonable(results)
         })
 
+    @swagger_auto_schema(
+        operation_description='以SSE（text/event-stream）流式执行指定的工作流，逐个推送节点开始/结束事件和LLM生成的token',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'inputs': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    description='工作流输入参数'
+                ),
+                'snapshot': SNAPSHOT_REQUEST_PROPERTY
+            }
+        ),
+        responses={
+            200: 'SSE事件流：node_started、token、node_finished、node_failed、workflow_finished、error',
+            400: "无效的工作流或输入参数"
+        }
+    )
+    @action(detail=True, methods=['post'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def execute_stream(self, request, pk=None):
+        """
+        流式执行工作流的API端点
+
+        和execute的执行逻辑完全一样，区别在于不等全部节点执行完，而是边执行边推送事件，
+        对话类工作流可以在LLM生成第一个token时就开始显示
+        """
+        workflow = self.get_object()
+        input_data = request.data.get('inputs', [])
+
+        # 编译错误（有环、组件不存在等）在开始推流之前就能发现，直接按普通请求返回
+        try:
+            plan = plan_cache.get(workflow)
+        except WorkflowExecutionError as e:
+            return Response({'error': e.message}, status=e.status_code)
+
+        return _sse_response(
+            request, stream_workflow_events(plan, input_data, snapshot=bool(request.data.get('snapshot')))
+        )
+
+    @swagger_auto_schema(
+        operation_description='异步提交工作流运行，立即返回运行ID，由后台worker（manage.py run_workflow_worker）执行',
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'inputs': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    description='工作流输入参数'
+                )
+            }
+        ),
+        responses={202: WorkflowRunSerializer}
+    )
+    @action(detail=True, methods=['post'])
+    def submit(self, request, pk=None):
+        """
+        异步提交工作流
+
+        适合长时间运行的工作流（例如文档入库），接口只负责把运行记录放进队列，
+        之后通过 /api/runs/{id}/ 轮询，或者 /api/runs/{id}/events/ 订阅状态和输出
+        """
+        workflow = self.get_object()
+        input_data = request.data.get('inputs', {})
+
+        run = WorkflowRun.objects.create(workflow=workflow, inputs=input_data)
+        return Response(WorkflowRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+
+async def _run_status_events(run_id, poll_interval=1.0):
+    """
+    轮询运行记录，状态变化时推送SSE事件，运行结束后推送完整结果并结束
+
+    worker在别的进程里执行，这里只能通过数据库得知进度
+    """
+    get_run = sync_to_async(lambda: WorkflowRunSerializer(WorkflowRun.objects.get(pk=run_id)).data)
+    last_status = None
+    while True:
+        data = await get_run()
+        if data['status'] != last_status:
+            last_status = data['status']
+            yield format_sse('status', {'id': run_id, 'status': last_status})
+        if last_status in (RunStatus.SUCCEEDED, RunStatus.FAILED, RunStatus.CANCELLED):
+            yield format_sse('finished', data)
+            return
+        await asyncio.sleep(poll_interval)
+
+
+class WorkflowRunViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    工作流运行记录API端点
+    运行记录由submit接口创建、由后台worker更新，这里只提供查询、订阅和取消
+    """
+    queryset = WorkflowRun.objects.all()
+    serializer_class = WorkflowRunSerializer
+
+    def get_queryset(self):
+        """允许通过workflow和status参数过滤"""
+        queryset = super().get_queryset()
+        workflow_id = self.request.query_params.get('workflow')
+        if workflow_id:
+            queryset = queryset.filter(workflow_id=workflow_id)
+        run_status = self.request.query_params.get('status')
+        if run_status:
+            queryset = queryset.filter(status=run_status)
+        return queryset
+
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, pk=None):
+        """以SSE订阅运行状态，运行结束时推送完整结果"""
+        run = self.get_object()
+        return _sse_response(request, _run_status_events(run.pk))
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """取消还在排队中的运行，已经被worker领取的运行无法取消"""
+        run = self.get_object()
+        cancelled = WorkflowRun.objects.filter(pk=run.pk, status=RunStatus.QUEUED).update(
+            status=RunStatus.CANCELLED,
+            finished_at=timezone.now()
+        )
+        if not cancelled:
+            return Response(
+                {"error": f'运行 #{run.pk} 当前状态为{run.status}，只能取消排队中的运行'},
+                status=status.HTTP_409_CONFLICT
+            )
+        run.refresh_from_db()
+        return Response(WorkflowRunSerializer(run).data)
+
 
 class NodeViewSet(viewsets.ModelViewSet):
     """
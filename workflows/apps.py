@@ -1,6 +1,51 @@
 from django.apps import AppConfig
 
 
+def configure_engine(settings) -> None:
+    """
+    按配置初始化执行引擎的各个进程内单例
+
+    除了ready()，进程池的子进程也会调用它（见engine/offload.py），spawn出来的子进程不执行ready()
+    """
+    from .engine import component_pool, node_result_cache, llm_response_cache, run_snapshots, offloader
+
+    component_pool.configure(
+        max_memory_mb=getattr(settings, 'COMPONENT_POOL_MAX_MEMORY_MB', None),
+        idle_ttl=getattr(settings, 'COMPONENT_POOL_IDLE_TTL', None),
+        max_instances_per_key=getattr(settings, 'COMPONENT_POOL_MAX_INSTANCES_PER_KEY', None),
+    )
+    node_result_cache.configure(
+        max_memory_mb=getattr(settings, 'NODE_RESULT_CACHE_MAX_MEMORY_MB', None),
+        cache_dir=getattr(settings, 'NODE_RESULT_CACHE_DIR', None),
+        max_disk_mb=getattr(settings, 'NODE_RESULT_CACHE_MAX_DISK_MB', None),
+    )
+    llm_response_cache.configure(
+        path=getattr(settings, 'LLM_RESPONSE_CACHE_PATH', None),
+        ttl=getattr(settings, 'LLM_RESPONSE_CACHE_TTL', None),
+        max_mb=getattr(settings, 'LLM_RESPONSE_CACHE_MAX_MB', None),
+        semantic_model=getattr(settings, 'LLM_RESPONSE_CACHE_SEMANTIC_MODEL', None),
+        semantic_threshold=getattr(settings, 'LLM_RESPONSE_CACHE_SEMANTIC_THRESHOLD', None),
+        semantic_candidates=getattr(settings, 'LLM_RESPONSE_CACHE_SEMANTIC_CANDIDATES', None),
+        cache_sampled=getattr(settings, 'LLM_RESPONSE_CACHE_SAMPLED', None),
+    )
+    run_snapshots.configure(
+        max_workflows=getattr(settings, 'WORKFLOW_SNAPSHOT_MAX_WORKFLOWS', None),
+        snapshot_dir=getattr(settings, 'WORKFLOW_SNAPSHOT_DIR', None),
+    )
+    offloader.configure(
+        io_threads=getattr(settings, 'COMPONENT_IO_THREADS', None),
+        compute_threads=getattr(settings, 'COMPONENT_COMPUTE_THREADS', None),
+        processes=getattr(settings, 'COMPONENT_CPU_PROCESSES', None),
+    )
+
+
 class WorkflowsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workflows'
+
+    def ready(self):
+        """注册信号处理函数，并按配置初始化执行引擎"""
+        from django.conf import settings
+        from . import signals  # noqa: F401  节点和边变化时让执行计划缓存失效
+
+        configure_engine(settings)
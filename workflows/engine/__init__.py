@@ -0,0 +1,23 @@
+"""
+工作流执行引擎
+负责把工作流的节点和边变成可执行的图，并调度各个组件执行
+
+从视图层（workflows/api/views.py）拆出来，方便单独维护和复用：
+    plan = plan_cache.get(workflow)             # 获取（必要时编译）执行计划
+    outputs = await WorkflowRunner(plan).run(inputs)
+"""
+from .exceptions import WorkflowExecutionError, PlanCompileError, NodeExecutionError
+from .scheduler import DAGScheduler
+from .wiring import build_wiring_index
+from .plan import ExecutionPlan, NodeSpec, compile_plan, plan_cache
+from .pool import ComponentPool, component_pool
+from .offload import Offloader, offloader
+from .memo import NodeResultCache, node_result_cache
+from .llm_cache import LLMResponseCache, llm_response_cache
+from .snapshots import RunSnapshotStore, run_snapshots
+from .trace import RunTrace
+from .runner import WorkflowRunner
+from .batch import BatchRunner
+from .serialization import to_jsonable
+from .streaming import stream_workflow_events, format_sse
+from .loop import EngineLoop, engine_loop
@@ -0,0 +1,199 @@
+"""
+批量执行：同一个工作流跑多组输入
+
+和逐个调用execute相比：
+    - 只获取一次执行计划，整个批次共用
+    - 整个DAG只走一遍，已加载模型的实例从实例池借用，整批输入复用
+    - 组件重写了execute_batch（例如HuggingFaceComponent）时，整批输入一次交给组件，由组件自己做批处理；
+      没有重写的组件，各条输入在并发上限内同时执行
+    - 某一条输入在某个节点失败，只影响这一条输入（它的下游节点会跳过），不影响批次里的其他输入
+
+按组件的execution_mode处理并发（见engine/offload.py）：
+    - async、io：每条输入各借一个实例，在事件循环里并发（io在IO线程池里并行）。
+      很多组件在execute里把self.llm、self.vector_store换成这次调用的对象，多条输入同时用一个实例会互相覆盖
+      （声明了init_params的组件，同一个键的实例数受实例池的max_instances_per_key限制，超出的输入等待归还）
+    - gil_releasing：模型很大，所有输入共用一个实例，逐条放到计算线程池里执行（同一个实例同一时间只跑一条）
+    - 重写了execute_batch的组件：整个批次借一个实例，整批交给它
+    - cpu：每条输入交给进程池，各个子进程有自己的实例
+"""
+
+import asyncio
+import copy
+from typing import Any, Dict, List, Optional
+
+from components.base.admission import workflow_scope
+from components.base.component import BaseComponent
+
+from .exceptions import WorkflowExecutionError
+from .llm_cache import llm_response_cache
+from .plan import ExecutionPlan
+from .offload import ExecutionMode, offloader
+from .pool import component_pool
+from .runner import WorkflowRunner, _execute_in_thread
+from .scheduler import DAGScheduler
+
+
+class BatchRunner(WorkflowRunner):
+    """批量执行一个工作流，results里每个节点的值是按输入顺序排列的结果列表"""
+
+    def __init__(self, plan: ExecutionPlan, max_concurrency: int = 8):
+        """
+        Args:
+            plan: 编译好的执行计划
+            max_concurrency: 整个批次同时执行的组件调用数上限（所有节点共享），0表示不限制
+        """
+        super().__init__(plan)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._errors: Dict[int, str] = {}  # 输入序号 -> 错误信息
+        self._size = 0
+
+    async def run_batch(self, batch_inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        执行一批输入
+
+        Args:
+            batch_inputs: 输入参数列表，每一项和execute接口的inputs相同
+
+        Returns:
+            List[Dict[str, Any]]: 和输入一一对应，成功为{"status": "success", "output": {...}}，
+                                  失败为{"status": "failed", "error": "..."}
+        """
+        self._size = len(batch_inputs)
+        self._errors = {}
+        self._semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+
+        results: Dict[str, List[Any]] = {}
+        if any('start' in item for item in batch_inputs):
+            results['start'] = [item.get('start') for item in batch_inputs]
+
+        scheduler = DAGScheduler(self.plan.graph, max_concurrency=self.plan.max_concurrency)
+        with workflow_scope(self.plan.workflow_id):
+            await scheduler.run(self._run_node, results)
+
+        items = []
+        for i in range(self._size):
+            if i in self._errors:
+                items.append({'status': 'failed', 'error': self._errors[i]})
+            else:
+                items.append({
+                    'status': 'success',
+                    'output': {
+                        node_id: results[node_id][i]
+                        for node_id in self.plan.output_nodes
+                        if node_id in results and results[node_id][i] is not None
+                    }
+                })
+        return items
+
+    def _item_view(self, node_id: str, results: Dict[str, List[Any]], index: int) -> Dict[str, Any]:
+        """取出第index条输入在上游节点上的结果，组成和单次执行相同结构的results"""
+        return {
+            source_node: results[source_node][index]
+            for source_node, _, _ in self.plan.nodes[node_id].wiring
+            if source_node in results and results[source_node][index] is not None
+        }
+
+    async def _guarded(self, coro):
+        """在批次的并发上限内执行一个协程"""
+        if self._semaphore is None:
+            return await coro
+        async with self._semaphore:
+            return await coro
+
+    async def _execute_leased(self, spec, inputs: Dict[str, Any], node_params: Dict[str, Any]) -> Any:
+        """单独借一个实例执行一条输入，io模式的组件放到线程池里执行"""
+        node_params = copy.deepcopy(node_params)
+        async with component_pool.lease(spec.component_class, node_params) as component_instance:
+            if spec.execution_mode == ExecutionMode.ASYNC:
+                return await component_instance.execute(inputs, node_params)
+            return await offloader.run_in_thread(spec.execution_mode, _execute_in_thread, component_instance, inputs, node_params)
+
+    @staticmethod
+    async def _execute_batch(spec, component_instance, batch_inputs: List[Dict[str, Any]], node_params: Dict[str, Any]) -> List[Any]:
+        """调用组件的execute_batch，阻塞型的组件放到线程池里执行"""
+        if spec.execution_mode == ExecutionMode.ASYNC:
+            return await component_instance.execute_batch(batch_inputs, node_params)
+        return await offloader.run_in_thread(
+            spec.execution_mode,
+            lambda: asyncio.run(component_instance.execute_batch(batch_inputs, node_params))
+        )
+
+    async def _run_node(self, node_id: str, results: Dict[str, List[Any]]) -> Any:
+        """对所有还没失败的输入执行一个节点"""
+        spec = self.plan.nodes.get(node_id)
+        if spec is None:
+            return None
+
+        outputs: List[Any] = [None] * self._size
+        active = [i for i in range(self._size) if i not in self._errors]
+        if not active:
+            return outputs
+
+        node_params = copy.deepcopy(spec.params)
+        await self._resolve_credential(node_id, node_params)
+        batch_inputs = [self._prepare_inputs(node_id, self._item_view(node_id, results, i)) for i in active]
+
+        # LLM节点先查响应缓存，只有没命中的输入才交给组件
+        llm_entries = {}
+        if spec.component_kind == 'llm' and llm_response_cache.enabled:
+            for i, inputs in zip(active, batch_inputs):
+                entry = llm_response_cache.make_entry(spec.component_class, spec.params, inputs)
+                if entry is not None:
+                    llm_entries[i] = entry
+            looked_up = await asyncio.gather(*(asyncio.to_thread(llm_response_cache.lookup, e) for e in llm_entries.values()))
+            for i, (hit, value) in zip(list(llm_entries), looked_up):
+                if hit:
+                    outputs[i] = value
+                    del llm_entries[i]
+            pending = [(i, inputs) for i, inputs in zip(active, batch_inputs) if outputs[i] is None]
+            if not pending:
+                return outputs
+            active, batch_inputs = [i for i, _ in pending], [inputs for _, inputs in pending]
+
+        mode = spec.execution_mode
+        supports_batch = spec.component_class.execute_batch is not BaseComponent.execute_batch
+        if mode == ExecutionMode.CPU:
+            batch_results = await asyncio.gather(
+                *(self._guarded(offloader.run_in_process(spec.component_class, inputs, node_params)) for inputs in batch_inputs),
+                return_exceptions=True
+            )
+        elif mode in (ExecutionMode.ASYNC, ExecutionMode.IO) and not supports_batch:
+            batch_results = await asyncio.gather(
+                *(self._guarded(self._execute_leased(spec, inputs, node_params)) for inputs in batch_inputs),
+                return_exceptions=True
+            )
+        else:
+            # 整个批次只借一次实例
+            async with component_pool.lease(spec.component_class, node_params) as component_instance:
+                if supports_batch:
+                    # 组件自己支持批处理，整批交给它
+                    try:
+                        batch_results = await self._guarded(self._execute_batch(spec, component_instance, batch_inputs, node_params))
+                    except WorkflowExecutionError:
+                        raise
+                    except Exception as e:
+                        batch_results = [e] * len(active)
+                else:
+                    batch_results = []
+                    for inputs in batch_inputs:
+                        try:
+                            batch_results.append(await self._guarded(offloader.run_in_thread(
+                                mode, _execute_in_thread, component_instance, inputs, copy.deepcopy(node_params)
+                            )))
+                        except Exception as e:
+                            batch_results.append(e)
+
+        for i, result in zip(active, batch_results):
+            if isinstance(result, BaseException):
+                self._errors[i] = f"节点 {node_id} 执行失败：{str(result)}"
+            else:
+                outputs[i] = result
+
+        # 组件把调用失败包装成{"error": ...}返回，这样的结果不缓存
+        await asyncio.gather(*(
+            asyncio.to_thread(llm_response_cache.store, entry, outputs[i])
+            for i, entry in llm_entries.items()
+            if isinstance(outputs[i], dict) and 'error' not in outputs[i]
+        ))
+        return outputs
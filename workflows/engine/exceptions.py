@@ -0,0 +1,28 @@
+"""
+执行引擎的异常定义
+
+所有异常都带有建议返回给前端的HTTP状态码，
+视图层统一捕获WorkflowExecutionError后转换为Response，引擎本身不依赖DRF。
+"""
+from http import HTTPStatus
+
+
+class WorkflowExecutionError(Exception):
+    """工作流执行相关异常的基类"""
+    def __init__(self, message: str, status_code: int = HTTPStatus.INTERNAL_SERVER_ERROR):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class PlanCompileError(WorkflowExecutionError):
+    """工作流编译失败（有环、组件不存在、组件类无法导入等），默认视为请求错误"""
+    def __init__(self, message: str, status_code: int = HTTPStatus.BAD_REQUEST):
+        super().__init__(message, status_code)
+
+
+class NodeExecutionError(WorkflowExecutionError):
+    """节点执行失败时抛出，携带出错的节点ID"""
+    def __init__(self, node_id: str, message: str, status_code: int = HTTPStatus.INTERNAL_SERVER_ERROR):
+        super().__init__(message, status_code)
+        self.node_id = node_id
@@ -0,0 +1,344 @@
+"""
+LLM响应缓存
+
+FAQ、客服这一类工作流里，大量请求问的其实是同一个问题，每次都让模型重新生成一遍既慢又费钱（Gemini按token计费，
+本地模型要占着CPU/GPU几十秒）。执行引擎对所有type为llm的组件（元数据里的type）统一加一层响应缓存：
+
+只缓存确定性的生成：
+    温度大于0时每次生成的内容本来就不一样，用户期望的也是不同的回答，默认不缓存这样的调用；
+    温度取节点参数，没有设置时取组件元数据里的默认值，组件声明了temperature参数却没有默认值时也当作随机生成。
+    FAQ这类确实希望复用回答的场景可以打开cache_sampled（LLM_RESPONSE_CACHE_SAMPLED）。
+
+精确匹配：
+    键由(组件类, 采样参数, 规范化的提示词)计算得到。采样参数就是节点参数（模型名、温度、top_p……），
+    但不包括api_key、凭证这类和生成结果无关的参数；提示词去掉首尾空白、连续的空白合并成一个空格。
+
+语义匹配（可选，配置了semantic_model时打开）：
+    用HuggingFaceEmbeddings（和向量存储组件共用components/base/embeddings.py里的同一份模型）把提示词转成向量，
+    和响应一起保存；精确匹配没有命中时，在采样参数相同的缓存里找余弦相似度最高的提示词，超过semantic_threshold就直接返回它的响应，
+    “退货流程是什么”和“退货的流程是什么？”这样的近似问题也能命中。
+    只和同一个scope里最近使用过的semantic_candidates条响应比较，缓存再大，一次查找的代价也是固定的。
+    查找时算出的提示词向量保存在LLMCacheEntry里，没有命中、调用模型之后store直接用它，同一个提示词只嵌入一次。
+
+存储在一个单独的SQLite文件里（不占用Django的数据库），多个worker进程共享：
+    - 超过ttl秒的响应不再使用，0表示永不过期
+    - 总大小超过max_mb时，按最久未使用的顺序删除
+
+只缓存成功的结果：组件返回的结果里带error键时不缓存。流式执行命中缓存时，整段响应作为一个token事件发出。
+每个节点的命中情况记录在追踪记录的llm_cache字段里（hit / semantic_hit / miss），整次执行的汇总见trace.to_dict()。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple, Type
+
+from components.base.embeddings import embedding_registry
+
+try:
+    import numpy as np
+except ImportError:  # numpy随嵌入模型一起安装，没有安装时不使用语义匹配
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 和生成结果无关、不参与缓存键的参数：密钥和凭证，以及只影响吞吐量的批处理参数
+IGNORED_PARAMS = {'api_key', 'credential', 'credentialId', 'batch_size', 'batch_wait_ms'}
+
+_WHITESPACE = re.compile(r'\s+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope);
+CREATE INDEX IF NOT EXISTS responses_scope_accessed_at ON responses (scope, accessed_at);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """去掉首尾空白，连续的空白（包括换行）合并成一个空格"""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+
+def _temperature(params: Dict[str, Any], metadata: Dict[str, Any]) -> Optional[float]:
+    """
+    这次调用的采样温度，节点参数里没有时取元数据里的默认值
+
+    Returns:
+        Optional[float]: 组件没有temperature参数时返回0（确定性生成），声明了但取不到数值时返回None
+    """
+    value = params.get('temperature')
+    if value is None:
+        declared = [p for p in metadata.get('params') or [] if isinstance(p, dict) and p.get('name') == 'temperature']
+        if not declared:
+            return 0.0
+        value = declared[0].get('default')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class LLMCacheEntry:
+    """一次LLM调用在缓存里的位置"""
+    scope: str  # 组件类和采样参数的哈希，语义匹配只在同一个scope里查找
+    key: str  # scope加上规范化提示词的哈希，精确匹配用
+    prompt: str  # 规范化的提示词
+    vector: Optional[Any] = field(default=None, repr=False)  # lookup时算出的提示词向量，store时直接使用
+
+
+class LLMResponseCache:
+    """进程内共享的LLM响应缓存，数据保存在SQLite文件里"""
+
+    # 每写入多少次检查一次总大小
+    CHECK_SIZE_EVERY = 32
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            ttl: int = 86400,
+            max_mb: int = 256,
+            semantic_model: Optional[str] = None,
+            semantic_threshold: float = 0.95,
+            semantic_candidates: int = 1000,
+            cache_sampled: bool = False
+    ):
+        """
+        Args:
+            path: SQLite文件路径，None或空字符串表示不使用响应缓存
+            ttl: 响应的有效期（秒），0表示永不过期
+            max_mb: 缓存的大小上限（MB），0表示不限制
+            semantic_model: 语义匹配使用的嵌入模型名称，None或空字符串表示只做精确匹配
+            semantic_threshold: 语义匹配的余弦相似度阈值
+            semantic_candidates: 语义匹配最多和多少条最近使用过的响应比较
+            cache_sampled: 温度大于0的调用是否也缓存
+        """
+        self.path = path or None
+        self.ttl = ttl
+        self.max_mb = max_mb
+        self.semantic_model = semantic_model or None
+        self.semantic_threshold = semantic_threshold
+        self.semantic_candidates = semantic_candidates
+        self.cache_sampled = cache_sampled
+        self._local = threading.local()  # SQLite连接不能跨线程使用，每个线程各自打开一个
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def configure(
+            self,
+            path: Optional[str] = None,
+            ttl: Optional[int] = None,
+            max_mb: Optional[int] = None,
+            semantic_model: Optional[str] = None,
+            semantic_threshold: Optional[float] = None,
+            semantic_candidates: Optional[int] = None,
+            cache_sampled: Optional[bool] = None
+    ) -> None:
+        """根据配置设置缓存，在应用启动时调用"""
+        if path is not None:
+            self.path = path or None
+        if ttl is not None:
+            self.ttl = ttl
+        if max_mb is not None:
+            self.max_mb = max_mb
+        if semantic_model is not None:
+            self.semantic_model = semantic_model or None
+        if semantic_threshold is not None:
+            self.semantic_threshold = semantic_threshold
+        if semantic_candidates is not None:
+            self.semantic_candidates = semantic_candidates
+        if cache_sampled is not None:
+            self.cache_sampled = cache_sampled
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def make_entry(self, component_class: Type, params: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[LLMCacheEntry]:
+        """
+        计算一次调用的缓存位置
+
+        输入里没有字符串形式的prompt、或者是随机生成（温度大于0）而没有打开cache_sampled时返回None（不走缓存）
+        """
+        prompt = inputs.get('prompt')
+        if not isinstance(prompt, str):
+            return None
+
+        metadata = component_class.get_metadata()
+        if not self.cache_sampled:
+            temperature = _temperature(params, metadata)
+            if temperature is None or temperature > 0:
+                return None
+
+        sampling = {name: value for name, value in params.items() if name not in IGNORED_PARAMS}
+        scope = hashlib.sha256(json.dumps({
+            'component': f"{component_class.__module__}.{component_class.__qualname__}",
+            'version': metadata.get('version'),
+            'params': sampling,
+        }, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+        prompt = normalize_prompt(prompt)
+        key = hashlib.sha256(f'{scope}\n{prompt}'.encode('utf-8')).hexdigest()
+        return LLMCacheEntry(scope, key, prompt)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.path == self.path:
+            return conn
+        if conn is not None:
+            conn.close()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL模式下读写互不阻塞，多个worker进程同时访问时也不容易出现database is locked
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        self._local.conn, self._local.path = conn, self.path
+        return conn
+
+    def _embed(self, prompt: str) -> Optional[Any]:
+        """把提示词转成归一化的向量，没有配置语义匹配或者嵌入模型不可用时返回None"""
+        if self.semantic_model is None or np is None:
+            return None
+        try:
+            embeddings = embedding_registry.get(self.semantic_model)
+        except Exception as e:
+            logger.warning(f"无法加载语义缓存的嵌入模型{self.semantic_model}，只使用精确匹配：{str(e)}")
+            self.semantic_model = None
+            return None
+        vector = np.asarray(embeddings.embed_query(prompt), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, entry: LLMCacheEntry) -> Tuple[Optional[str], Any]:
+        """
+        查找缓存的响应（会阻塞，在事件循环里需要放到线程里调用）
+
+        Returns:
+            (命中方式, 响应)，命中方式为hit或semantic_hit，没有命中时为(None, None)
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            oldest = now - self.ttl if self.ttl else 0
+
+            row = conn.execute(
+                'SELECT key, response FROM responses WHERE key = ? AND created_at >= ?', (entry.key, oldest)
+            ).fetchone()
+            status = 'hit'
+
+            if row is None:
+                vector = entry.vector = self._embed(entry.prompt)
+                if vector is None:
+                    return None, None
+                # 只比较最近使用过的一部分，查找的代价不随缓存的大小增长
+                rows = conn.execute(
+                    'SELECT key, response, embedding FROM responses '
+                    'WHERE scope = ? AND embedding IS NOT NULL AND created_at >= ? '
+                    'ORDER BY accessed_at DESC LIMIT ?', (entry.scope, oldest, self.semantic_candidates)
+                ).fetchall()
+                if not rows:
+                    return None, None
+                matrix = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, _, embedding in rows])
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] < self.semantic_threshold:
+                    return None, None
+                row = rows[best][:2]
+                status = 'semantic_hit'
+
+            with conn:
+                conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, row[0]))
+            return status, json.loads(row[1])
+        except Exception as e:
+            # 缓存只是加速手段，出问题时当作没有命中，照常调用模型
+            logger.warning(f"读取LLM响应缓存失败：{str(e)}")
+            return None, None
+
+    def store(self, entry: LLMCacheEntry, response: Any) -> None:
+        """保存一次调用的响应（会阻塞，在事件循环里需要放到线程里调用），响应无法JSON序列化时不保存"""
+        try:
+            data = json.dumps(response, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return
+
+        try:
+            vector = entry.vector if entry.vector is not None else self._embed(entry.prompt)
+            embedding = vector.tobytes() if vector is not None else None
+            size = len(data.encode('utf-8')) + len(entry.prompt.encode('utf-8')) + len(embedding or b'')
+            now = time.time()
+
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses '
+                    '(key, scope, prompt, response, embedding, size, created_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (entry.key, entry.scope, entry.prompt, data, embedding, size, now, now)
+                )
+
+            with self._lock:
+                self._writes += 1
+                check = self._writes % self.CHECK_SIZE_EVERY == 1
+            if check:
+                self._evict(conn, now)
+        except Exception as e:
+            logger.warning(f"写入LLM响应缓存失败：{str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """删除过期的响应，总大小超过上限时再按最久未使用的顺序删除"""
+        with conn:
+            if self.ttl:
+                conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+            if not self.max_mb:
+                return
+            budget = self.max_mb * 1024 * 1024
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total <= budget:
+                return
+            evicted = []
+            for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+                if total <= budget:
+                    break
+                evicted.append((key,))
+                total -= size
+            conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        if self.enabled:
+            conn = self._connect()
+            with conn:
+                conn.execute('DELETE FROM responses')
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {'enabled': False}
+        conn = self._connect()
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {
+            'enabled': True,
+            'entries': entries,
+            'size_mb': round(size / 1024 / 1024, 2),
+            'semantic': self.semantic_model is not None,
+        }
+
+
+# 全局唯一的LLM响应缓存
+llm_response_cache = LLMResponseCache()
@@ -0,0 +1,81 @@
+"""
+引擎共享的事件循环
+
+Django的视图是同步的（manage.py runserver、gunicorn这类WSGI部署），原来每个请求都用async_to_sync跑一次执行引擎：
+    - async_to_sync每次都新建一个事件循环，请求结束就关掉。按事件循环保存的LLM客户端（components/base/llm_clients.py）
+      和它们的keep-alive连接在请求之间没法复用，每个请求都要重新建连
+    - 把异步生成器交给StreamingHttpResponse时，WSGI下Django会先把它整个收集成列表再发送，
+      SSE事件要等工作流全部执行完才一起到达客户端，流式输出就失去了意义
+
+EngineLoop在一个后台线程里运行一个常驻的事件循环，所有请求的工作流都提交到这个循环上执行：
+    - run(coro)：提交协程并阻塞等待结果，代替async_to_sync
+    - iterate(async_iterable)：把异步生成器桥接成同步迭代器，事件产生一个就通过queue.Queue交给请求线程发送一个
+
+执行引擎里用sync_to_async访问数据库的地方（例如凭证查询）不在async_to_sync里调用，
+会由asgiref的单线程执行器执行，不会阻塞这个事件循环。
+"""
+
+import asyncio
+import queue
+import threading
+from typing import Any, AsyncIterable, Awaitable, Iterator, Optional
+
+_DONE = object()
+
+
+class EngineLoop:
+    """后台线程里常驻的事件循环，第一次用到时才启动"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # fork出来的子进程里没有这个线程，要重新启动
+            if self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name='workflow-engine-loop', daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro: Awaitable) -> Any:
+        """在共享的事件循环里执行协程，阻塞当前线程直到得到结果（协程抛出的异常原样抛出）"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def iterate(self, async_iterable: AsyncIterable) -> Iterator:
+        """
+        在共享的事件循环里迭代异步生成器，把它产出的值逐个交给调用方的同步迭代器
+
+        调用方提前关闭迭代器时（例如客户端断开连接），异步生成器所在的任务会被取消
+        """
+        items: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in async_iterable:
+                    items.put((True, item))
+            except Exception as e:
+                items.put((False, e))
+            finally:
+                items.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._get_loop())
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                ok, value = item
+                if not ok:
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+
+# 全局唯一的引擎事件循环
+engine_loop = EngineLoop()
@@ -0,0 +1,346 @@
+"""
+节点结果缓存（按内容寻址）
+
+很多工作流每次执行时上游节点的参数和输入都没有变：同一个PDFLoader的file_path，同样chunk_size和chunk_overlap的文本分割器……
+这些节点的结果是确定的，重复执行只是在浪费时间。给节点打开cache_results后，执行引擎会先按
+    (组件类, 组件版本, 规范化的参数, 输入内容的哈希)
+计算缓存键，命中就直接使用缓存的结果、跳过这个节点，重复执行时只有真正变化的部分需要重新计算。
+
+参数里的字符串如果是一个存在的文件路径（例如加载器的file_path），还会把文件的修改时间和大小一起算进键里，
+文件被替换或修改后缓存自然失效。
+
+两级缓存：
+    - 内存：进程内的LRU，按序列化后的字节数限制总大小
+    - 磁盘：pickle文件，进程重启或多个worker进程之间也能命中，超出容量时按最久未访问的顺序删除
+      磁盘占用只在第一次写入时扫描一遍目录，之后随写入、覆盖和删除增减，只有真的超出容量时才再遍历目录做淘汰
+
+get和set会做pickle和磁盘读写，执行引擎在线程里调用它们，不要在事件循环里直接调用。
+
+只有能被确定地描述的输入才会参与缓存：除了JSON本身支持的类型，只认pydantic模型（例如LangChain的Document）、
+集合、bytes、numpy数组、日期时间、Decimal、UUID、路径和枚举。输入里有向量存储、记忆对象、DataFrame这类其他对象时，
+这次执行不走缓存：它们的repr要么只有内存地址（会被复用），要么像大数组一样用“...”省略了中间的内容，
+用来做键都可能错误地命中别的值的结果。结果无法pickle时同样不缓存。
+"""
+
+import datetime
+import decimal
+import enum
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # numpy是可选依赖，没有安装时输入里也不会出现numpy对象
+    np = None
+
+# repr能完整、确定地描述内容的类型
+_REPR_TYPES = (datetime.date, datetime.time, datetime.timedelta, decimal.Decimal, uuid.UUID, pathlib.PurePath)
+
+
+class UncacheableValue(Exception):
+    """值无法被确定地描述，不能作为缓存键的一部分"""
+
+
+def _canonical(value: Any) -> Any:
+    """
+    json.dumps的default回调，把支持的非JSON对象转换为稳定的描述
+
+    Raises:
+        UncacheableValue: 不在支持范围内的类型
+    """
+    if hasattr(value, 'model_dump'):  # pydantic v2模型，例如LangChain的Document
+        return {'__type__': type(value).__qualname__, **value.model_dump()}
+    if hasattr(value, 'dict') and hasattr(value, '__fields__'):  # pydantic v1模型
+        return {'__type__': type(value).__qualname__, **value.dict()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+    if isinstance(value, enum.Enum):
+        return {'__type__': type(value).__qualname__, 'value': value.value}
+    if isinstance(value, _REPR_TYPES):
+        return {'__type__': type(value).__qualname__, 'repr': repr(value)}
+    if np is not None:
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            # 数组的repr会省略中间的元素，按完整的数据计算哈希
+            data = np.ascontiguousarray(value)
+            return {
+                '__type__': 'ndarray', 'dtype': data.dtype.str, 'shape': list(data.shape),
+                'sha256': hashlib.sha256(data.tobytes()).hexdigest()
+            }
+        if isinstance(value, np.generic):
+            return value.item()
+    # 其他对象的repr可能只有内存地址，或者省略了部分内容，不能代表对象的全部内容
+    raise UncacheableValue(type(value).__qualname__)
+
+
+def _file_fingerprints(params: Dict[str, Any]) -> Dict[str, Tuple[int, int]]:
+    """找出参数里指向已存在文件的路径，记录它们的修改时间和大小"""
+    fingerprints = {}
+    for name, value in params.items():
+        if isinstance(value, str) and value and os.path.isfile(value):
+            stat = os.stat(value)
+            fingerprints[name] = (stat.st_mtime_ns, stat.st_size)
+    return fingerprints
+
+
+class NodeResultCache:
+    """进程内共享的节点结果缓存"""
+
+    def __init__(self, max_memory_mb: int = 256, cache_dir: Optional[str] = None, max_disk_mb: int = 2048):
+        """
+        Args:
+            max_memory_mb: 内存缓存的大小上限（MB），0表示不使用内存缓存
+            cache_dir: 磁盘缓存目录，None或空字符串表示不使用磁盘缓存
+            max_disk_mb: 磁盘缓存的大小上限（MB），0表示不限制
+        """
+        self.max_memory_mb = max_memory_mb
+        self.cache_dir = cache_dir or None
+        self.max_disk_mb = max_disk_mb
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # 第一次写磁盘时才统计
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(
+            self,
+            max_memory_mb: Optional[int] = None,
+            cache_dir: Optional[str] = None,
+            max_disk_mb: Optional[int] = None
+    ) -> None:
+        """根据配置调整容量和磁盘目录，在应用启动时调用"""
+        with self._lock:
+            if max_memory_mb is not None:
+                self.max_memory_mb = max_memory_mb
+            if cache_dir is not None:
+                self.cache_dir = str(cache_dir) or None
+                self._disk_bytes = None
+            if max_disk_mb is not None:
+                self.max_disk_mb = max_disk_mb
+
+    @staticmethod
+    def make_key(component_class, params: Dict[str, Any], inputs: Dict[str, Any]) -> Optional[str]:
+        """
+        计算节点结果的缓存键
+
+        Args:
+            component_class: 组件类
+            params: 节点参数（凭证还没有被替换成内容，只会出现凭证ID）
+            inputs: 已经按连线准备好的节点输入
+
+        Returns:
+            Optional[str]: sha256十六进制字符串，输入无法被确定地描述时返回None
+        """
+        try:
+            metadata = component_class.get_metadata()
+        except Exception:
+            metadata = {}
+        try:
+            inputs_digest = hashlib.sha256(
+                json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=_canonical).encode('utf-8')
+            ).hexdigest()
+            payload = json.dumps({
+                'component': f"{component_class.__module__}.{component_class.__qualname__}",
+                'version': metadata.get('version'),
+                'params': params,
+                'files': _file_fingerprints(params),
+                'inputs': inputs_digest,
+            }, sort_keys=True, ensure_ascii=False, default=_canonical)
+        except (UncacheableValue, TypeError, ValueError) as e:
+            logger.debug(f"节点输入无法作为缓存键，跳过缓存：{e}")
+            return None
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        查询缓存
+
+        Returns:
+            Tuple[bool, Any]: (是否命中, 结果)，每次命中都返回一份新反序列化的结果，下游修改它不会影响缓存
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+
+        if data is None:
+            data = self._read_disk(key)
+            if data is not None:
+                self._remember(key, data)
+
+        if data is None:
+            self._count(hit=False)
+            return False, None
+        try:
+            value = pickle.loads(data)
+        except Exception as e:
+            logger.warning(f"节点结果缓存已损坏，忽略：{e}")
+            self.invalidate(key)
+            self._count(hit=False)
+            return False, None
+        self._count(hit=True)
+        return True, value
+
+    def _count(self, hit: bool) -> None:
+        """更新命中统计，多个线程会同时查询，和stats()一样在锁里进行"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, value: Any) -> bool:
+        """写入缓存，结果无法pickle时不缓存并返回False"""
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"节点结果无法序列化，不缓存：{e}")
+            return False
+        self._remember(key, data)
+        self._write_disk(key, data)
+        return True
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """删除指定的缓存项，不传键则清空内存缓存（磁盘缓存目录需要手动清理）"""
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+                self._memory_bytes = 0
+                return
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory_bytes -= len(data)
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存的统计信息"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'memory_mb': round(self._memory_bytes / 1024 / 1024, 1),
+                'disk_mb': round((self._disk_bytes or 0) / 1024 / 1024, 1),
+            }
+
+    def _remember(self, key: str, data: bytes) -> None:
+        """放进内存LRU，超出上限时淘汰最久未使用的项"""
+        budget = self.max_memory_mb * 1024 * 1024
+        if budget <= 0 or len(data) > budget:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > budget:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # 记录访问时间，容量超限时按它淘汰
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            # 覆盖已有的文件时，总量里要先减掉旧文件的大小
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，其他进程不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"节点结果写入磁盘缓存失败：{e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data) - replaced
+            if self.max_disk_mb > 0 and self._disk_bytes > self.max_disk_mb * 1024 * 1024:
+                self._evict_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict_disk(self) -> None:
+        """磁盘缓存超出容量时按最久未访问的顺序删除，直到降到上限的90%，调用方需要持有锁"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_mb * 1024 * 1024 * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+# 全局唯一的节点结果缓存
+node_result_cache = NodeResultCache()
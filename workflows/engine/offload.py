@@ -0,0 +1,171 @@
+"""
+把组件里的阻塞工作从事件循环挪到线程池/进程池
+
+组件的execute都是async的，但很多组件在里面做的是阻塞操作：huggingface.py、llama.py里的模型推理，
+gemini.py、deepseekr1.py里同步的invoke，PyPDFLoader.load()，FAISS.from_documents，Chroma.persist()……
+直接在事件循环里执行时，一次几十秒的生成会让同一个进程里所有请求都跟着卡住。
+
+组件在元数据里声明execution_mode（见components.base.component.ExecutionMode），引擎按它选择执行的地方：
+    - async：直接在事件循环里await，默认值
+    - io：IO线程池，线程数可以多一些，大部分时间都在等网络或磁盘
+    - gil_releasing：计算线程池，线程数和CPU核数相当；模型实例留在本进程里，仍然可以从实例池复用
+    - cpu：进程池，绕开GIL；组件类、参数、输入和结果都要能pickle，每个子进程有自己的实例池
+      守护进程不允许创建子进程，在守护进程里执行时cpu模式退回到计算线程池
+      子进程只导入要执行的组件自己的模块（components.implementations是按需导入的），不会加载torch、faiss这些用不到的库；
+      子进程不执行Django的apps.ready()，由_init_process按配置设置各个进程内单例
+
+在线程里执行时，组件的execute协程在该线程自己的事件循环里跑完，并且复制了调用方的contextvars，
+所以token流（components/base/streaming.py）在线程里也能正常转发。
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Type
+
+from components.base.component import ExecutionMode
+
+from .pool import component_pool
+
+logger = logging.getLogger(__name__)
+
+# 在线程池里执行的模式
+THREAD_MODES = (ExecutionMode.IO, ExecutionMode.GIL_RELEASING)
+
+
+def parse_execution_mode(value: Any) -> ExecutionMode:
+    """把元数据里的execution_mode转换为ExecutionMode，无法识别时按async处理"""
+    try:
+        return ExecutionMode(value or ExecutionMode.ASYNC)
+    except ValueError:
+        logger.warning(f"无法识别的execution_mode：{value}，按async执行")
+        return ExecutionMode.ASYNC
+
+
+def _init_process() -> None:
+    """
+    进程池子进程的初始化
+
+    只按Django配置调用各个进程内单例的configure，不做django.setup()：
+    那样会自动发现并导入全部组件，子进程又要把所有LLM和向量存储的依赖加载一遍
+    """
+    from django.conf import settings
+    from django.core.exceptions import ImproperlyConfigured
+
+    try:
+        settings.INSTALLED_APPS  # 没有配置DJANGO_SETTINGS_MODULE时抛ImproperlyConfigured，按默认配置执行
+    except ImproperlyConfigured:
+        return
+
+    from components.apps import configure_components
+    from workflows.apps import configure_engine
+
+    configure_components(settings)
+    configure_engine(settings)
+
+
+def _execute_in_process(component_class: Type, inputs: Dict[str, Any], params: Dict[str, Any]) -> Any:
+    """进程池子进程里执行组件，子进程有自己的实例池，声明了init_params的组件在同一个子进程里也能复用"""
+    with component_pool.lease(component_class, params) as component_instance:
+        return asyncio.run(component_instance.execute(inputs, params))
+
+
+class Offloader:
+    """进程内共享的线程池和进程池，都是第一次用到时才创建"""
+
+    def __init__(self, io_threads: int = 32, compute_threads: int = 0, processes: int = 0):
+        """
+        Args:
+            io_threads: IO线程池的线程数
+            compute_threads: 计算线程池（gil_releasing）的线程数，0表示CPU核数
+            processes: 进程池（cpu）的进程数，0表示CPU核数
+        """
+        self.io_threads = io_threads
+        self.compute_threads = compute_threads
+        self.processes = processes
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        self._compute_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def configure(
+            self,
+            io_threads: Optional[int] = None,
+            compute_threads: Optional[int] = None,
+            processes: Optional[int] = None
+    ) -> None:
+        """根据配置调整池的大小，在应用启动时调用（池已经创建的话不会生效）"""
+        if io_threads is not None:
+            self.io_threads = io_threads
+        if compute_threads is not None:
+            self.compute_threads = compute_threads
+        if processes is not None:
+            self.processes = processes
+
+    def _thread_pool(self, mode: ExecutionMode) -> ThreadPoolExecutor:
+        with self._lock:
+            if mode == ExecutionMode.IO:
+                if self._io_pool is None:
+                    self._io_pool = ThreadPoolExecutor(self.io_threads, thread_name_prefix='component-io')
+                return self._io_pool
+            if self._compute_pool is None:
+                self._compute_pool = ThreadPoolExecutor(
+                    self.compute_threads or os.cpu_count(),
+                    thread_name_prefix='component-compute'
+                )
+            return self._compute_pool
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                # 用spawn启动子进程：Django进程里已经有很多线程，fork出来的子进程可能继承到被锁住的锁
+                self._process_pool = ProcessPoolExecutor(
+                    self.processes or os.cpu_count(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process
+                )
+            return self._process_pool
+
+    async def run_in_thread(self, mode: ExecutionMode, func: Callable, *args) -> Any:
+        """在mode对应的线程池里执行同步函数func，并复制当前的contextvars"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._thread_pool(mode), functools.partial(context.run, func, *args))
+
+    async def run_in_process(self, component_class: Type, inputs: Dict[str, Any], params: Dict[str, Any]) -> Any:
+        """在进程池里执行一个cpu模式的组件"""
+        if multiprocessing.current_process().daemon:
+            # 守护进程不能有子进程，创建进程池会抛AssertionError，只能在本进程的计算线程池里执行
+            return await self.run_in_thread(
+                ExecutionMode.GIL_RELEASING, _execute_in_process, component_class, inputs, params
+            )
+        loop = asyncio.get_running_loop()
+        pool = self._get_process_pool()
+        try:
+            return await loop.run_in_executor(pool, _execute_in_process, component_class, inputs, params)
+        except BrokenProcessPool:
+            # 子进程异常退出（例如被OOM杀掉）后整个池都不能用了，丢掉它，下次重新创建
+            with self._lock:
+                if self._process_pool is pool:
+                    self._process_pool = None
+            pool.shutdown(wait=False)
+            raise
+
+    def shutdown(self) -> None:
+        """关闭所有池"""
+        with self._lock:
+            pools = [self._io_pool, self._compute_pool, self._process_pool]
+            self._io_pool = self._compute_pool = self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+
+# 全局唯一的执行器
+offloader = Offloader()
@@ -0,0 +1,200 @@
+"""
+工作流执行计划（编译结果）及其进程内缓存
+
+为什么需要“编译”：
+    原来每次调用execute都要重新查询节点和边、构建networkx图、检查环、拓扑排序、
+    查询Component表并用__import__导入组件模块。同一个工作流被反复执行时，这些工作的结果完全一样。
+    所以把它们一次性做完，得到一个ExecutionPlan缓存在进程里，之后的执行直接复用。
+
+缓存什么时候失效：
+    以Workflow.updated_at作为版本号。节点或边增删改时，workflows/signals.py会刷新所属工作流的updated_at，
+    所以只要版本号对不上就重新编译，多进程部署下各进程也能各自发现变化。
+"""
+
+import importlib
+import json
+import threading
+from http import HTTPStatus
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import networkx as nx
+
+from .exceptions import PlanCompileError
+from .offload import ExecutionMode, parse_execution_mode
+from .wiring import build_wiring_index
+
+
+class NodeSpec:
+    """编译后的单个节点：已经解析好的组件类、参数和输入连线表"""
+
+    def __init__(
+            self,
+            node_id: str,
+            component_class: Type,
+            params: Dict[str, Any],
+            wiring: List[Tuple[str, str, str]],
+            cache_results: bool = False,
+            execution_mode: ExecutionMode = ExecutionMode.ASYNC,
+            component_kind: Optional[str] = None
+    ):
+        self.node_id = node_id
+        self.component_class = component_class
+        self.params = params
+        # 输入连线表，每一项为(上游节点ID, 上游输出键, 本节点输入键)
+        self.wiring = wiring
+        # 是否缓存这个节点的结果（参数和输入都没变时跳过执行），见engine/memo.py
+        self.cache_results = cache_results
+        # 组件声明的执行方式，决定在事件循环、线程池还是进程池里执行，见engine/offload.py
+        self.execution_mode = execution_mode
+        # 组件元数据里的type（llm、vector_store……），llm类型的节点会经过响应缓存，见engine/llm_cache.py
+        self.component_kind = component_kind
+
+
+class ExecutionPlan:
+    """编译后的工作流执行计划"""
+
+    def __init__(
+            self,
+            workflow_id: int,
+            version: Any,
+            graph: nx.DiGraph,
+            order: List[str],
+            nodes: Dict[str, NodeSpec],
+            max_concurrency: int = 0
+    ):
+        self.workflow_id = workflow_id
+        self.version = version
+        self.graph = graph
+        self.order = order  # 拓扑顺序，仅供调试和展示，实际执行由调度器按依赖关系并发进行
+        self.nodes = nodes
+        self.max_concurrency = max_concurrency
+        # 没有出边的节点作为工作流的输出
+        self.output_nodes = [n for n in graph.nodes if graph.out_degree(n) == 0]
+
+
+def load_component_class(class_path: str) -> Type:
+    """
+    根据类路径导入组件类
+
+    Args:
+        class_path: 形如"components.implementations.llms.gemini.GeminiComponent"的完整路径，
+                    兼容旧版本同步到数据库时用“·”分隔模块和类名的写法
+    """
+    module_path, _, class_name = class_path.replace('·', '.').rpartition('.')
+    module = importlib.import_module(module_path)
+    return getattr(module, class_name)
+
+
+def compile_plan(workflow) -> ExecutionPlan:
+    """
+    把一个Workflow编译成ExecutionPlan
+
+    Raises:
+        PlanCompileError: 工作流有环、找不到组件或者组件类无法导入
+    """
+    from components.models import Component  # 延迟导入，引擎模块本身不依赖Django
+
+    nodes = list(workflow.nodes.all())
+    edges = list(workflow.edges.all())
+
+    # 构建工作流执行图
+    G = nx.DiGraph()
+    for node in nodes:
+        G.add_node(node.node_id)
+    for edge in edges:
+        G.add_edge(edge.source_node, edge.target_node)
+
+    #TODO 确保图是无环的(如果有if或者while组件怎么办)
+    if not nx.is_directed_acyclic_graph(G):
+        raise PlanCompileError('工作流有死循环，无法执行')
+
+    order = list(nx.topological_sort(G))
+
+    # 按目标节点一次性建好连线索引，避免对每个节点都扫描全部的边
+    wiring_index = build_wiring_index(edges)
+
+    specs = {}
+    component_classes = {}  # 同一个组件在工作流里出现多次时只解析一次
+    for node in nodes:
+        component_name = node.component_type
+
+        if component_name not in component_classes:
+            try:
+                component = Component.objects.get(name=component_name)
+                component_classes[component_name] = load_component_class(component.class_path)
+            except Component.DoesNotExist:
+                raise PlanCompileError(f'找不到组件：{component_name}')
+            except Component.MultipleObjectsReturned:
+                # 数据库只要求(名称, 类型)唯一，不同类型的同名组件不知道该用哪一个
+                raise PlanCompileError(f'有多个名为 {component_name} 的组件，无法确定使用哪一个')
+            except (ImportError, AttributeError, ValueError) as e:
+                raise PlanCompileError(f'组件 {component_name} 无法导入：{str(e)}', HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        # 节点参数，兼容早期以JSON字符串形式保存的数据
+        node_params = json.loads(node.data) if isinstance(node.data, str) else dict(node.data or {})
+
+        component_class = component_classes[component_name]
+        metadata = component_class.get_metadata()
+        specs[node.node_id] = NodeSpec(
+            node_id=node.node_id,
+            component_class=component_class,
+            params=node_params,
+            wiring=wiring_index.get(node.node_id, []),
+            cache_results=node.cache_results,
+            execution_mode=parse_execution_mode(metadata.get('execution_mode')),
+            component_kind=metadata.get('type')
+        )
+
+    return ExecutionPlan(
+        workflow_id=workflow.pk,
+        version=workflow.updated_at,
+        graph=G,
+        order=order,
+        nodes=specs,
+        max_concurrency=workflow.max_concurrency
+    )
+
+
+class PlanCache:
+    """
+    进程内的执行计划缓存（LRU）
+
+    以工作流ID为键，保存最近编译的计划；取用时比对版本号（updated_at），不一致就重新编译。
+    ASGI/WSGI服务器可能在多个线程里同时访问，所以用锁保护。
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self._plans: "OrderedDict[int, ExecutionPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, workflow) -> ExecutionPlan:
+        """获取工作流的执行计划，缓存未命中或已过期时重新编译"""
+        with self._lock:
+            plan = self._plans.get(workflow.pk)
+            if plan is not None and plan.version == workflow.updated_at:
+                self._plans.move_to_end(workflow.pk)
+                return plan
+
+        # 编译放在锁外面，避免一个慢编译阻塞其他工作流
+        plan = compile_plan(workflow)
+
+        with self._lock:
+            self._plans[workflow.pk] = plan
+            self._plans.move_to_end(workflow.pk)
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, workflow_id: Optional[int] = None) -> None:
+        """让指定工作流的计划失效，不传ID则清空全部"""
+        with self._lock:
+            if workflow_id is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(workflow_id, None)
+
+
+# 全局唯一的计划缓存实例
+plan_cache = PlanCache()
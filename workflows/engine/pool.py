@@ -0,0 +1,317 @@
+"""
+组件实例池
+让加载代价很高的组件实例（本地大模型、嵌入模型等）在多次工作流执行之间复用
+
+为什么需要：
+    原来每个节点每次执行都会component_class()新建实例，HuggingFaceComponent.llm、LlamaCppComponent.llm、
+    向量存储组件里的HuggingFaceEmbeddings都会随着实例一起被丢掉，下一次执行又要从磁盘重新加载几个GB的模型。
+
+怎么用：
+    组件在get_metadata()里声明"init_params"，列出会影响初始化结果的参数名，例如：
+        "init_params": ["model_id", "device", "load_in_8bit"]
+    只有这些参数的值完全相同时才会复用同一个实例；没有声明init_params的组件保持原来的行为，每次新建。
+
+    实例是“借出/归还”的：一个实例同一时间只会被一次执行使用，这样组件内部的状态（比如self.vector_store）不会在并发的请求之间互相串。
+    同一个键最多同时存在max_instances_per_key个实例（默认1个），都被借出时后来的执行等待归还，
+    而不是再加载一份几个GB的模型；本地模型后端本来也只能一次跑一个生成（见components/base/admission.py）。
+    在事件循环里要用async with借用，等待时不会阻塞事件循环：
+        async with component_pool.lease(component_class, params) as instance:
+            result = await instance.execute(inputs, params)
+
+淘汰策略：
+    - 空闲超过idle_ttl秒的实例会被丢弃
+    - 所有池化实例估算占用的内存超过max_memory_mb时，按最久未使用的顺序丢弃空闲实例
+    - 内存占用按实例第一次执行前后进程RSS的增长估算（模型通常在第一次execute时才加载）
+"""
+
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil是可选依赖，没有安装时在Linux上退回读取/proc
+    psutil = None
+
+
+def current_rss() -> int:
+    """返回当前进程的常驻内存大小（字节），无法获取时返回0"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PooledInstance:
+    """池里的一个组件实例及其统计信息"""
+
+    def __init__(self, key: Tuple, instance: Any):
+        self.key = key
+        self.instance = instance
+        self.memory = 0  # 估算的内存占用（字节）
+        self.last_used = time.monotonic()
+        self.measured = False  # 是否已经测量过内存占用
+        self.leased_memory = 0  # 借出时计入“使用中”的内存，归还时扣除
+
+
+class ComponentLease:
+    """
+    一次借用，用async with（事件循环里）或with（同步代码里）包住组件的执行，进入时才真正借出实例。
+    执行成功后实例归还到池里，执行抛出异常时实例被丢弃（可能处于初始化了一半的状态）
+    """
+
+    def __init__(self, pool: "ComponentPool", component_class: Type, key: Optional[Tuple]):
+        self.pool = pool
+        self.component_class = component_class
+        self.key = key
+        self.entry: Optional[PooledInstance] = None
+        self.instance: Any = None
+        self._rss_before = 0
+
+    def _start(self, entry: Optional[PooledInstance]) -> Any:
+        self.entry = entry
+        self.instance = entry.instance if entry is not None else self.component_class()
+        if entry is not None and not entry.measured:
+            self._rss_before = current_rss()
+        return self.instance
+
+    def __enter__(self):
+        # 同步等待会阻塞当前线程，只能在没有事件循环的线程里用（例如进程池的子进程）
+        entry = self.pool._checkout(self.component_class, self.key) if self.key is not None else None
+        return self._start(entry)
+
+    async def __aenter__(self):
+        entry = await self.pool._checkout_async(self.component_class, self.key) if self.key is not None else None
+        return self._start(entry)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.entry is None:
+            return False
+        if not self.entry.measured:
+            self.entry.memory = max(0, current_rss() - self._rss_before)
+            self.entry.measured = True
+        self.pool._checkin(self.entry, discard=exc_type is not None)
+        return False
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class ComponentPool:
+    """进程内的组件实例池"""
+
+    def __init__(self, max_memory_mb: int = 0, idle_ttl: float = 1800, max_instances_per_key: int = 1):
+        """
+        Args:
+            max_memory_mb: 池化实例的内存预算（MB），0表示不限制
+            idle_ttl: 空闲实例的最长保留时间（秒），0表示永不过期
+            max_instances_per_key: 同一个键最多同时存在的实例数（空闲的加上借出的），0表示不限制
+        """
+        self.max_memory_mb = max_memory_mb
+        self.idle_ttl = idle_ttl
+        self.max_instances_per_key = max_instances_per_key
+        self._idle: Dict[Tuple, List[PooledInstance]] = {}
+        self._instances: Dict[Tuple, int] = {}  # 每个键现有的实例数，包括借出的和正在创建的
+        self._in_use_memory = 0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)  # 同步等待的借用方
+        self._waiters: Dict[Tuple, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}  # 异步等待的借用方
+
+    def configure(
+            self,
+            max_memory_mb: Optional[int] = None,
+            idle_ttl: Optional[float] = None,
+            max_instances_per_key: Optional[int] = None
+    ) -> None:
+        """根据配置调整预算、过期时间和每个键的实例数上限，在应用启动时调用"""
+        if max_memory_mb is not None:
+            self.max_memory_mb = max_memory_mb
+        if idle_ttl is not None:
+            self.idle_ttl = idle_ttl
+        if max_instances_per_key is not None:
+            self.max_instances_per_key = max_instances_per_key
+
+    @staticmethod
+    def pool_key(component_class: Type, params: Dict[str, Any]) -> Optional[Tuple]:
+        """
+        计算实例池的键：(组件类, 初始化参数的哈希)
+
+        组件没有声明init_params时返回None，表示不参与池化
+        """
+        init_params = component_class.get_metadata().get('init_params')
+        if not init_params:
+            return None
+        values = {name: params.get(name) for name in init_params}
+        digest = hashlib.sha256(
+            json.dumps(values, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        return (component_class, digest)
+
+    def lease(self, component_class: Type, params: Dict[str, Any]) -> ComponentLease:
+        """借出一个组件实例，优先复用同键的空闲实例，没有空闲实例且没到上限时新建，否则等待归还"""
+        return ComponentLease(self, component_class, self.pool_key(component_class, params))
+
+    def _try_checkout(self, key: Tuple) -> Tuple[bool, Optional[PooledInstance]]:
+        """
+        尝试借出，调用方需要持有锁
+
+        Returns:
+            (是否借到, 空闲实例)：借到了但实例为None表示占到了一个名额，由调用方新建实例
+        """
+        self._evict_expired()
+        idle = self._idle.get(key)
+        if idle:
+            entry = idle.pop()
+            if not idle:
+                del self._idle[key]
+            entry.leased_memory = entry.memory
+            self._in_use_memory += entry.leased_memory
+            return True, entry
+        if self.max_instances_per_key <= 0 or self._instances.get(key, 0) < self.max_instances_per_key:
+            self._instances[key] = self._instances.get(key, 0) + 1
+            # 马上要加载一个新实例，先把超出预算的空闲实例释放掉
+            self._evict_over_budget()
+            return True, None
+        return False, None
+
+    def _create(self, component_class: Type, key: Tuple) -> PooledInstance:
+        """在占到的名额上新建实例，构造失败时让出名额"""
+        try:
+            return PooledInstance(key, component_class())
+        except BaseException:
+            with self._lock:
+                self._release_slot(key)
+            raise
+
+    def _checkout(self, component_class: Type, key: Tuple) -> PooledInstance:
+        """同步借出，实例都被借出时阻塞当前线程直到有实例归还"""
+        with self._released:
+            while True:
+                leased, entry = self._try_checkout(key)
+                if leased:
+                    break
+                self._released.wait()
+        return entry if entry is not None else self._create(component_class, key)
+
+    async def _checkout_async(self, component_class: Type, key: Tuple) -> PooledInstance:
+        """异步借出，实例都被借出时在事件循环里等待，不占用线程"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                leased, entry = self._try_checkout(key)
+                if not leased:
+                    waiter = loop.create_future()
+                    self._waiters.setdefault(key, []).append((loop, waiter))
+            if leased:
+                break
+            await waiter
+        return entry if entry is not None else self._create(component_class, key)
+
+    def _notify(self, key: Tuple) -> None:
+        """某个键有实例归还或者让出了名额，唤醒所有等待的借用方重新尝试，调用方需要持有锁"""
+        self._released.notify_all()
+        for loop, waiter in self._waiters.pop(key, []):
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def _release_slot(self, key: Tuple) -> None:
+        """一个实例被丢弃，让出它的名额，调用方需要持有锁"""
+        count = self._instances.get(key, 0) - 1
+        if count > 0:
+            self._instances[key] = count
+        else:
+            self._instances.pop(key, None)
+        self._notify(key)
+
+    def _checkin(self, entry: PooledInstance, discard: bool = False) -> None:
+        """归还实例"""
+        with self._lock:
+            self._in_use_memory -= entry.leased_memory
+            entry.leased_memory = 0
+            if discard:
+                self._release_slot(entry.key)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.setdefault(entry.key, []).append(entry)
+                self._notify(entry.key)
+            self._evict_expired()
+            evicted = self._evict_over_budget()
+        if evicted or discard:
+            gc.collect()
+
+    def _evict_expired(self) -> None:
+        """丢弃空闲太久的实例，调用方需要持有锁"""
+        if self.idle_ttl <= 0:
+            return
+        deadline = time.monotonic() - self.idle_ttl
+        for key in list(self._idle):
+            kept = [e for e in self._idle[key] if e.last_used >= deadline]
+            if len(kept) != len(self._idle[key]):
+                logger.info(f"组件实例空闲超时，已释放：{key[0].__name__}")
+                for _ in range(len(self._idle[key]) - len(kept)):
+                    self._release_slot(key)
+            if kept:
+                self._idle[key] = kept
+            else:
+                del self._idle[key]
+
+    def _evict_over_budget(self) -> int:
+        """超出内存预算时按最久未使用的顺序丢弃空闲实例，返回丢弃的数量，调用方需要持有锁"""
+        if self.max_memory_mb <= 0:
+            return 0
+        budget = self.max_memory_mb * 1024 * 1024
+        idle = sorted((e for entries in self._idle.values() for e in entries), key=lambda e: e.last_used)
+        total = self._in_use_memory + sum(e.memory for e in idle)
+
+        evicted = 0
+        for entry in idle:
+            if total <= budget:
+                break
+            self._idle[entry.key].remove(entry)
+            if not self._idle[entry.key]:
+                del self._idle[entry.key]
+            self._release_slot(entry.key)
+            total -= entry.memory
+            evicted += 1
+            logger.info(f"组件实例池超出内存预算，已释放：{entry.key[0].__name__}")
+        return evicted
+
+    def clear(self) -> None:
+        """清空所有空闲实例"""
+        with self._lock:
+            for key, entries in list(self._idle.items()):
+                for _ in entries:
+                    self._release_slot(key)
+            self._idle.clear()
+        gc.collect()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回池的统计信息，便于排查内存占用"""
+        with self._lock:
+            idle = [e for entries in self._idle.values() for e in entries]
+            return {
+                'idle_instances': len(idle),
+                'idle_memory_mb': round(sum(e.memory for e in idle) / 1024 / 1024, 1),
+                'in_use_memory_mb': round(self._in_use_memory / 1024 / 1024, 1),
+                'instances': sum(self._instances.values()),
+            }
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    """在等待方自己的事件循环里唤醒它，等待方已经被取消时什么也不做"""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# 全局唯一的组件实例池
+component_pool = ComponentPool()
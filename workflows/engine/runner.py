@@ -0,0 +1,285 @@
+"""
+工作流运行器
+拿着编译好的ExecutionPlan执行一次工作流：按连线表准备每个节点的输入、处理凭证、实例化组件并调度执行
+"""
+
+import asyncio
+import copy
+from contextlib import AsyncExitStack, nullcontext
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Union
+
+import networkx as nx
+
+from asgiref.sync import sync_to_async
+
+from components.base.admission import BackendOverloadedError, workflow_scope
+from components.base.streaming import token_stream
+
+from .exceptions import NodeExecutionError, WorkflowExecutionError
+from .llm_cache import llm_response_cache
+from .memo import node_result_cache
+from .offload import THREAD_MODES, ExecutionMode, offloader
+from .snapshots import node_fingerprints, run_snapshots
+from .trace import NodeProfile, RunTrace, payload_size, profiling_slot
+from .plan import ExecutionPlan, NodeSpec
+from .pool import component_pool
+from .scheduler import DAGScheduler
+
+
+class WorkflowRunner:
+    """执行一次工作流，每次请求创建一个新的运行器，执行计划本身可以被多次复用"""
+
+    def __init__(
+            self,
+            plan: ExecutionPlan,
+            on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+            profile: Union[bool, Iterable[str], None] = None,
+            snapshot: bool = False
+    ):
+        """
+        Args:
+            plan: 编译好的执行计划
+            on_event: 可选的事件回调，参数为(事件名, 事件数据)，用于流式返回执行进度：
+                      node_started / node_finished / node_failed / token
+                      提供了回调时，支持流式输出的LLM组件会通过token事件逐段转发生成的文本
+            profile: 要做性能剖析的节点，True表示全部节点，见engine/trace.py
+            snapshot: 是否保存这次执行的节点结果，供之后的rerun_from复用（见engine/snapshots.py）
+        """
+        self.plan = plan
+        self.on_event = on_event
+        self.snapshot = snapshot
+        # 每个节点的耗时、内存、数据量和缓存命中情况，执行结束后可以通过trace.to_dict()取出
+        self.trace = RunTrace(profile)
+
+    def _emit(self, event: str, node_id: str, **data) -> None:
+        """发出一个执行事件，没有回调时什么也不做"""
+        if self.on_event is not None:
+            self.on_event(event, {'node_id': node_id, **data})
+
+    async def run(self, input_data: Dict[str, Any], rerun_from: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行工作流
+
+        Args:
+            input_data: 工作流的输入参数，其中start键的值会作为start节点的结果
+            rerun_from: 从哪个节点重新执行。只重算这个节点和它的所有下游节点，
+                        其余节点使用之前保存的、指纹和现在一致的结果（见engine/snapshots.py），本次的结果也会保存
+
+        Returns:
+            Dict[str, Any]: 输出节点（没有出边的节点）ID到其结果的映射
+
+        Raises:
+            NodeExecutionError: 某个节点执行失败
+            WorkflowExecutionError: rerun_from指定的节点不存在
+        """
+        # 存储每个节点的执行结果
+        results = {}
+        graph = self.plan.graph
+
+        snapshot = self.snapshot or rerun_from is not None
+        fingerprints = node_fingerprints(self.plan, input_data) if snapshot else {}
+
+        if rerun_from is not None:
+            reused = await asyncio.to_thread(run_snapshots.load, self.plan.workflow_id, fingerprints)
+            recompute = self._rerun_nodes(rerun_from, reused)
+            for node_id, value in reused.items():
+                if node_id not in recompute and node_id in graph:
+                    results[node_id] = value
+                    self.trace.mark_reused(node_id, value)
+            graph = graph.subgraph(recompute)
+
+        # 添加工作流的输入到结果里面
+        if 'start' in input_data:
+            results['start'] = input_data['start']
+
+        scheduler = DAGScheduler(graph, max_concurrency=self.plan.max_concurrency)
+        try:
+            # 标记当前工作流，本地模型后端的准入控制据此在各个工作流之间轮流放行请求
+            with workflow_scope(self.plan.workflow_id):
+                await scheduler.run(self._run_node, results)
+        finally:
+            self.trace.finish()
+            if snapshot:
+                # 失败时也保存已经完成的节点，下次可以从失败的节点重新执行
+                computed = {
+                    node_id: (fingerprints[node_id], results[node_id])
+                    for node_id in graph.nodes if node_id in results and node_id in fingerprints
+                }
+                await asyncio.to_thread(run_snapshots.save, self.plan.workflow_id, computed)
+
+        # 收集所有输出节点的结果
+        return {
+            node_id: results[node_id]
+            for node_id in self.plan.output_nodes
+            if node_id in results
+        }
+
+    def _rerun_nodes(self, rerun_from: str, reused: Dict[str, Any]) -> Set[str]:
+        """
+        计算从rerun_from重新执行时需要重算的节点
+
+        rerun_from和它的所有下游节点一定要重算；此外，重算时要用到、或者作为输出要返回的节点如果在快照里没有结果
+        （从来没执行过、新加的节点、上次执行在它之前就失败了），也只能连同它的下游一起重算。
+        start这类没有节点定义的上游是工作流输入，结果直接来自input_data，不需要快照。
+        """
+        graph = self.plan.graph
+        if rerun_from not in graph:
+            raise WorkflowExecutionError(f'节点 {rerun_from} 不在工作流中', HTTPStatus.BAD_REQUEST)
+
+        recompute = {rerun_from} | nx.descendants(graph, rerun_from)
+        while True:
+            needed = {pred for node_id in recompute for pred in graph.predecessors(node_id)}
+            needed.update(self.plan.output_nodes)
+            missing = {
+                node_id for node_id in needed - recompute
+                if node_id not in reused and node_id in self.plan.nodes
+            }
+            if not missing:
+                return recompute
+            for node_id in missing:
+                recompute |= {node_id} | nx.descendants(graph, node_id)
+
+    def _prepare_inputs(self, node_id: str, results: Dict[str, Any]) -> Dict[str, Any]:
+        """根据编译好的连线表，把上游节点的输出连接到当前节点的输入"""
+        node_inputs = {}
+        for source_node, source_output, target_input in self.plan.nodes[node_id].wiring:
+            if source_node in results:
+                source_data = results[source_node]
+                if source_output in source_data:
+                    node_inputs[target_input] = source_data[source_output]
+        return node_inputs
+
+    async def _resolve_credential(self, node_id: str, node_params: Dict[str, Any]) -> None:
+        """处理凭证需求，把凭证ID替换为凭证内容"""
+        from core.models import Credential  # 延迟导入，引擎模块本身不依赖Django
+
+        if 'credential' in node_params:
+            credential_id = node_params.pop('credentialId', None)
+            try:
+                # Django的ORM不能直接在事件循环里调用，需要放到线程里执行
+                credential = await sync_to_async(Credential.objects.get)(id=credential_id)
+                # 添加凭证值到参数
+                node_params['credential'] = credential.data
+            except Credential.DoesNotExist:
+                raise NodeExecutionError(
+                    node_id,
+                    f'节点 {node_id} 需要的凭证ID{credential_id} 不存在',
+                    HTTPStatus.BAD_REQUEST
+                )
+
+    async def _execute_component(
+            self,
+            node_id: str,
+            spec: NodeSpec,
+            component_instance: Any,
+            node_inputs: Dict[str, Any],
+            node_params: Dict[str, Any],
+            profile: Optional[NodeProfile] = None
+    ) -> Any:
+        """调用组件的execute，按需开启token流和性能剖析，阻塞型的组件放到线程池里执行"""
+        async with AsyncExitStack() as stack:
+            if profile is not None:
+                # 剖析器是进程级的，要剖析的节点一个一个来
+                await stack.enter_async_context(profiling_slot())
+            if self.on_event is not None:
+                stack.enter_context(token_stream(lambda text: self._emit('token', node_id, delta=text)))
+            if spec.execution_mode in THREAD_MODES:
+                return await offloader.run_in_thread(
+                    spec.execution_mode, _execute_in_thread, component_instance, node_inputs, node_params, profile
+                )
+            if profile is not None:
+                stack.enter_context(profile.capture())
+            return await component_instance.execute(node_inputs, node_params)
+
+    async def _run_node(self, node_id: str, results: Dict[str, Any]) -> Any:
+        """执行单个节点，由调度器在该节点的所有上游节点完成后调用"""
+        spec = self.plan.nodes.get(node_id)
+        if spec is None:
+            return None
+
+        # 参数是计划里共享的，组件可能会修改它，所以每次执行都复制一份
+        node_params = copy.deepcopy(spec.params)
+
+        self._emit('node_started', node_id)
+        try:
+            with self.trace.node(node_id) as record:
+                node_inputs = self._prepare_inputs(node_id, results)
+                record['input_bytes'] = payload_size(node_inputs)
+
+                # 打开了结果缓存的节点，参数和输入都没变时直接复用上次的结果
+                # 缓存键用替换凭证之前的参数计算，凭证内容不会进入缓存键
+                cache_key = None
+                if spec.cache_results:
+                    cache_key = node_result_cache.make_key(spec.component_class, spec.params, node_inputs)
+                    if cache_key is not None:
+                        # 反序列化和读磁盘放到线程里，不阻塞其他节点和请求
+                        hit, result = await asyncio.to_thread(node_result_cache.get, cache_key)
+                        record['cache'] = 'hit' if hit else 'miss'
+                        if hit:
+                            record['output_bytes'] = payload_size(result)
+                            self._emit('node_finished', node_id, output=result, cached=True)
+                            return result
+
+                # LLM节点先查响应缓存，同样的模型参数和提示词之前生成过就不再调用模型
+                llm_entry = None
+                if spec.component_kind == 'llm' and llm_response_cache.enabled:
+                    llm_entry = llm_response_cache.make_entry(spec.component_class, spec.params, node_inputs)
+                    if llm_entry is not None:
+                        hit, result = await asyncio.to_thread(llm_response_cache.lookup, llm_entry)
+                        record['llm_cache'] = hit or 'miss'
+                        if hit:
+                            record['output_bytes'] = payload_size(result)
+                            # 流式执行的客户端也要拿到文本，整段响应作为一个token发出
+                            if isinstance(result, dict) and isinstance(result.get('text'), str):
+                                self._emit('token', node_id, delta=result['text'])
+                            self._emit('node_finished', node_id, output=result, cached=True)
+                            return result
+
+                await self._resolve_credential(node_id, node_params)
+
+                profile = NodeProfile() if self.trace.should_profile(node_id) else None
+                if spec.execution_mode == ExecutionMode.CPU:
+                    # 在进程池里执行，实例由子进程自己的实例池管理
+                    result = await offloader.run_in_process(spec.component_class, node_inputs, node_params)
+                else:
+                    # 声明了init_params的组件会从实例池借用已经加载好模型的实例
+                    async with component_pool.lease(spec.component_class, node_params) as component_instance:
+                        # 执行组件
+                        result = await self._execute_component(
+                            node_id, spec, component_instance, node_inputs, node_params, profile
+                        )
+
+                record['output_bytes'] = payload_size(result)
+                if profile is not None:
+                    record['profile'] = profile.report
+
+        except WorkflowExecutionError as e:
+            self._emit('node_failed', node_id, error=e.message)
+            raise
+
+        except Exception as e:
+            error = NodeExecutionError(
+                node_id,
+                f"节点 {node_id} 执行失败：{str(e)}",
+                # 后端过载是暂时的，返回503让客户端稍后重试
+                HTTPStatus.SERVICE_UNAVAILABLE if isinstance(e, BackendOverloadedError) else HTTPStatus.INTERNAL_SERVER_ERROR
+            )
+            self._emit('node_failed', node_id, error=error.message)
+            raise error
+
+        if cache_key is not None:
+            await asyncio.to_thread(node_result_cache.set, cache_key, result)
+        # 组件把调用失败包装成{"error": ...}返回，这样的结果不缓存
+        if llm_entry is not None and isinstance(result, dict) and 'error' not in result:
+            await asyncio.to_thread(llm_response_cache.store, llm_entry, result)
+
+        self._emit('node_finished', node_id, output=result)
+        return result
+
+
+def _execute_in_thread(component_instance: Any, inputs: Dict[str, Any], params: Dict[str, Any],
+                       profile: Optional[NodeProfile] = None) -> Any:
+    """在线程池的线程里用一个独立的事件循环跑完组件的execute，性能剖析也要在这个线程里开启才能采样到"""
+    with profile.capture() if profile is not None else nullcontext():
+        return asyncio.run(component_instance.execute(inputs, params))
@@ -0,0 +1,14 @@
+"""
+执行结果的序列化
+
+组件的输出里经常有向量存储、记忆对象这类无法JSON序列化的值，
+要保存到数据库（JSONField）或者通过接口返回时，用default=str把它们转换为描述文本
+"""
+
+import json
+from typing import Any
+
+
+def to_jsonable(value: Any) -> Any:
+    """把任意执行结果转换为可以JSON序列化的结构"""
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
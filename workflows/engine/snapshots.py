@@ -0,0 +1,222 @@
+"""
+工作流节点结果快照
+
+在画布里改了一个节点再执行时，原来的execute会把整个DAG重新算一遍，连改动点上游那些很慢的嵌入、建索引节点也一起重算。
+有了快照以后可以“从节点X重新执行”：只重算X和它的所有下游节点（nx.descendants），其余节点直接使用之前保存的结果。
+
+什么时候保存：
+    只有请求了快照的执行（execute、execute_stream带上snapshot参数，以及rerun_from本身）才保存，
+    普通的execute、后台worker不为此付出pickle和写磁盘的代价。
+
+按什么保存：
+    每个节点的结果按节点指纹（node_fingerprints）保存：指纹由节点自己的组件、参数、连线，
+    加上所有上游节点的指纹和用到的工作流输入一起算出来。
+    - 改了节点X之后，X和它下游节点的指纹都变了，上游节点的指纹不变，上次保存的结果照样能用
+    - 同一个工作流用不同的输入并发执行，各自的结果指纹不同，互相不会覆盖
+    - 指纹相同的结果内容一定相同，内存里没有的节点再去磁盘上找，不存在“内存里的旧快照挡住磁盘上的新快照”的问题
+
+两级存储：
+    - 内存：按工作流保存结果对象本身，向量存储这类不能pickle的结果也能复用，按最近使用保留max_workflows个工作流
+    - 磁盘：能pickle的结果另外写到snapshot_dir，进程重启后、或者由别的进程执行时也能复用
+    每个节点只保留最近的max_versions个指纹的结果。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def node_fingerprints(plan, input_data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    按拓扑顺序计算执行计划里每个节点的指纹
+
+    Args:
+        plan: 编译好的ExecutionPlan
+        input_data: 工作流输入，连线的上游不是节点时（例如start）用对应的输入值参与计算
+    """
+    # execute的inputs不一定是字典（默认值是空列表），这时没有可以按名称取的输入值
+    if not isinstance(input_data, dict):
+        input_data = {}
+    fingerprints: Dict[str, str] = {}
+    for node_id in plan.order:
+        spec = plan.nodes.get(node_id)
+        if spec is None:
+            continue
+        component_class = spec.component_class
+        upstream = []
+        for source_node, source_output, target_input in spec.wiring:
+            source = fingerprints.get(source_node)
+            if source is None:
+                source = json.dumps(input_data.get(source_node), sort_keys=True, ensure_ascii=False, default=str)
+            upstream.append((source_node, source_output, target_input, source))
+        payload = json.dumps({
+            'component': f"{component_class.__module__}.{component_class.__qualname__}",
+            'version': component_class.get_metadata().get('version'),
+            'params': spec.params,
+            'upstream': sorted(upstream),
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        fingerprints[node_id] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return fingerprints
+
+
+class RunSnapshotStore:
+    """进程内共享的节点结果快照"""
+
+    def __init__(self, max_workflows: int = 32, snapshot_dir: Optional[str] = None, max_versions: int = 4):
+        """
+        Args:
+            max_workflows: 内存里最多保留多少个工作流的快照
+            snapshot_dir: 磁盘快照目录，None或空字符串表示只保存在内存里
+            max_versions: 每个节点最多保留多少个不同指纹的结果
+        """
+        self.max_workflows = max_workflows
+        self.snapshot_dir = snapshot_dir or None
+        self.max_versions = max_versions
+        # 工作流ID -> 节点ID -> (指纹 -> 结果)，内层按保存顺序排列
+        self._snapshots: "OrderedDict[int, Dict[str, OrderedDict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_workflows: Optional[int] = None, snapshot_dir: Optional[str] = None) -> None:
+        """根据配置调整容量和磁盘目录，在应用启动时调用"""
+        if max_workflows is not None:
+            self.max_workflows = max_workflows
+        if snapshot_dir is not None:
+            self.snapshot_dir = str(snapshot_dir) or None
+
+    def save(self, workflow_id: int, results: Dict[str, Tuple[str, Any]]) -> None:
+        """
+        保存一次执行算出来的节点结果
+
+        Args:
+            results: 节点ID -> (节点指纹, 结果)
+
+        会对结果做pickle并写磁盘，执行引擎在线程里调用它，不要在事件循环里直接调用
+        """
+        if not results:
+            return
+        with self._lock:
+            snapshot = self._snapshots.setdefault(workflow_id, {})
+            for node_id, (fingerprint, value) in results.items():
+                versions = snapshot.setdefault(node_id, OrderedDict())
+                versions[fingerprint] = value
+                versions.move_to_end(fingerprint)
+                while len(versions) > self.max_versions:
+                    versions.popitem(last=False)
+            self._snapshots.move_to_end(workflow_id)
+            while len(self._snapshots) > self.max_workflows:
+                self._snapshots.popitem(last=False)
+
+        if self.snapshot_dir:
+            for node_id, (fingerprint, value) in results.items():
+                self._write_disk(workflow_id, node_id, fingerprint, value)
+
+    def load(self, workflow_id: int, fingerprints: Dict[str, str]) -> Dict[str, Any]:
+        """
+        读取指纹和当前一致的节点结果，内存里没有的再从磁盘读取
+
+        Args:
+            fingerprints: 节点ID -> 当前的节点指纹（node_fingerprints的结果）
+
+        Returns:
+            Dict[str, Any]: 节点ID到结果的映射，指纹对不上的节点不返回
+        """
+        found = {}
+        with self._lock:
+            snapshot = self._snapshots.get(workflow_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(workflow_id)
+                for node_id, fingerprint in fingerprints.items():
+                    versions = snapshot.get(node_id)
+                    if versions is not None and fingerprint in versions:
+                        found[node_id] = versions[fingerprint]
+
+        for node_id, fingerprint in fingerprints.items():
+            if node_id not in found:
+                hit, value = self._read_disk(workflow_id, node_id, fingerprint)
+                if hit:
+                    found[node_id] = value
+        return found
+
+    def clear(self, workflow_id: Optional[int] = None) -> None:
+        """删除指定工作流的快照，不传ID则清空全部"""
+        with self._lock:
+            if workflow_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(workflow_id, None)
+        if self.snapshot_dir:
+            path = self.snapshot_dir if workflow_id is None else self._workflow_dir(workflow_id)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _workflow_dir(self, workflow_id: int) -> str:
+        return os.path.join(self.snapshot_dir, str(workflow_id))
+
+    @staticmethod
+    def _node_prefix(node_id: str) -> str:
+        # 节点ID来自前端，可能包含不能作为文件名的字符，用它的哈希作为文件名
+        return hashlib.sha1(node_id.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, workflow_id: int, node_id: str, fingerprint: str) -> str:
+        return os.path.join(self._workflow_dir(workflow_id), f"{self._node_prefix(node_id)}-{fingerprint}.pkl")
+
+    def _write_disk(self, workflow_id: int, node_id: str, fingerprint: str, value: Any) -> None:
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"节点 {node_id} 的结果无法序列化，只保存在内存快照里：{e}")
+            return
+
+        directory = self._workflow_dir(workflow_id)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(workflow_id, node_id, fingerprint))
+        except OSError as e:
+            logger.warning(f"节点 {node_id} 的结果写入快照失败：{e}")
+            return
+        self._prune_disk(directory, self._node_prefix(node_id))
+
+    def _prune_disk(self, directory: str, prefix: str) -> None:
+        """同一个节点只保留最近写入的max_versions个结果文件"""
+        files = []
+        for filename in os.listdir(directory):
+            if filename.startswith(f"{prefix}-") and filename.endswith('.pkl'):
+                path = os.path.join(directory, filename)
+                try:
+                    files.append((os.stat(path).st_mtime_ns, path))
+                except OSError:
+                    continue
+        files.sort(reverse=True)
+        for _, path in files[self.max_versions:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _read_disk(self, workflow_id: int, node_id: str, fingerprint: str) -> Tuple[bool, Any]:
+        if not self.snapshot_dir:
+            return False, None
+        path = self._disk_path(workflow_id, node_id, fingerprint)
+        try:
+            with open(path, 'rb') as f:
+                return True, pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            logger.warning(f"快照文件 {path} 无法读取，忽略：{e}")
+            return False, None
+
+
+# 全局唯一的快照存储
+run_snapshots = RunSnapshotStore()
@@ -0,0 +1,68 @@
+"""
+工作流执行过程的流式输出（Server-Sent Events）
+
+原来的execute要等所有节点都执行完才返回一个Response，对话场景下用户要盯着转圈等完整个LLM生成。
+这里把执行过程变成一串SSE事件：
+    event: node_started       data: {"node_id": ...}
+    event: token              data: {"node_id": ..., "delta": "生成的一段文本"}
+    event: node_finished      data: {"node_id": ..., "output": {...}}
+    event: node_failed        data: {"node_id": ..., "error": "..."}
+    event: workflow_finished  data: {"status": "success", "output": {...}, "trace": {...}}
+    event: error              data: {"error": "..."}
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict
+
+from .exceptions import WorkflowExecutionError
+from .plan import ExecutionPlan
+from .runner import WorkflowRunner
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    按SSE协议格式化一个事件
+
+    组件输出里可能有向量存储、记忆对象之类无法JSON序列化的值，用default=str兜底，只把它们当作描述文本发出去
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def stream_workflow_events(plan: ExecutionPlan, input_data: Dict[str, Any], snapshot: bool = False) -> AsyncIterator[str]:
+    """
+    执行工作流并逐个产出SSE事件文本
+
+    工作流在单独的任务里执行，事件通过队列交给生成器；客户端断开连接时生成器被关闭，执行任务也会随之取消。
+    snapshot为True时保存节点结果，供之后的rerun_from复用
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, data: Dict[str, Any]) -> None:
+        # 组件可能在线程里生成token，用call_soon_threadsafe保证从任何线程回调都是安全的
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def run():
+        try:
+            runner = WorkflowRunner(plan, on_event=on_event, snapshot=snapshot)
+            outputs = await runner.run(input_data)
+            on_event('workflow_finished', {'status': 'success', 'output': outputs, 'trace': runner.trace.to_dict()})
+        except WorkflowExecutionError as e:
+            on_event('error', {'error': e.message, 'node_id': getattr(e, 'node_id', None)})
+        except Exception as e:
+            on_event('error', {'error': f'工作流执行错误：{str(e)}'})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)  # 结束标记
+
+    task = asyncio.ensure_future(run())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield format_sse(*item)
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,205 @@
+"""
+节点级别的执行追踪
+
+原来execute只返回最终的outputs，一个很慢的工作流到底慢在哪个节点完全看不出来。
+现在每次执行都会为每个节点记录：
+    - wall_ms：墙钟耗时
+    - cpu_ms：进程CPU时间的增量
+    - rss_delta_mb / peak_rss_delta_mb：常驻内存的变化量，以及进程内存峰值被抬高了多少
+    - input_bytes / output_bytes：输入输出数据的估算大小
+    - cache：结果缓存命中情况，hit / miss / snapshot（从快照复用，见rerun_from），没打开缓存时为None
+    - llm_cache：LLM响应缓存命中情况（只有llm类型的节点有），hit / semantic_hit / miss，见engine/llm_cache.py
+    - status：success / failed
+追踪结果通过接口的trace字段返回，异步运行（WorkflowRun）会一起保存。
+
+注意：没有依赖关系的节点是并发执行的，cpu_ms和内存的变化量统计的是整个进程，
+并发执行的节点会互相计入，需要精确数字时可以把工作流的max_concurrency设为1。
+
+性能剖析（可选）：
+    指定要剖析的节点后，这些节点会在cProfile（安装了pyinstrument时优先用它，对异步代码更友好）下执行，
+    剖析报告以文本形式放在该节点追踪记录的profile字段里。
+    在进程池里执行的节点（execution_mode为cpu）不支持剖析。
+    两种剖析器同一时间在一个进程里只能有一个在运行（Python 3.12起cProfile基于sys.monitoring，第二个会直接报错；
+    pyinstrument的采样器也是进程级的），所以要剖析的节点通过profiling_slot()排队，一个剖析完下一个才开始，
+    不剖析的节点照常并发执行。同时剖析多个节点时它们的wall_ms会包含排队的时间。
+"""
+
+import asyncio
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterable, Optional, Union
+
+from .pool import current_rss
+
+try:
+    import resource
+except ImportError:  # Windows上没有resource模块，不统计内存峰值
+    resource = None
+
+try:
+    from pyinstrument import Profiler as InstrumentProfiler
+except ImportError:  # pyinstrument是可选依赖，没有安装时用标准库的cProfile
+    InstrumentProfiler = None
+
+
+def _peak_rss() -> int:
+    """进程到目前为止的常驻内存峰值（字节），无法获取时返回0"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位是KB，macOS上是字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def payload_size(value: Any, _seen: Optional[set] = None, _depth: int = 0) -> int:
+    """
+    估算一个执行结果占用的字节数
+
+    递归累加容器里各个元素的大小，对象按它的属性计算（例如LangChain的Document）。
+    只是估算，用来比较节点之间的数据量，不追求精确；
+    对象的属性只往下看几层，避免把向量存储里引用的整个嵌入模型都遍历一遍。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, dict):
+        size += sum(payload_size(k, _seen, _depth) + payload_size(v, _seen, _depth) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(payload_size(item, _seen, _depth) for item in value)
+    elif _depth < 2 and hasattr(value, '__dict__') and not isinstance(value, type):
+        size += payload_size(vars(value), _seen, _depth + 1)
+    return size
+
+
+# 整个进程共用一把锁，不同请求、不同事件循环里的剖析也要排队
+_profiler_lock = threading.Lock()
+
+
+@asynccontextmanager
+async def profiling_slot():
+    """
+    等到没有其他剖析器在运行后再进入，with块里可以安全地开启NodeProfile.capture()
+
+    轮询而不是在线程里阻塞等待锁，等待期间任务被取消也不会留下一个迟早会拿到锁、却没人释放的线程
+    """
+    while not _profiler_lock.acquire(blocking=False):
+        await asyncio.sleep(0.01)
+    try:
+        yield
+    finally:
+        _profiler_lock.release()
+
+
+class NodeProfile:
+    """一个节点的性能剖析，with块结束后report里是文本格式的报告，需要在profiling_slot()里使用"""
+
+    def __init__(self):
+        self.report: Optional[str] = None
+
+    @contextmanager
+    def capture(self):
+        if InstrumentProfiler is not None:
+            profiler = InstrumentProfiler(async_mode='enabled')
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                self.report = profiler.output_text()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+                self.report = stream.getvalue()
+
+
+class RunTrace:
+    """一次工作流执行的追踪记录"""
+
+    def __init__(self, profile: Union[bool, str, Iterable[str], None] = None):
+        """
+        Args:
+            profile: 要剖析的节点，True表示剖析所有节点，节点ID列表表示只剖析这些节点（单个字符串当作一个节点ID），
+                     None/False表示不剖析
+        """
+        if profile is True:
+            self._profile_all, self._profile_nodes = True, set()
+        elif isinstance(profile, str):
+            # 直接set("node_1")会拆成单个字符
+            self._profile_all, self._profile_nodes = False, {profile}
+        else:
+            self._profile_all, self._profile_nodes = False, set(profile or ())
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+
+    def should_profile(self, node_id: str) -> bool:
+        return self._profile_all or node_id in self._profile_nodes
+
+    @contextmanager
+    def node(self, node_id: str):
+        """
+        追踪一个节点的执行，with块里可以往返回的记录里补充cache、input_bytes、output_bytes等字段
+
+        节点抛出异常时记录status为failed，异常照常抛出
+        """
+        record: Dict[str, Any] = {'cache': None, 'status': 'success'}
+        self.nodes[node_id] = record
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_start = current_rss()
+        peak_start = _peak_rss()
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'failed'
+            raise
+        finally:
+            record['wall_ms'] = round((time.perf_counter() - wall_start) * 1000, 2)
+            record['cpu_ms'] = round((time.process_time() - cpu_start) * 1000, 2)
+            record['rss_delta_mb'] = round((current_rss() - rss_start) / 1024 / 1024, 2)
+            record['peak_rss_delta_mb'] = round((_peak_rss() - peak_start) / 1024 / 1024, 2)
+
+    def mark_reused(self, node_id: str, value: Any) -> None:
+        """记录一个没有执行、直接从快照复用结果的节点"""
+        self.nodes[node_id] = {
+            'cache': 'snapshot',
+            'status': 'success',
+            'wall_ms': 0.0,
+            'cpu_ms': 0.0,
+            'output_bytes': payload_size(value),
+        }
+
+    def finish(self) -> None:
+        """工作流执行结束时调用，记录总耗时"""
+        self.finished_at = time.perf_counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可以JSON序列化、可以放进接口响应的结构"""
+        finished_at = self.finished_at if self.finished_at is not None else time.perf_counter()
+        llm_cache = [record.get('llm_cache') for record in self.nodes.values()]
+        return {
+            'total_ms': round((finished_at - self.started_at) * 1000, 2),
+            'llm_cache': {
+                'hits': llm_cache.count('hit') + llm_cache.count('semantic_hit'),
+                'semantic_hits': llm_cache.count('semantic_hit'),
+                'misses': llm_cache.count('miss'),
+            },
+            'nodes': self.nodes,
+        }
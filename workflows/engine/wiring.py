@@ -0,0 +1,38 @@
+"""
+节点输入连线索引
+
+原来的做法是对每个节点都把所有边扫一遍，找出指向它的边，复杂度是O(N·E)，
+节点上千的时候这部分开销会非常明显。这里先把所有边按目标节点分组建一次索引（O(E)），
+之后每个节点直接按ID取自己的连线表即可。
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# 一条连线：(上游节点ID, 上游输出键, 本节点输入键)
+Wire = Tuple[str, str, str]
+
+
+def edge_to_wire(edge) -> Wire:
+    """把一条边转换为连线三元组，没有指定输出/输入键时使用默认键"""
+    return (
+        edge.source_node,
+        edge.source_handle or 'output',  # 默认输出键，而不是值
+        edge.target_handle or 'input',   # 默认输入键，而不是值
+    )
+
+
+def build_wiring_index(edges: Iterable) -> Dict[str, List[Wire]]:
+    """
+    一次遍历所有边，建立 目标节点ID -> 连线列表 的索引
+
+    Args:
+        edges: 边对象的可迭代集合，需要有source_node、target_node、source_handle、target_handle属性
+
+    Returns:
+        Dict[str, List[Wire]]: 没有入边的节点不会出现在索引里，取用时请用index.get(node_id, [])
+    """
+    index = defaultdict(list)
+    for edge in edges:
+        index[edge.target_node].append(edge_to_wire(edge))
+    return dict(index)
@@ -0,0 +1,79 @@
+"""
+启动后台工作流worker
+
+用法：
+    python manage.py run_workflow_worker                 # 启动1个worker进程
+    python manage.py run_workflow_worker --processes 4   # 启动4个worker进程
+"""
+
+import multiprocessing
+import signal
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def worker_process(poll_interval: float) -> None:
+    """
+    worker子进程的入口
+
+    用spawn方式启动子进程时（macOS/Windows的默认方式），子进程里Django还没有初始化，需要先setup再导入模型。
+    收到SIGTERM时正常退出，顺便关掉cpu模式组件用的进程池，不留下孤儿进程
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from workflows.engine import offloader
+    from workflows.worker import RunWorker
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        RunWorker(poll_interval=poll_interval).serve_forever()
+    finally:
+        offloader.shutdown()
+
+
+class Command(BaseCommand):
+    help = '启动后台worker进程，执行通过submit接口提交的工作流运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='worker进程数量')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='队列为空时的轮询间隔（秒）')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        poll_interval = options['poll_interval']
+
+        if processes == 1:
+            self.stdout.write(self.style.SUCCESS('工作流worker已启动（1个进程），按Ctrl+C退出'))
+            worker_process(poll_interval)
+            return
+
+        # 数据库连接不能跨进程共享，fork之前先关掉父进程的连接，子进程会各自重新建立
+        connections.close_all()
+
+        # 不能用守护进程：守护进程不允许再创建子进程，cpu模式的组件要用进程池。
+        # 所以父进程退出前要自己停掉所有worker
+        workers = [
+            multiprocessing.Process(target=worker_process, args=(poll_interval,))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f'工作流worker已启动（{processes}个进程），按Ctrl+C退出'))
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stdout.write('正在停止worker...')
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflow',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=4, help_text='同时执行的最大节点数，0表示不限制'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0003_workflowrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflowrun',
+            name='trace',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
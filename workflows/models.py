@@ -14,6 +14,8 @@ class Workflow(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     # auto_now=True：每次保存对象（包括创建和更新）时都会自动更新为当前时间（即“最后更新时间”），适合记录“更新时间”。
     updated_at = models.DateTimeField(auto_now=True)
+    # 执行工作流时最多同时运行的节点数，没有依赖关系的分支会并发执行，0表示不限制
+    max_concurrency = models.PositiveIntegerField(default=4, help_text="同时执行的最大节点数，0表示不限制")
 
     def __str__(self):
         return self.name
@@ -52,3 +54,42 @@ class Edge(models.Model):
     def __str__(self):
         return f"{self.source_node} -> {self.target_node}"
 
+
+class RunStatus(models.TextChoices):
+    """工作流运行状态"""
+    QUEUED = "queued", '排队中'
+    RUNNING = "running", '运行中'
+    SUCCEEDED = "succeeded", '成功'
+    FAILED = "failed", '失败'
+    CANCELLED = "cancelled", '已取消'
+
+
+# 一次异步提交的工作流运行，既是后台worker的任务队列（以数据库作为broker），也保存运行结果供前端查询
+class WorkflowRun(models.Model):
+    """工作流运行记录：提交后立即返回ID，由后台worker执行，客户端轮询或订阅状态和输出"""
+    workflow = models.ForeignKey(Workflow, on_delete = models.CASCADE, related_name = 'runs')
+    status = models.CharField(max_length = 20, choices = RunStatus.choices, default = RunStatus.QUEUED)
+    inputs = models.JSONField(default = dict, blank = True) # 提交时的工作流输入参数
+    outputs = models.JSONField(null = True, blank = True) # 输出节点的结果（无法JSON序列化的值会被转换为字符串）
+    error = models.TextField(blank = True) # 失败时的错误信息
+    trace = models.JSONField(null = True, blank = True) # 每个节点的耗时、内存、数据量和缓存命中情况，见workflows/engine/trace.py
+    worker = models.CharField(max_length = 255, blank = True) # 领取该任务的worker标识，便于排查
+    heartbeat_at = models.DateTimeField(null = True, blank = True) # 执行中的worker定期刷新，太久没刷新说明worker已经挂了，任务会被重新放回队列
+    attempts = models.PositiveIntegerField(default = 0) # 被worker领取的次数，超过上限的任务不再重试
+    created_at = models.DateTimeField(auto_now_add = True)
+    started_at = models.DateTimeField(null = True, blank = True)
+    finished_at = models.DateTimeField(null = True, blank = True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields = ['status', 'created_at']), # worker按状态+创建时间领取最早排队的任务
+        ]
+
+    @property
+    def is_finished(self) -> bool:
+        """是否已经结束（成功、失败或取消）"""
+        return self.status in (RunStatus.SUCCEEDED, RunStatus.FAILED, RunStatus.CANCELLED)
+
+    def __str__(self):
+        return f"{self.workflow} #{self.pk} ({self.status})"
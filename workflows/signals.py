@@ -0,0 +1,29 @@
+"""
+工作流相关的信号处理
+
+节点和边不是Workflow的字段，修改它们不会自动刷新Workflow.updated_at，
+但执行计划缓存正是以updated_at作为版本号的，所以在这里手动刷新，并让本进程里的缓存立即失效。
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from components.models import Node
+from workflows.models import Workflow, Edge
+from workflows.engine import plan_cache, run_snapshots
+
+
+@receiver([post_save, post_delete], sender=Node)
+@receiver([post_save, post_delete], sender=Edge)
+def touch_workflow(sender, instance, **kwargs):
+    """节点或边发生变化时，刷新所属工作流的版本号"""
+    # 用update而不是save，避免再次触发Workflow的保存信号
+    Workflow.objects.filter(pk=instance.workflow_id).update(updated_at=timezone.now())
+    plan_cache.invalidate(instance.workflow_id)
+
+
+@receiver(post_delete, sender=Workflow)
+def drop_workflow_plan(sender, instance, **kwargs):
+    """工作流被删除时，丢弃它的执行计划和节点结果快照"""
+    plan_cache.invalidate(instance.pk)
+    run_snapshots.clear(instance.pk)
@@ -1,3 +1,797 @@
-from django.test import TestCase
+"""
+工作流执行引擎的测试
 
-# Create your tests here.
+调度器、执行计划缓存这些逻辑不依赖任何模型，用几个简单的测试组件就能覆盖；
+接口测试走完整的请求流程（视图 -> 执行计划 -> 运行器 -> 调度器），确保主接口真正执行了工作流。
+"""
+
+import asyncio
+import tempfile
+import threading
+from datetime import timedelta
+from typing import Any, Dict
+from unittest import mock
+
+import networkx as nx
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from components.base.component import BaseComponent
+from components.base.llm_clients import llm_client_pool
+from components.models import Component, Node
+from workflows.engine import DAGScheduler
+from workflows.engine.llm_cache import LLMResponseCache, llm_response_cache
+from workflows.engine.memo import NodeResultCache
+from workflows.engine.offload import Offloader, _init_process
+from workflows.engine.plan import PlanCache
+from workflows.engine.pool import ComponentPool, component_pool
+from workflows.engine.snapshots import run_snapshots
+from workflows.engine.trace import NodeProfile, profiling_slot
+from workflows.models import Edge, RunStatus, Workflow, WorkflowRun
+from workflows.worker import RunWorker
+
+
+class EchoComponent(BaseComponent):
+    """测试用组件：把输入的text加上参数里的后缀原样输出"""
+
+    @classmethod
+    def get_metadata(cls) -> Dict:
+        return {
+            "name": "TestEcho",
+            "type": "utility",
+            "category": "utilities",
+            "description": "测试用组件",
+        }
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"text": f"{inputs.get('text', '')}{params.get('suffix', '')}"}
+
+
+class DAGSchedulerTests(SimpleTestCase):
+    """DAG调度器：并发上限、依赖顺序和失败时取消其他节点"""
+
+    def test_respects_max_concurrency(self):
+        graph = nx.DiGraph()
+        graph.add_nodes_from(f"n{i}" for i in range(6))
+        running, peak = 0, 0
+
+        async def run_node(node_id, results):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"node": node_id}
+
+        results = asyncio.run(DAGScheduler(graph, max_concurrency=2).run(run_node))
+        self.assertEqual(peak, 2)
+        self.assertEqual(set(results), {f"n{i}" for i in range(6)})
+
+    def test_unlimited_concurrency_runs_independent_nodes_together(self):
+        graph = nx.DiGraph()
+        graph.add_nodes_from(["a", "b", "c"])
+        running, peak = 0, 0
+
+        async def run_node(node_id, results):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {}
+
+        asyncio.run(DAGScheduler(graph, max_concurrency=0).run(run_node))
+        self.assertEqual(peak, 3)
+
+    def test_runs_successor_after_all_predecessors(self):
+        graph = nx.DiGraph([("a", "c"), ("b", "c")])
+        seen = {}
+
+        async def run_node(node_id, results):
+            seen[node_id] = set(results)
+            return {"node": node_id}
+
+        asyncio.run(DAGScheduler(graph).run(run_node))
+        self.assertEqual(seen["c"], {"a", "b"})
+
+    def test_failure_cancels_running_nodes(self):
+        graph = nx.DiGraph([("slow", "after_slow")])
+        graph.add_node("failing")
+        cancelled, started = [], []
+
+        async def run_node(node_id, results):
+            started.append(node_id)
+            if node_id == "failing":
+                raise RuntimeError("boom")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(node_id)
+                raise
+            return {}
+
+        with self.assertRaisesMessage(RuntimeError, "boom"):
+            asyncio.run(DAGScheduler(graph).run(run_node))
+        self.assertEqual(cancelled, ["slow"])
+        self.assertNotIn("after_slow", started)
+
+
+class PooledComponent(EchoComponent):
+    """测试用组件：声明了init_params，会进入实例池"""
+
+    created = 0
+
+    def __init__(self):
+        type(self).created += 1
+
+    @classmethod
+    def get_metadata(cls) -> Dict:
+        return {**super().get_metadata(), "init_params": ["model"]}
+
+
+class ComponentPoolTests(SimpleTestCase):
+    """组件实例池：复用、每个键的实例数上限和等待归还"""
+
+    def setUp(self):
+        PooledComponent.created = 0
+
+    def test_reuses_instance_for_same_init_params(self):
+        pool = ComponentPool()
+        with pool.lease(PooledComponent, {"model": "a"}) as first:
+            pass
+        with pool.lease(PooledComponent, {"model": "a"}) as second:
+            pass
+        self.assertIs(first, second)
+        with pool.lease(PooledComponent, {"model": "b"}) as third:
+            pass
+        self.assertIsNot(third, first)
+        self.assertEqual(PooledComponent.created, 2)
+
+    def test_components_without_init_params_are_not_pooled(self):
+        pool = ComponentPool()
+        with pool.lease(EchoComponent, {}) as first:
+            pass
+        with pool.lease(EchoComponent, {}) as second:
+            pass
+        self.assertIsNot(first, second)
+
+    def test_concurrent_leases_wait_for_the_capped_instance(self):
+        pool = ComponentPool(max_instances_per_key=1)
+        holding, peak = 0, 0
+
+        async def use():
+            nonlocal holding, peak
+            async with pool.lease(PooledComponent, {"model": "a"}) as instance:
+                holding += 1
+                peak = max(peak, holding)
+                await asyncio.sleep(0.01)
+                holding -= 1
+                return instance
+
+        async def main():
+            return await asyncio.gather(*(use() for _ in range(5)))
+
+        instances = asyncio.run(main())
+        self.assertEqual(PooledComponent.created, 1)
+        self.assertEqual(peak, 1)
+        self.assertEqual(len({id(instance) for instance in instances}), 1)
+
+    def test_cap_allows_several_instances(self):
+        pool = ComponentPool(max_instances_per_key=2)
+
+        async def use():
+            async with pool.lease(PooledComponent, {"model": "a"}):
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(use() for _ in range(6)))
+
+        asyncio.run(main())
+        self.assertEqual(PooledComponent.created, 2)
+        self.assertEqual(pool.stats()["instances"], 2)
+
+    def test_failed_execution_releases_slot(self):
+        pool = ComponentPool(max_instances_per_key=1)
+        with self.assertRaises(RuntimeError):
+            with pool.lease(PooledComponent, {"model": "a"}):
+                raise RuntimeError("boom")
+        self.assertEqual(pool.stats()["instances"], 0)
+
+        async def main():
+            # 丢弃的实例让出了名额，这里不会一直等下去
+            async with pool.lease(PooledComponent, {"model": "a"}) as instance:
+                return instance
+
+        self.assertIsNotNone(asyncio.run(asyncio.wait_for(main(), timeout=1)))
+        self.assertEqual(PooledComponent.created, 2)
+
+
+class OffloaderTests(SimpleTestCase):
+    """守护进程里不能创建进程池，cpu模式的组件退回到计算线程池执行"""
+
+    def test_daemon_process_falls_back_to_threads(self):
+        offloader = Offloader(compute_threads=1)
+        self.addCleanup(offloader.shutdown)
+        with mock.patch('workflows.engine.offload.multiprocessing.current_process') as current_process:
+            current_process.return_value.daemon = True
+            result = asyncio.run(offloader.run_in_process(EchoComponent, {"text": "a"}, {"suffix": "b"}))
+        self.assertEqual(result, {"text": "ab"})
+        self.assertIsNone(offloader._process_pool)
+
+    @override_settings(COMPONENT_POOL_MAX_INSTANCES_PER_KEY=3)
+    def test_child_initializer_applies_settings(self):
+        # spawn出来的子进程不执行apps.ready()，由_init_process按配置设置进程内单例
+        with mock.patch.object(component_pool, 'max_instances_per_key', 99):
+            _init_process()
+            self.assertEqual(component_pool.max_instances_per_key, 3)
+
+
+class ProfilingSlotTests(SimpleTestCase):
+    """剖析器是进程级的，并发的剖析要排队"""
+
+    def test_concurrent_profiles_are_serialized(self):
+        active, overlaps = [], []
+
+        async def profiled():
+            profile = NodeProfile()
+            async with profiling_slot():
+                with profile.capture():
+                    active.append(1)
+                    overlaps.append(len(active))
+                    await asyncio.sleep(0.02)
+                    active.pop()
+            return profile.report
+
+        async def main():
+            return await asyncio.gather(*(profiled() for _ in range(3)))
+
+        reports = asyncio.run(main())
+        self.assertEqual(overlaps, [1, 1, 1])
+        self.assertTrue(all(reports))
+
+
+class NodeResultCacheKeyTests(SimpleTestCase):
+    """节点结果缓存键：内容不同的值不能得到同一个键"""
+
+    def _key(self, value):
+        return NodeResultCache.make_key(EchoComponent, {}, {"value": value})
+
+    def test_large_arrays_with_same_repr_get_different_keys(self):
+        first = np.zeros(5000)
+        second = first.copy()
+        second[2500] = 1
+        self.assertEqual(repr(first), repr(second))
+        self.assertNotEqual(self._key(first), self._key(second))
+        self.assertEqual(self._key(first), self._key(first.copy()))
+
+    def test_unsupported_objects_are_not_cached(self):
+        class Opaque:
+            def __repr__(self):
+                return "Opaque(...)"
+
+        self.assertIsNone(self._key(Opaque()))
+        self.assertIsNone(self._key(object()))
+
+    def test_hit_and_miss_counts(self):
+        cache = NodeResultCache(max_memory_mb=1)
+        key = self._key("text")
+        self.assertEqual(cache.get(key), (False, None))
+        cache.set(key, {"text": "cached"})
+        self.assertEqual(cache.get(key), (True, {"text": "cached"}))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_disk_total_is_kept_without_rescanning(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = NodeResultCache(max_memory_mb=0, cache_dir=tmp)
+            cache.set("a" * 64, "x" * 1000)
+            with mock.patch("workflows.engine.memo.os.walk") as walk:
+                cache.set("a" * 64, "y" * 10)  # 覆盖同一个键
+                cache.set("b" * 64, "z" * 100)
+                walk.assert_not_called()
+            self.assertEqual(cache._disk_bytes, cache._scan_disk_bytes())
+
+            cache.invalidate("b" * 64)
+            self.assertEqual(cache._disk_bytes, cache._scan_disk_bytes())
+
+
+class NodeResultCacheEndpointTests(TestCase):
+    """打开了cache_results的节点，查询和写入缓存都不在事件循环的线程里进行"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestEcho", type="utility", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="memo")
+        Node.objects.create(
+            workflow=self.workflow, node_id="only", component_type="TestEcho", data={"suffix": "!"}, cache_results=True
+        )
+
+    def test_cache_io_runs_off_the_event_loop(self):
+        threads = []
+
+        def record(result):
+            def call(*args):
+                threads.append(threading.current_thread())
+                return result
+            return call
+
+        with mock.patch("workflows.engine.runner.node_result_cache") as cache:
+            cache.make_key.return_value = "key"
+            cache.get.side_effect = record((False, None))
+            cache.set.side_effect = record(True)
+            response = APIClient().post(f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}}, format="json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(thread.name != "workflow-engine-loop" for thread in threads))
+
+
+class SampledLLM(EchoComponent):
+    """测试用LLM组件：声明了默认温度0.7"""
+
+    @classmethod
+    def get_metadata(cls) -> Dict:
+        return {
+            **super().get_metadata(),
+            "type": "llm",
+            "params": [{"name": "temperature", "type": "number", "default": 0.7}],
+        }
+
+
+class LLMResponseCacheTests(SimpleTestCase):
+    """默认只缓存确定性的生成，语义查找的范围有上限，提示词只嵌入一次"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = LLMResponseCache(path=f"{self.tmp.name}/llm.sqlite3", semantic_model="test-model")
+        self.embedded = []
+        self.cache._embed = self._embed
+
+    def _embed(self, prompt):
+        self.embedded.append(prompt)
+        vector = np.zeros(4, dtype=np.float32)
+        vector[len(prompt) % 4] = 1.0
+        return vector
+
+    def test_sampled_generation_is_not_cached(self):
+        self.assertIsNone(self.cache.make_entry(SampledLLM, {}, {"prompt": "hi"}))
+        self.assertIsNone(self.cache.make_entry(SampledLLM, {"temperature": 0.3}, {"prompt": "hi"}))
+        self.assertIsNotNone(self.cache.make_entry(SampledLLM, {"temperature": 0}, {"prompt": "hi"}))
+        # 没有temperature参数的组件按确定性生成处理
+        self.assertIsNotNone(self.cache.make_entry(EchoComponent, {}, {"prompt": "hi"}))
+
+        self.cache.cache_sampled = True
+        self.assertIsNotNone(self.cache.make_entry(SampledLLM, {}, {"prompt": "hi"}))
+
+    def test_prompt_is_embedded_once_per_miss(self):
+        entry = self.cache.make_entry(SampledLLM, {"temperature": 0}, {"prompt": "what is it"})
+        self.assertEqual(self.cache.lookup(entry), (None, None))
+        self.cache.store(entry, {"text": "answer"})
+        self.assertEqual(self.embedded, ["what is it"])
+
+        again = self.cache.make_entry(SampledLLM, {"temperature": 0}, {"prompt": "what  is it "})
+        self.assertEqual(self.cache.lookup(again), ("hit", {"text": "answer"}))
+
+    def test_semantic_scan_is_bounded(self):
+        self.cache.semantic_candidates = 1
+        old = self.cache.make_entry(EchoComponent, {}, {"prompt": "abcd"})  # 向量落在第0维
+        self.cache.store(old, {"text": "old"})
+        recent = self.cache.make_entry(EchoComponent, {}, {"prompt": "abc"})  # 向量落在第3维
+        self.cache.store(recent, {"text": "recent"})
+
+        near_old = self.cache.make_entry(EchoComponent, {}, {"prompt": "wxyz"})
+        self.assertEqual(self.cache.lookup(near_old), (None, None))
+
+        self.cache.semantic_candidates = 10
+        self.assertEqual(self.cache.lookup(near_old), ("semantic_hit", {"text": "old"}))
+
+
+class PlanCacheTests(TestCase):
+    """执行计划缓存：同一版本复用，节点或边变化后重新编译"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestEcho", type="utility", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="echo")
+        Node.objects.create(workflow=self.workflow, node_id="first", component_type="TestEcho")
+        self.cache = PlanCache()
+
+    def _plan(self):
+        # 和接口里一样，每次都从数据库重新取工作流，拿到最新的updated_at
+        return self.cache.get(Workflow.objects.get(pk=self.workflow.pk))
+
+    def test_reuses_plan_for_same_version(self):
+        self.assertIs(self._plan(), self._plan())
+
+    def test_node_save_invalidates_plan(self):
+        plan = self._plan()
+        Node.objects.create(workflow=self.workflow, node_id="second", component_type="TestEcho")
+        new_plan = self._plan()
+        self.assertIsNot(new_plan, plan)
+        self.assertIn("second", new_plan.nodes)
+
+    def test_node_update_invalidates_plan(self):
+        self._plan()
+        node = Node.objects.get(workflow=self.workflow, node_id="first")
+        node.data = {"suffix": "!"}
+        node.save()
+        self.assertEqual(self._plan().nodes["first"].params, {"suffix": "!"})
+
+    def test_edge_save_and_delete_invalidate_plan(self):
+        Node.objects.create(workflow=self.workflow, node_id="second", component_type="TestEcho")
+        self._plan()
+        edge = Edge.objects.create(
+            workflow=self.workflow, source_node="first", target_node="second", source_handle="text", target_handle="text"
+        )
+        plan = self._plan()
+        self.assertEqual(plan.nodes["second"].wiring, [("first", "text", "text")])
+        self.assertEqual(plan.output_nodes, ["second"])
+
+        edge.delete()
+        self.assertEqual(self._plan().nodes["second"].wiring, [])
+
+    def test_stale_version_recompiles_without_signal(self):
+        # 其他进程修改了工作流：本进程的缓存没有收到失效通知，只能靠版本号发现
+        plan = self._plan()
+        workflow = Workflow.objects.get(pk=self.workflow.pk)
+        workflow.save()
+        self.assertIsNot(self.cache.get(workflow), plan)
+
+
+class ExecuteEndpointTests(TestCase):
+    """execute接口走完整的执行流程并返回输出节点的结果"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestEcho", type="utility", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="echo")
+        Node.objects.create(workflow=self.workflow, node_id="first", component_type="TestEcho", data={"suffix": "-1"})
+        Node.objects.create(workflow=self.workflow, node_id="second", component_type="TestEcho", data={"suffix": "-2"})
+        Edge.objects.create(
+            workflow=self.workflow, source_node="first", target_node="second", source_handle="text", target_handle="text"
+        )
+        self.client = APIClient()
+
+    def test_execute_runs_workflow(self):
+        response = self.client.post(
+            f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}, "trace": True}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["output"], {"second": {"text": "-1-2"}})
+        self.assertIn("trace", response.json())
+
+    def test_profile_accepts_a_single_node_id(self):
+        response = self.client.post(
+            f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}, "profile": "second"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        nodes = response.json()["trace"]["nodes"]
+        self.assertIn("profile", nodes["second"])
+        self.assertNotIn("profile", nodes["first"])
+
+    def test_execute_reports_compile_errors(self):
+        Node.objects.create(workflow=self.workflow, node_id="missing", component_type="NoSuchComponent")
+        response = self.client.post(f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}}, format="json")
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn("error", response.json())
+
+    def test_execute_reports_duplicate_component_names(self):
+        Component.objects.create(
+            name="TestEcho", type="llm", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        response = self.client.post(f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}}, format="json")
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn("TestEcho", response.json()["error"])
+
+
+class StatefulComponent(EchoComponent):
+    """测试用组件：像很多真实组件一样先把这次调用的输入存到实例上，等一会儿再读出来，text为bad时失败"""
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        self.text = inputs.get("text", "")
+        if self.text == "bad":
+            raise ValueError("bad input")
+        await asyncio.sleep(0.01)
+        return {"text": f"{self.text}{params.get('suffix', '')}"}
+
+
+class CountingLLM(EchoComponent):
+    """测试用LLM组件：没有temperature参数（确定性生成），记录被调用的次数"""
+
+    calls = 0
+
+    @classmethod
+    def get_metadata(cls) -> Dict:
+        return {**super().get_metadata(), "name": "TestLLM", "type": "llm"}
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        type(self).calls += 1
+        return {"text": f"answer to {inputs['prompt']}"}
+
+
+class ExecuteBatchEndpointTests(TestCase):
+    """execute_batch接口：每条输入互不影响，LLM节点命中响应缓存时不再调用组件"""
+
+    def setUp(self):
+        for name, component_class in (("TestStateful", StatefulComponent), ("TestLLM", CountingLLM)):
+            Component.objects.create(
+                name=name, type="utility", category="utilities",
+                class_path=f"{component_class.__module__}.{component_class.__name__}"
+            )
+        self.workflow = Workflow.objects.create(name="batch")
+
+    def _post(self, batch_inputs):
+        response = APIClient().post(
+            f"/api/workflows/{self.workflow.pk}/execute_batch/", {"inputs": batch_inputs}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_items_do_not_share_an_instance(self):
+        Node.objects.create(workflow=self.workflow, node_id="first", component_type="TestStateful", data={"suffix": "-1"})
+        Node.objects.create(workflow=self.workflow, node_id="second", component_type="TestStateful", data={"suffix": "-2"})
+        Edge.objects.create(
+            workflow=self.workflow, source_node="start", target_node="first", source_handle="text", target_handle="text"
+        )
+        Edge.objects.create(
+            workflow=self.workflow, source_node="first", target_node="second", source_handle="text", target_handle="text"
+        )
+
+        results = self._post([{"start": {"text": text}} for text in ("a", "bad", "c")])
+
+        self.assertEqual(results[0], {"status": "success", "output": {"second": {"text": "a-1-2"}}})
+        self.assertEqual(results[1]["status"], "failed")
+        self.assertIn("bad input", results[1]["error"])
+        self.assertEqual(results[2], {"status": "success", "output": {"second": {"text": "c-1-2"}}})
+
+    def test_llm_cache_hits_skip_the_component(self):
+        Node.objects.create(workflow=self.workflow, node_id="llm", component_type="TestLLM")
+        Edge.objects.create(
+            workflow=self.workflow, source_node="start", target_node="llm", source_handle="prompt", target_handle="prompt"
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        CountingLLM.calls = 0
+
+        with mock.patch.object(llm_response_cache, "path", f"{tmp.name}/llm.sqlite3"):
+            first = self._post([{"start": {"prompt": "p1"}}, {"start": {"prompt": "p2"}}])
+            second = self._post([{"start": {"prompt": "p2"}}, {"start": {"prompt": " p1 "}}])
+
+        self.assertEqual(CountingLLM.calls, 2)
+        self.assertEqual([item["output"]["llm"]["text"] for item in first], ["answer to p1", "answer to p2"])
+        self.assertEqual([item["output"]["llm"]["text"] for item in second], ["answer to p2", "answer to p1"])
+
+
+class GateComponent(EchoComponent):
+    """测试用组件：gate打开之前一直不结束，用来确认事件在工作流执行完之前就已经发出"""
+
+    gate = threading.Event()
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        opened = await asyncio.to_thread(self.gate.wait, 5)
+        return {"text": "opened" if opened else "timeout"}
+
+
+class ExecuteStreamEndpointTests(TestCase):
+    """WSGI下execute_stream边执行边推送事件，而不是执行完才一起发出"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestGate", type="utility", category="utilities",
+            class_path=f"{GateComponent.__module__}.{GateComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="gate")
+        Node.objects.create(workflow=self.workflow, node_id="slow", component_type="TestGate")
+        GateComponent.gate.clear()
+
+    def test_first_event_arrives_before_run_finishes(self):
+        response = APIClient().post(
+            f"/api/workflows/{self.workflow.pk}/execute_stream/", {"inputs": {}}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        chunks = iter(response.streaming_content)
+        try:
+            self.assertIn(b"event: node_started", next(chunks))
+            GateComponent.gate.set()
+            rest = b"".join(chunks)
+        finally:
+            response.close()
+        self.assertIn(b"event: workflow_finished", rest)
+        self.assertIn(b'"opened"', rest)
+
+
+class FakeLLMClient:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class PooledClientComponent(EchoComponent):
+    """测试用组件：从LLM客户端池取客户端，记下每次拿到的对象"""
+
+    clients = []
+
+    async def execute(self, inputs: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        self.clients.append(llm_client_pool.get(FakeLLMClient, base_url="http://llm.test", model="fake"))
+        return {"text": "ok"}
+
+
+class LLMClientReuseTests(TestCase):
+    """不同的execute请求在同一个事件循环上执行，拿到的是同一个池化的客户端"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestClient", type="utility", category="utilities",
+            class_path=f"{PooledClientComponent.__module__}.{PooledClientComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="client")
+        Node.objects.create(workflow=self.workflow, node_id="llm", component_type="TestClient")
+        PooledClientComponent.clients.clear()
+        llm_client_pool.clear()
+
+    def test_same_client_across_requests(self):
+        client = APIClient()
+        for _ in range(2):
+            response = client.post(f"/api/workflows/{self.workflow.pk}/execute/", {"inputs": {}}, format="json")
+            self.assertEqual(response.status_code, 200, response.content)
+        first, second = PooledClientComponent.clients
+        self.assertIs(first, second)
+
+
+class SnapshotRerunTests(TestCase):
+    """只有请求了快照才保存结果，rerun_from只复用指纹没有变化的上游节点"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestEcho", type="utility", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="echo")
+        Node.objects.create(workflow=self.workflow, node_id="first", component_type="TestEcho", data={"suffix": "-1"})
+        self.second = Node.objects.create(
+            workflow=self.workflow, node_id="second", component_type="TestEcho", data={"suffix": "-2"}
+        )
+        Edge.objects.create(
+            workflow=self.workflow, source_node="first", target_node="second", source_handle="text", target_handle="text"
+        )
+        self.client = APIClient()
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self._saved_dir = run_snapshots.snapshot_dir
+        run_snapshots.snapshot_dir = self.snapshot_dir.name
+        run_snapshots.clear()
+
+    def tearDown(self):
+        run_snapshots.clear()
+        run_snapshots.snapshot_dir = self._saved_dir
+        self.snapshot_dir.cleanup()
+
+    def _post(self, action, data):
+        response = self.client.post(f"/api/workflows/{self.workflow.pk}/{action}/", data, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _rerun_second(self):
+        return self._post("rerun_from", {"node_id": "second", "inputs": {}, "trace": True})
+
+    def test_execute_does_not_snapshot_by_default(self):
+        self._post("execute", {"inputs": {}})
+        body = self._rerun_second()
+        self.assertNotEqual(body["trace"]["nodes"]["first"].get("cache"), "snapshot")
+
+    def test_rerun_reuses_unchanged_upstream_after_edit(self):
+        self._post("execute", {"inputs": {}, "snapshot": True})
+        self.second.data = {"suffix": "-3"}
+        self.second.save()
+
+        body = self._rerun_second()
+        self.assertEqual(body["output"], {"second": {"text": "-1-3"}})
+        self.assertEqual(body["trace"]["nodes"]["first"]["cache"], "snapshot")
+
+    def test_edited_upstream_is_not_reused(self):
+        self._post("execute", {"inputs": {}, "snapshot": True})
+        Node.objects.filter(workflow=self.workflow, node_id="first").update(data={"suffix": "-9"})
+        Workflow.objects.filter(pk=self.workflow.pk).update(updated_at=timezone.now())
+
+        body = self._rerun_second()
+        self.assertEqual(body["output"], {"second": {"text": "-9-2"}})
+        self.assertNotEqual(body["trace"]["nodes"]["first"].get("cache"), "snapshot")
+
+    def _feed_from_start(self):
+        """start是工作流输入而不是节点：start→first→second，另外start→second"""
+        Edge.objects.create(
+            workflow=self.workflow, source_node="start", target_node="first", source_handle="text", target_handle="text"
+        )
+        Edge.objects.create(
+            workflow=self.workflow, source_node="start", target_node="second",
+            source_handle="text", target_handle="question"
+        )
+
+    def test_rerun_does_not_recompute_nodes_fed_by_start(self):
+        self._feed_from_start()
+        inputs = {"start": {"text": "q"}}
+        self._post("execute", {"inputs": inputs, "snapshot": True})
+
+        body = self._post("rerun_from", {"node_id": "second", "inputs": inputs, "trace": True})
+        self.assertEqual(body["output"], {"second": {"text": "q-1-2"}})
+        self.assertEqual(body["trace"]["nodes"]["first"]["cache"], "snapshot")
+
+    def test_snapshot_accepts_list_inputs(self):
+        self._feed_from_start()
+        body = self._post("execute", {"inputs": [], "snapshot": True})
+        self.assertEqual(body["output"], {"second": {"text": "-1-2"}})
+
+    def test_load_falls_back_to_disk(self):
+        self._post("execute", {"inputs": {}, "snapshot": True})
+        run_snapshots._snapshots.clear()  # 模拟进程重启，只剩磁盘上的快照
+
+        body = self._rerun_second()
+        self.assertEqual(body["trace"]["nodes"]["first"]["cache"], "snapshot")
+
+
+class RunWorkerTests(TestCase):
+    """后台worker：领取任务、执行、心跳超时后重新排队"""
+
+    def setUp(self):
+        Component.objects.create(
+            name="TestEcho", type="utility", category="utilities",
+            class_path=f"{EchoComponent.__module__}.{EchoComponent.__name__}"
+        )
+        self.workflow = Workflow.objects.create(name="echo")
+        Node.objects.create(workflow=self.workflow, node_id="only", component_type="TestEcho", data={"suffix": "!"})
+        self.worker = RunWorker(worker_id="test-worker", heartbeat_interval=3600, stale_after=60, max_attempts=2)
+
+    def _stale(self, run, attempts=1):
+        long_ago = timezone.now() - timedelta(minutes=10)
+        WorkflowRun.objects.filter(pk=run.pk).update(
+            status=RunStatus.RUNNING, worker="dead-worker", started_at=long_ago, heartbeat_at=long_ago, attempts=attempts
+        )
+
+    def test_claims_and_executes_run(self):
+        run = WorkflowRun.objects.create(workflow=self.workflow)
+        self.assertTrue(self.worker.run_once())
+        run.refresh_from_db()
+        self.assertEqual(run.status, RunStatus.SUCCEEDED)
+        self.assertEqual(run.outputs, {"only": {"text": "!"}})
+        self.assertEqual(run.attempts, 1)
+        self.assertFalse(self.worker.run_once())
+
+    def test_requeues_run_without_heartbeat(self):
+        run = WorkflowRun.objects.create(workflow=self.workflow)
+        self._stale(run)
+        claimed = self.worker.claim_next()
+        self.assertEqual(claimed.pk, run.pk)
+        self.assertEqual(claimed.worker, "test-worker")
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_keeps_run_with_recent_heartbeat(self):
+        run = WorkflowRun.objects.create(workflow=self.workflow)
+        WorkflowRun.objects.filter(pk=run.pk).update(
+            status=RunStatus.RUNNING, worker="busy-worker", started_at=timezone.now(), heartbeat_at=timezone.now()
+        )
+        self.assertIsNone(self.worker.claim_next())
+
+    def test_fails_run_after_max_attempts(self):
+        run = WorkflowRun.objects.create(workflow=self.workflow)
+        self._stale(run, attempts=2)
+        self.assertIsNone(self.worker.claim_next())
+        run.refresh_from_db()
+        self.assertEqual(run.status, RunStatus.FAILED)
+        self.assertTrue(run.error)
+
+    def test_discards_result_of_reassigned_run(self):
+        run = WorkflowRun.objects.create(workflow=self.workflow)
+        claimed = self.worker.claim_next()
+        # 执行期间被判定超时，转给了别的worker
+        WorkflowRun.objects.filter(pk=run.pk).update(worker="other-worker")
+        self.worker.execute(claimed)
+        run.refresh_from_db()
+        self.assertEqual(run.status, RunStatus.RUNNING)
+        self.assertEqual(run.worker, "other-worker")
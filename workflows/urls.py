@@ -1,6 +1,6 @@
 from django.urls import path, include  # 导入Django的path和include，用于URL路由配置
 from rest_framework.routers import DefaultRouter  # 导入DRF的DefaultRouter，用于自动生成RESTful路由
-from .api.views import WorkflowViewSet, NodeViewSet, EdgeViewSet  # 导入视图集
+from .api.views import WorkflowViewSet, NodeViewSet, EdgeViewSet, WorkflowRunViewSet  # 导入视图集
 
 # 创建一个默认的路由器对象
 router = DefaultRouter()
@@ -10,6 +10,8 @@ router.register(r'workflows', WorkflowViewSet)
 router.register(r'nodes', NodeViewSet)
 # 注册边的视图集，自动生成edges相关的RESTful接口
 router.register(r'edges', EdgeViewSet)
+# 注册工作流运行记录的视图集，用于查询异步提交的运行状态和结果
+router.register(r'runs', WorkflowRunViewSet)
 
 # 定义URL模式列表，将router自动生成的所有接口挂载到api/路径下
 urlpatterns = [
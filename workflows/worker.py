@@ -0,0 +1,197 @@
+"""
+后台工作流worker
+从数据库里领取排队中的WorkflowRun并执行，把请求的响应时间和工作流的执行时间分开
+
+为什么要这样做：
+    PDFLoader -> RecursiveTextSplitter -> FAISSVectorStore 这样的长时间入库工作流，同步执行时会占住Django的请求线程好几分钟，
+    还经常被反向代理的超时掐断。改成提交后立即返回运行ID，由独立的worker进程慢慢执行，客户端轮询或订阅结果即可。
+
+任务领取：
+    直接用数据库当作消息队列（broker），不引入额外的服务。
+    领取时用“带条件的UPDATE”（只有状态还是queued才改成running），更新成功的那个worker才算领到了任务，
+    多个worker进程同时抢同一条记录也只有一个能成功，而且SQLite也支持这种写法。
+
+崩溃恢复：
+    执行中的worker在后台线程里每隔heartbeat_interval秒刷新一次heartbeat_at。
+    worker被杀掉、机器重启之后，它领取的任务会一直停在running，所以每次领取之前先检查：
+    超过stale_after秒没有心跳的running任务放回队列重新执行；已经领取了max_attempts次的任务
+    （多半是任务本身会把worker拖垮，例如内存溢出）直接标记为失败，不再重试。
+    写回结果时也带上“还是我在执行”的条件，被判定超时、已经转给别的worker的任务不会被覆盖。
+
+启动方式：
+    python manage.py run_workflow_worker --processes 4
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from workflows.models import WorkflowRun, RunStatus
+from workflows.engine import plan_cache, WorkflowRunner, WorkflowExecutionError, to_jsonable
+
+logger = logging.getLogger(__name__)
+
+
+class RunWorker:
+    """单个worker进程里的任务循环"""
+
+    def __init__(
+            self,
+            worker_id: Optional[str] = None,
+            poll_interval: float = 1.0,
+            heartbeat_interval: Optional[float] = None,
+            stale_after: Optional[float] = None,
+            max_attempts: Optional[int] = None
+    ):
+        """
+        Args:
+            worker_id: worker标识，默认为“主机名:进程号”
+            poll_interval: 队列为空时两次轮询之间的等待秒数
+            heartbeat_interval: 执行任务时刷新心跳的间隔秒数，默认为WORKFLOW_RUN_HEARTBEAT_INTERVAL
+            stale_after: 多少秒没有心跳的running任务会被放回队列，默认为WORKFLOW_RUN_STALE_AFTER
+            max_attempts: 一个任务最多被领取的次数，默认为WORKFLOW_RUN_MAX_ATTEMPTS
+        """
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else getattr(settings, 'WORKFLOW_RUN_HEARTBEAT_INTERVAL', 15)
+        self.stale_after = stale_after if stale_after is not None else getattr(settings, 'WORKFLOW_RUN_STALE_AFTER', 120)
+        self.max_attempts = max_attempts if max_attempts is not None else getattr(settings, 'WORKFLOW_RUN_MAX_ATTEMPTS', 3)
+        # 所有任务共用一个事件循环，而不是每个任务asyncio.run一次：
+        # LLM客户端池（components/base/llm_clients.py）按事件循环保存客户端，循环不变才能在任务之间复用keep-alive连接
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _run_async(self, coro):
+        """在worker自己的事件循环里执行协程"""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coro)
+
+    def reclaim_stale(self) -> int:
+        """把心跳超时的running任务放回队列（领取次数用完的标记为失败），返回处理的任务数"""
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=self.stale_after)
+        # 还没有心跳字段时领取的任务只有started_at可以参考
+        stale = WorkflowRun.objects.filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+            status=RunStatus.RUNNING
+        )
+        failed = stale.filter(attempts__gte=self.max_attempts).update(
+            status=RunStatus.FAILED,
+            error=f'执行任务的worker失去响应，已重试{self.max_attempts}次',
+            finished_at=now
+        )
+        requeued = stale.filter(attempts__lt=self.max_attempts).update(
+            status=RunStatus.QUEUED,
+            worker='',
+            started_at=None,
+            heartbeat_at=None
+        )
+        if failed or requeued:
+            logger.warning(f"[{self.worker_id}] 发现心跳超时的任务：{requeued}个重新排队，{failed}个标记为失败")
+        return failed + requeued
+
+    def claim_next(self) -> Optional[WorkflowRun]:
+        """领取最早排队的一个任务，没有任务时返回None"""
+        self.reclaim_stale()
+        while True:
+            candidate = (
+                WorkflowRun.objects
+                .filter(status=RunStatus.QUEUED)
+                .order_by('created_at')
+                .values_list('pk', flat=True)
+                .first()
+            )
+            if candidate is None:
+                return None
+
+            now = timezone.now()
+            claimed = WorkflowRun.objects.filter(pk=candidate, status=RunStatus.QUEUED).update(
+                status=RunStatus.RUNNING,
+                worker=self.worker_id,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=F('attempts') + 1
+            )
+            if claimed:
+                return WorkflowRun.objects.select_related('workflow').get(pk=candidate)
+            # 被别的worker抢先领走了，继续找下一个
+
+    def _owned(self, run: WorkflowRun):
+        """这个worker还持有的运行记录（没有因为心跳超时转给别的worker）"""
+        return WorkflowRun.objects.filter(pk=run.pk, status=RunStatus.RUNNING, worker=self.worker_id)
+
+    def _heartbeat(self, run: WorkflowRun, stop: threading.Event) -> None:
+        """后台线程：执行期间定期刷新心跳，直到stop被设置"""
+        try:
+            while not stop.wait(self.heartbeat_interval):
+                self._owned(run).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception(f"[{self.worker_id}] 刷新工作流运行 #{run.pk} 的心跳失败")
+        finally:
+            connection.close()  # 每个线程有自己的数据库连接，线程结束前关掉
+
+    def execute(self, run: WorkflowRun) -> None:
+        """执行一个已领取的任务，并把结果写回数据库"""
+        logger.info(f"[{self.worker_id}] 开始执行工作流运行 #{run.pk}")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(run, stop), daemon=True)
+        heartbeat.start()
+        try:
+            self._execute(run)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def _execute(self, run: WorkflowRun) -> None:
+        runner = None
+        try:
+            plan = plan_cache.get(run.workflow)
+            runner = WorkflowRunner(plan)
+            outputs = self._run_async(runner.run(run.inputs or {}))
+            run.status = RunStatus.SUCCEEDED
+            run.outputs = to_jsonable(outputs)
+        except WorkflowExecutionError as e:
+            run.status = RunStatus.FAILED
+            run.error = e.message
+        except Exception as e:
+            logger.exception(f"[{self.worker_id}] 工作流运行 #{run.pk} 出现未预期的错误")
+            run.status = RunStatus.FAILED
+            run.error = f"工作流执行错误：{str(e)}"
+
+        if runner is not None:
+            run.trace = to_jsonable(runner.trace.to_dict())
+        run.finished_at = timezone.now()
+        updated = self._owned(run).update(
+            status=run.status, outputs=run.outputs, error=run.error, trace=run.trace, finished_at=run.finished_at
+        )
+        if not updated:
+            logger.warning(f"[{self.worker_id}] 工作流运行 #{run.pk} 已因心跳超时被重新分配，丢弃本次结果")
+            return
+        logger.info(f"[{self.worker_id}] 工作流运行 #{run.pk} 结束：{run.status}")
+
+    def run_once(self) -> bool:
+        """领取并执行一个任务，返回是否真的执行了任务"""
+        close_old_connections()  # 长期运行的进程里要主动清理失效的数据库连接
+        run = self.claim_next()
+        if run is None:
+            return False
+        self.execute(run)
+        return True
+
+    def serve_forever(self) -> None:
+        """不断领取任务执行，队列为空时等待poll_interval秒"""
+        logger.info(f"[{self.worker_id}] worker已启动")
+        while True:
+            if not self.run_once():
+                time.sleep(self.poll_interval)
+